@@ -4,15 +4,7 @@ set -euo pipefail
 # refresh SEC ticker map once
 poetry run edgar sec sync-tickers
 
-PEERS="MSFT,GOOG,AMZN,META"
-
-for T in AAPL MSFT GOOG AMZN META NVDA TSLA; do
-  echo "== $T =="
-  rm -rf "artifacts/$T" || true
-  if ! poetry run edgar build-pack "$T" --peers="$PEERS"; then
-    echo "!! FAILED for $T (skipping)"
-    continue
-  fi
-done
+# one pass: every company is ingested and normalized once, packs render in parallel
+poetry run edgar build-universe AAPL,MSFT,GOOG,AMZN,META,NVDA,TSLA --peer-groups config/peer_groups.yml
 
 echo "Done."
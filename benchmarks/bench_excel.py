@@ -0,0 +1,58 @@
+"""Regular vs write-only rendering of model.xlsx on a synthetic long, wide history.
+
+    python benchmarks/bench_excel.py [--years 40] [--lines 200] [--peers 50]
+
+Each mode runs in a fresh subprocess so ru_maxrss reflects only that path.
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+CHILD = r"""
+import json, resource, sys, time
+import numpy as np
+import pandas as pd
+from edgar_model_builder.excel_builder import build_model_xlsx
+
+mode, out, years, lines, peers = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5])
+rng = np.random.default_rng(0)
+
+def history(periods, freq):
+    ends = pd.date_range("1985-03-31", periods=periods, freq=freq)
+    df = pd.DataFrame(rng.normal(0, 1e9, (periods, lines)), index=ends, columns=[f"line_{i:03d}" for i in range(lines)])
+    return df.mask(rng.random(df.shape) < 0.2)
+
+hist_fy, hist_q = history(years, "YE"), history(years * 4, "QE")
+comps = pd.DataFrame({
+    "ticker": [f"T{i:04d}" for i in range(peers)],
+    **{c: rng.normal(0, 1e10, peers) for c in ["price", "market_cap", "ev", "ttm_revenue", "ttm_ebitda", "EV/Revenue", "EV/EBITDA"]},
+})
+t0 = time.perf_counter()
+build_model_xlsx(out, "T0000", hist_fy, hist_q, comps, {"WACC": 0.10, "Terminal_Growth": 0.03}, write_only=mode == "write_only")
+elapsed = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({"mode": mode, "seconds": round(elapsed, 2), "peak_rss_mb": round(rss_mb, 1)}))
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--years", type=int, default=40)
+    ap.add_argument("--lines", type=int, default=200)
+    ap.add_argument("--peers", type=int, default=50)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("regular", "write_only"):
+            out = Path(tmp) / f"{mode}.xlsx"
+            res = subprocess.run(
+                [sys.executable, "-c", CHILD, mode, str(out), str(args.years), str(args.lines), str(args.peers)],
+                check=True, capture_output=True, text=True,
+            )
+            print(res.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
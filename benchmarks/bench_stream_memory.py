@@ -0,0 +1,80 @@
+"""Peak RSS of the in-memory vs streaming companyfacts parse paths.
+
+    python benchmarks/bench_stream_memory.py --size-mb 100 [--load]
+
+Each mode runs in a fresh subprocess so ru_maxrss reflects only that path. Without --load the
+rows are flattened and converted but not written; with --load they go to a scratch SQLite DB.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import write_companyfacts  # noqa: E402
+
+CHILD = r"""
+import json, resource, sys, time
+from edgar_model_builder import ingest
+
+mode, path, load = sys.argv[1], sys.argv[2], sys.argv[3] == "1"
+t0 = time.perf_counter()
+if mode == "json":
+    with open(path, "rb") as fp:
+        rows = ingest.flatten_companyfacts(json.load(fp))
+        n = _run(rows)
+else:
+    with open(path, "rb") as fp:
+        n = _run(ingest.iter_companyfacts(fp))
+elapsed = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({"mode": mode, "rows": n, "seconds": round(elapsed, 2), "peak_rss_mb": round(rss_mb, 1)}))
+"""
+
+RUN_CONVERT = r"""
+def _run(rows):
+    n = 0
+    for row in rows:
+        try:
+            ingest._fact_values(1, row)
+        except (ValueError, TypeError):
+            pass
+        n += 1
+    return n
+"""
+
+RUN_LOAD = r"""
+from edgar_model_builder.db import init_db
+init_db()
+def _run(rows):
+    return ingest.load_facts(1, rows).total
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=float, default=100)
+    ap.add_argument("--load", action="store_true", help="also bulk-load rows into a scratch SQLite DB")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "companyfacts.json"
+        t0 = time.perf_counter()
+        write_companyfacts(path, args.size_mb)
+        print(f"generated {path.stat().st_size / 1e6:.1f} MB in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        for mode in ("json", "stream"):
+            env = dict(os.environ)
+            env.setdefault("SEC_USER_AGENT", "edgar-bench bench@example.com")
+            env["DATABASE_URL"] = f"sqlite:///{Path(tmp) / (mode + '.db')}"
+            code = (RUN_LOAD if args.load else RUN_CONVERT) + CHILD
+            out = subprocess.run([sys.executable, "-c", code, mode, str(path), "1" if args.load else "0"],
+                                 env=env, check=True, capture_output=True, text=True)
+            print(out.stdout.strip())
+
+
+if __name__ == "__main__":
+    main()
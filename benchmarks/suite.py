@@ -0,0 +1,221 @@
+"""Stage-by-stage pipeline benchmark on synthetic EDGAR data, with a JSON baseline.
+
+    python benchmarks/suite.py [--tags 200 --units 1 --years 20 --restatements 1.0] [--repeat 5]
+                               [--database-url postgresql+psycopg://...] [--out results.json]
+                               [--baseline benchmarks/baseline.json] [--save-baseline] [--threshold 0.25]
+
+Runs fully offline: payloads come from synthetic.py, quotes from a deterministic fake provider, and
+the database defaults to a scratch SQLite file. Each repeat starts from empty tables and an empty
+chart cache. Timing repeats run without tracing; one extra traced pass records each stage's peak
+Python allocation. A fixed calibration workload is timed alongside, and baseline timings are scaled
+by the ratio of the two calibration times, so a baseline recorded on a faster or slower machine
+still gates. With --baseline, the exit status is 1 if any stage's median time exceeds the scaled
+baseline by more than --threshold (0.25 means 25% slower) and by more than --min-delta seconds.
+A baseline recorded with different scale parameters is not compared.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic import make_companyfacts  # noqa: E402
+
+STAGES = ["parse", "ingest_companyfacts", "build_statement_history", "compute_kpis",
+          "build_comps_table", "build_model_xlsx", "build_pack_pdf"]
+PEERS = ["PEER1", "PEER2", "PEER3", "PEER4"]
+
+
+class FakeProvider:
+    # stable per-ticker quotes so comps and the PDF are identical from run to run
+    def quote(self, ticker, fundamentals=True):
+        from edgar_model_builder.marketdata import Quote
+        h = zlib.crc32(ticker.encode())
+        return Quote(price=10.0 + h % 500, market_cap=1e9 * (1 + h % 2000), currency="USD")
+
+    def quotes(self, tickers, fundamentals=True):
+        return {t: self.quote(t, fundamentals) for t in tickers}
+
+
+def _percentiles(xs: list[float]) -> dict:
+    xs = sorted(xs)
+    pick = lambda q: xs[min(len(xs) - 1, round(q * (len(xs) - 1)))]  # noqa: E731
+    return {"p50": statistics.median(xs), "p95": pick(0.95), "max": xs[-1]}
+
+
+def calibrate(repeat: int = 5) -> float:
+    # median time of a fixed mix of the work the stages do (JSON, SQLite inserts, zlib, Python loops),
+    # as a machine speed reference for comparing against a baseline recorded elsewhere
+    rng = random.Random(0)
+    rows = [(i, f"tag{i % 200}", rng.random() * 1e9) for i in range(20_000)]
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        blob = json.dumps(rows).encode()
+        json.loads(zlib.decompress(zlib.compress(blob, 6)))
+        with sqlite3.connect(":memory:") as conn:
+            conn.execute("create table t (id integer primary key, tag text, val real)")
+            conn.executemany("insert into t values (?, ?, ?)", rows)
+            conn.execute("select tag, sum(val) from t group by tag").fetchall()
+        sorted(rows, key=lambda r: (r[1], -r[2]))
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def run_once(payload: bytes, tmp: Path, run: int, trace: bool = False) -> tuple[dict, dict, dict]:
+    from edgar_model_builder import models  # noqa: F401
+    from edgar_model_builder.comps import build_comps_table
+    from edgar_model_builder.charts import pack_charts, render_charts
+    from edgar_model_builder.db import Base, get_engine
+    from edgar_model_builder.excel_builder import build_model_xlsx
+    from edgar_model_builder.ingest import ingest_companyfacts, iter_companyfacts
+    from edgar_model_builder.mappings import load_mapping
+    from edgar_model_builder.normalize import build_statement_history, compute_kpis
+    from edgar_model_builder.pdf_builder import build_pack_pdf
+    from edgar_model_builder.settings import settings
+
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    settings.chart_cache_dir = str(tmp / f"charts-{run}")
+    mapping = load_mapping(Path(__file__).resolve().parents[1] / "config" / "mappings" / "us_gaap.yml")
+    doc = json.loads(payload)
+    seconds, rows, peaks = {}, {}, {}
+
+    def stage(name, fn):
+        if trace:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        out = fn()
+        seconds[name] = time.perf_counter() - t0
+        if trace:
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return out
+
+    rows["parse"] = stage("parse", lambda: sum(1 for _ in iter_companyfacts(io.BytesIO(payload))))
+    rows["ingest_companyfacts"] = stage("ingest_companyfacts", lambda: ingest_companyfacts(1, doc).total)
+    hist_fy, hist_q = stage("build_statement_history", lambda: (build_statement_history(1, mapping, "FY"),
+                                                                build_statement_history(1, mapping, "Q")))
+    rows["build_statement_history"] = len(hist_fy) + len(hist_q)
+    kpis = stage("compute_kpis", lambda: compute_kpis(hist_fy, hist_q))
+    kpis_by_ticker = {"BENCH": kpis, **{p: {"ttm_revenue": 1e9, "ttm_ebitda": 2e8} for p in PEERS}}
+    comps = stage("build_comps_table", lambda: build_comps_table("BENCH", PEERS, kpis_by_ticker, FakeProvider()))
+    assumptions = {"WACC": 0.10, "Terminal_Growth": 0.03}
+    stage("build_model_xlsx", lambda: build_model_xlsx(tmp / "model.xlsx", "BENCH", hist_fy, hist_q, comps, assumptions))
+    stage("build_pack_pdf", lambda: build_pack_pdf(
+        tmp / "pack.pdf", "BENCH", kpis, comps,
+        render_charts(pack_charts("BENCH", hist_fy, comps, assumptions), workers=1)))
+    return seconds, rows, peaks
+
+
+def run_suite(params: dict, repeat: int) -> dict:
+    payload = json.dumps(make_companyfacts(cik=1, tags=params["tags"], units=params["units"], years=params["years"],
+                                           restatements=params["restatements"], seed=0)).encode()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        timings = {s: [] for s in STAGES}
+        rows = {}
+        for i in range(repeat):
+            seconds, rows, _ = run_once(payload, tmp, i)
+            for s, v in seconds.items():
+                timings[s].append(v)
+        _, _, peaks = run_once(payload, tmp, repeat, trace=True)
+    stages = {}
+    for s in STAGES:
+        stat = {k: round(v, 6) for k, v in _percentiles(timings[s]).items()}
+        stat["peak_alloc_mb"] = round(peaks[s] / 1e6, 2)
+        if s in rows:
+            stat["rows"] = rows[s]
+            stat["rows_per_sec"] = round(rows[s] / stat["p50"], 1) if stat["p50"] else None
+        stages[s] = stat
+    return {"params": params, "repeat": repeat, "payload_mb": round(len(payload) / 1e6, 2),
+            "calibration": round(calibrate(), 6), "stages": stages}
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float = 0.005) -> list[str]:
+    # stages whose median got slower than baseline * (1 + threshold), after scaling the baseline to
+    # this machine by the calibration ratio; min_delta (seconds) keeps sub-millisecond stages from
+    # failing on timer noise
+    if results["params"] != baseline.get("params"):
+        return []
+    scale = 1.0
+    if results.get("calibration") and baseline.get("calibration"):
+        scale = results["calibration"] / baseline["calibration"]
+    out = []
+    for s, stat in results["stages"].items():
+        base = baseline.get("stages", {}).get(s)
+        if not base or base["p50"] <= 0:
+            continue
+        expected = base["p50"] * scale
+        if stat["p50"] > expected * (1 + threshold) and stat["p50"] - expected > min_delta:
+            out.append(f"{s}: p50 {stat['p50'] * 1000:.1f}ms vs baseline {expected * 1000:.1f}ms "
+                       f"(+{(stat['p50'] / expected - 1) * 100:.0f}%, machine scale {scale:.2f})")
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tags", type=int, default=200)
+    ap.add_argument("--units", type=int, default=1)
+    ap.add_argument("--years", type=int, default=20)
+    ap.add_argument("--restatements", type=float, default=1.0)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--database-url", default="")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--baseline", default=str(Path(__file__).resolve().parent / "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", 0.25)),
+                    help="allowed slowdown over the scaled baseline (default 0.25, or $BENCH_THRESHOLD)")
+    ap.add_argument("--min-delta", type=float, default=0.005, help="ignore slowdowns smaller than this many seconds")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="edgar-bench-", ignore_cleanup_errors=True) as scratch:
+        return _run(args, Path(scratch))
+
+
+def _run(args, scratch: Path) -> int:
+    # settings are read at import time, so pin everything offline before touching the package
+    os.environ.setdefault("SEC_USER_AGENT", "edgar-bench bench@example.com")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{scratch / 'bench.db'}"
+    os.environ["ARTIFACTS_DIR"] = str(scratch / "artifacts")
+    os.environ["CACHE_BACKENDS"] = "none"
+    os.environ["MARKETDATA_PROVIDER"] = "none"
+    os.environ["FACT_SNAPSHOTS"] = "0"
+
+    params = {"tags": args.tags, "units": args.units, "years": args.years, "restatements": args.restatements,
+              "dialect": os.environ["DATABASE_URL"].split(":", 1)[0].split("+", 1)[0]}
+    results = run_suite(params, args.repeat)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    baseline = Path(args.baseline)
+    if args.save_baseline:
+        baseline.write_text(text, encoding="utf-8")
+        print(f"saved baseline to {baseline}", file=sys.stderr)
+        return 0
+    if baseline.exists():
+        base = json.loads(baseline.read_text(encoding="utf-8"))
+        if base.get("params") != params:
+            print(f"baseline {baseline} was recorded with {base.get('params')}; not comparing", file=sys.stderr)
+            return 0
+        regressions = compare(results, base, args.threshold, args.min_delta)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    print(f"no baseline at {baseline}; not comparing", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
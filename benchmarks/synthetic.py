@@ -0,0 +1,81 @@
+"""Synthetic SEC companyfacts payloads for offline benchmarks."""
+import json
+import random
+from datetime import date
+from pathlib import Path
+
+MAPPED_TAGS = [
+    "Revenues", "CostOfRevenue", "SellingGeneralAndAdministrativeExpense",
+    "DepreciationDepletionAndAmortization", "OperatingIncomeLoss", "NetIncomeLoss",
+    "InterestExpense", "IncomeTaxExpenseBenefit", "PaymentsToAcquirePropertyPlantAndEquipment",
+    "CashAndCashEquivalentsAtCarryingValue", "DebtCurrent", "LongTermDebtNoncurrent",
+]
+
+
+def _accn(cik: int, year: int, seq: int) -> str:
+    return f"{cik:010d}-{year % 100:02d}-{seq:06d}"
+
+
+def tag_rows(cik: int, years: int, restatements: float, rng: random.Random, start_year: int = 1990):
+    rows = []
+    seq = 0
+    for y in range(start_year, start_year + years):
+        for q in range(1, 5):
+            end = date(y, q * 3, 30 if q in (2, 3) else 31)
+            annual = q == 4
+            form = "10-K" if annual else "10-Q"
+            start = date(y, 1, 1) if annual else date(y, q * 3 - 2, 1)
+            filed = date(y + 1, 2, 15) if annual else date(y, q * 3 + 1 if q < 4 else 12, 10)
+            seq += 1
+            val = round(rng.uniform(1e6, 1e11), 0)
+            row = {"start": start.isoformat(), "end": end.isoformat(), "val": val,
+                   "accn": _accn(cik, y, seq), "fy": y, "fp": "FY" if annual else f"Q{q}",
+                   "form": form, "filed": filed.isoformat()}
+            if annual:
+                row["frame"] = f"CY{y}"
+            rows.append(row)
+            # later filings restate the same period (comparatives / amendments)
+            for k in range(int(restatements) + (rng.random() < restatements % 1)):
+                seq += 1
+                rows.append({**row, "accn": _accn(cik, y + k + 1, seq), "val": round(val * rng.uniform(0.98, 1.02), 0),
+                             "fy": y + k + 1, "filed": date(y + k + 2, 2, 15).isoformat()})
+    return rows
+
+
+def make_companyfacts(cik: int = 1, tags: int = 200, units: int = 1, years: int = 20,
+                      restatements: float = 1.0, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    names = MAPPED_TAGS + [f"SyntheticTag{i:05d}" for i in range(max(0, tags - len(MAPPED_TAGS)))]
+    unit_names = ["USD", "USD/shares", "shares", "pure"][:max(1, units)]
+    facts = {"us-gaap": {}, "dei": {}}
+    for name in names[:tags]:
+        facts["us-gaap"][name] = {
+            "label": name, "description": f"Synthetic {name}",
+            "units": {u: tag_rows(cik, years, restatements, rng) for u in unit_names},
+        }
+    facts["dei"]["EntityCommonStockSharesOutstanding"] = {
+        "label": "Shares", "description": "", "units": {"shares": tag_rows(cik, years, 0, rng)},
+    }
+    return {"cik": cik, "entityName": f"Synthetic {cik}", "facts": facts}
+
+
+def write_companyfacts(path: str | Path, target_mb: float, cik: int = 1, years: int = 30,
+                       restatements: float = 1.0, seed: int = 0) -> Path:
+    """Write a companyfacts document of roughly `target_mb` megabytes without building it in memory."""
+    path = Path(path)
+    rng = random.Random(seed)
+    target = int(target_mb * 1024 * 1024)
+    written = 0
+    with path.open("w", encoding="utf-8") as fp:
+        fp.write(f'{{"cik": {cik}, "entityName": "Synthetic {cik}", "facts": {{"us-gaap": {{')
+        i = 0
+        while written < target:
+            name = MAPPED_TAGS[i] if i < len(MAPPED_TAGS) else f"SyntheticTag{i:05d}"
+            body = json.dumps({"label": name, "description": f"Synthetic {name}",
+                               "units": {"USD": tag_rows(cik, years, restatements, rng)}})
+            chunk = ("," if i else "") + json.dumps(name) + ":" + body
+            fp.write(chunk)
+            written += len(chunk)
+            i += 1
+        fp.write("}}}")
+    return path
@@ -0,0 +1,138 @@
+import os
+import pickle
+import re
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Callable
+from .ingest import BATCH_SIZE, LoadResult, ingest_state, iter_companyfacts, load_facts, slim_tags
+
+MEMBER_RE = re.compile(r"CIK(\d{10})\.json$")
+
+@dataclass
+class BulkResult:
+    members: int = 0
+    resumed: int = 0
+    loaded: LoadResult = field(default_factory=LoadResult)
+    failed: dict[str, str] = field(default_factory=dict)
+
+_zip: zipfile.ZipFile | None = None
+_tags = None
+
+def _init_worker(path: str, tags=None):
+    global _zip, _tags
+    _zip = zipfile.ZipFile(path)
+    _tags = tags
+
+def _parse_member(member: str, spool_dir: str) -> tuple[str, str | Exception]:
+    # rows are spooled to a temp file as pickled BATCH_SIZE chunks, so neither the worker nor the
+    # parent ever holds a whole member; returns the file's path
+    try:
+        with _zip.open(member) as fp, tempfile.NamedTemporaryFile("wb", dir=spool_dir, delete=False) as out:
+            try:
+                rows = iter_companyfacts(fp, _tags)
+                while batch := list(islice(rows, BATCH_SIZE)):
+                    pickle.dump(batch, out, pickle.HIGHEST_PROTOCOL)
+            except BaseException:
+                out.close()
+                os.unlink(out.name)
+                raise
+            return member, out.name
+    except Exception as e:
+        return member, e
+
+def _spooled_rows(path: str):
+    with open(path, "rb") as fp:
+        while True:
+            try:
+                batch = pickle.load(fp)
+            except EOFError:
+                return
+            yield from batch
+
+def list_members(path: str | Path, ciks: set[int] | None = None) -> list[tuple[str, int]]:
+    out = []
+    with zipfile.ZipFile(path) as zf:
+        for name in zf.namelist():
+            m = MEMBER_RE.search(name)
+            if not m:
+                continue
+            cik = int(m.group(1))
+            if ciks is None or cik in ciks:
+                out.append((name, cik))
+    return out
+
+def default_checkpoint(path: str | Path) -> Path:
+    return Path(f"{path}.progress")
+
+def archive_id(path: str | Path) -> str:
+    # size and mtime: a new nightly archive downloaded over the old one gets a fresh checkpoint
+    st = Path(path).stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def _read_checkpoint(checkpoint: Path, archive: str) -> set[str]:
+    # the first line names the archive the members were loaded from; any other archive starts over
+    if not checkpoint.exists():
+        return set()
+    lines = checkpoint.read_text(encoding="utf-8").split()
+    if lines[:2] != ["#archive", archive]:
+        checkpoint.unlink()
+        return set()
+    return set(lines[2:])
+
+def ingest_bulk(path: str | Path, ciks: set[int] | None = None, workers: int | None = None,
+                checkpoint: str | Path | None = None,
+                on_member: Callable[[str, LoadResult], None] | None = None, mapping=None) -> BulkResult:
+    # members are parsed and flattened in worker processes; the parent is the single DB writer and
+    # appends each committed member to the checkpoint so an interrupted run resumes where it stopped.
+    # A run with no failures removes the checkpoint
+    path = Path(path)
+    checkpoint = Path(checkpoint) if checkpoint else default_checkpoint(path)
+    archive = archive_id(path)
+    done = _read_checkpoint(checkpoint, archive)
+
+    members = list_members(path, ciks)
+    result = BulkResult(members=len(members))
+    todo = [(m, cik) for m, cik in members if m not in done]
+    result.resumed = len(members) - len(todo)
+    cik_of = dict(todo)
+
+    tags = slim_tags(mapping)
+    workers = max(1, workers or os.cpu_count() or 1)
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(path), tags)) as pool, \
+            tempfile.TemporaryDirectory(prefix="edgar-bulk-") as spool, \
+            checkpoint.open("a", encoding="utf-8") as ck:
+        if not done:
+            ck.write(f"#archive {archive}\n")
+        pending = deque()
+        it = iter(todo)
+        for member, _ in it:
+            pending.append(pool.submit(_parse_member, member, spool))
+            if len(pending) >= window:
+                break
+        while pending:
+            member, rows = pending.popleft().result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(_parse_member, nxt[0], spool))
+            if isinstance(rows, Exception):
+                result.failed[member] = str(rows)
+                continue
+            try:
+                res = load_facts(cik_of[member], _spooled_rows(rows),
+                                 state=ingest_state(cik_of[member], mapping, tags))
+            finally:
+                os.unlink(rows)
+            result.loaded += res
+            ck.write(member + "\n")
+            ck.flush()
+            if on_member:
+                on_member(member, res)
+    if not result.failed:
+        checkpoint.unlink(missing_ok=True)
+    return result
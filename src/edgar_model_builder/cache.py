@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Protocol
+from . import __version__
+from .metrics import inc
+from .settings import settings
+
+try:
+    import redis
+except ImportError:  # optional: pip install edgar-model-builder[redis]
+    redis = None
+
+class Cache(Protocol):
+    def get(self, key: str, default: Any = None) -> Any: ...
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None: ...
+
+def make_key(namespace: str, *parts) -> str:
+    # the package version is part of every key so upgrades never read stale layouts
+    raw = json.dumps(parts, default=str, sort_keys=True)
+    return f"edgar:{__version__}:{namespace}:{hashlib.sha256(raw.encode()).hexdigest()[:32]}"
+
+class NullCache:
+    def get(self, key: str, default: Any = None) -> Any:
+        return default
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        pass
+
+class MemoryCache:
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._data: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] is not None and hit[0] < time.monotonic():
+                del self._data[key]
+                hit = None
+            if hit is None:
+                inc("cache_memory_misses")
+                return default
+            inc("cache_memory_hits")
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+class DiskCache:
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        h = hashlib.sha256(key.encode()).hexdigest()
+        return self.root / h[:2] / f"{h}.pkl"
+
+    def get(self, key: str, default: Any = None) -> Any:
+        p = self._path(key)
+        try:
+            expires, value = pickle.loads(p.read_bytes())
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            inc("cache_disk_misses")
+            return default
+        if expires is not None and expires < time.time():
+            p.unlink(missing_ok=True)
+            inc("cache_disk_misses")
+            return default
+        inc("cache_disk_hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(pickle.dumps((time.time() + ttl if ttl else None, value), protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp, p)
+
+class RedisCache:
+    def __init__(self, url: str | None = None, client=None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("redis is not installed (pip install edgar-model-builder[redis])")
+            client = redis.Redis.from_url(url or settings.redis_url)
+        self.client = client
+
+    # an unreachable Redis, or an entry this version can't unpickle, degrades to a cache miss
+    # instead of failing the build
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            raw = self.client.get(key)
+            value = None if raw is None else pickle.loads(raw)
+        except Exception:
+            raw = None
+        inc("cache_redis_misses" if raw is None else "cache_redis_hits")
+        return default if raw is None else value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            if ttl:
+                self.client.set(key, raw, px=int(ttl * 1000))
+            else:
+                self.client.set(key, raw)
+        except Exception:
+            pass
+
+class TieredCache:
+    # reads go fastest-first and backfill the faster tiers on a hit; writes go to every tier
+    def __init__(self, tiers: list[Cache]):
+        self.tiers = tiers
+
+    def get(self, key: str, default: Any = None) -> Any:
+        missing = object()
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key, missing)
+            if value is not missing:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value, settings.cache_ttl)
+                return value
+        return default
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+def build_cache(backends: str) -> Cache:
+    tiers: list[Cache] = []
+    for name in (b.strip().lower() for b in backends.split(",")):
+        if name in {"", "none", "off"}:
+            continue
+        if name == "memory":
+            tiers.append(MemoryCache(settings.cache_max_items))
+        elif name == "disk":
+            tiers.append(DiskCache(settings.cache_dir))
+        elif name == "redis":
+            tiers.append(RedisCache(settings.redis_url))
+        else:
+            raise ValueError(f"Unknown cache backend: {name}")
+    if not tiers:
+        return NullCache()
+    return tiers[0] if len(tiers) == 1 else TieredCache(tiers)
+
+_cache: Cache | None = None
+
+def get_cache() -> Cache:
+    global _cache
+    if _cache is None:
+        _cache = build_cache(settings.cache_backends)
+    return _cache
+
+def _tiers(c: Cache) -> list[Cache]:
+    return c.tiers if isinstance(c, TieredCache) else [c]
+
+def shared_cache() -> Cache | None:
+    # the cross-process tiers (disk, Redis), for callers that keep their own in-process cache
+    tiers = [t for t in _tiers(get_cache()) if isinstance(t, (DiskCache, RedisCache))]
+    if not tiers:
+        return None
+    return tiers[0] if len(tiers) == 1 else TieredCache(tiers)
+
+def remote_cache() -> Cache | None:
+    # Redis only: SEC bodies already live in the local HTTP cache, so only share them across hosts
+    tiers = [t for t in _tiers(get_cache()) if isinstance(t, RedisCache)]
+    return tiers[0] if tiers else None
+
+def set_cache(cache: Cache | None) -> None:
+    global _cache
+    _cache = cache
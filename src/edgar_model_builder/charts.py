@@ -0,0 +1,130 @@
+import hashlib
+import io
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+import matplotlib
+matplotlib.use("Agg")  # never pick an interactive backend in batch runs
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from . import __version__
+from .settings import settings
+
+@dataclass
+class ChartSpec:
+    kind: str  # line | bar | heatmap
+    title: str
+    labels: list[str]
+    # line/bar: one entry per plotted series; heatmap: one row per key
+    series: dict[str, list[float]]
+    xlabel: str = ""
+    ylabel: str = ""
+    style: dict = field(default_factory=lambda: {"size": [6.0, 3.5], "dpi": 200})
+
+    @property
+    def key(self) -> str:
+        # the PNG depends only on the data, the style and the renderer, so that is all we hash
+        raw = json.dumps([__version__, matplotlib.__version__, asdict(self)], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+def chart_path(spec: ChartSpec) -> Path:
+    key = spec.key
+    return Path(settings.chart_cache_dir) / key[:2] / f"{key}.png"
+
+_fig: Figure | None = None
+
+def _figure() -> Figure:
+    # one Agg figure per process, cleared between charts instead of built from scratch
+    global _fig
+    if _fig is None:
+        _fig = Figure()
+        FigureCanvasAgg(_fig)
+    _fig.clf()
+    return _fig
+
+def _values(ys) -> list[float]:
+    return [math.nan if v is None else float(v) for v in ys]
+
+def render_png(spec: ChartSpec) -> bytes:
+    fig = _figure()
+    fig.set_size_inches(*spec.style["size"])
+    ax = fig.add_subplot(111)
+    if spec.kind == "line":
+        for name, ys in spec.series.items():
+            ax.plot(spec.labels, _values(ys), label=name, marker="o", markersize=3)
+        if len(spec.series) > 1:
+            ax.legend(fontsize=8)
+        ax.tick_params(axis="x", rotation=45)
+    elif spec.kind == "bar":
+        for name, ys in spec.series.items():
+            ax.bar(spec.labels, np.nan_to_num(_values(ys)), label=name)
+        ax.tick_params(axis="x", rotation=45)
+    elif spec.kind == "heatmap":
+        grid = np.array([_values(row) for row in spec.series.values()])
+        im = ax.imshow(grid, cmap="RdYlGn", aspect="auto")
+        ax.set_xticks(range(len(spec.labels)), spec.labels)
+        ax.set_yticks(range(len(spec.series)), list(spec.series))
+        for (i, j), v in np.ndenumerate(grid):
+            if not math.isnan(v):
+                ax.text(j, i, f"{v:.1f}", ha="center", va="center", fontsize=7)
+        fig.colorbar(im, ax=ax)
+    else:
+        raise ValueError(f"Unknown chart kind: {spec.kind}")
+    ax.set_title(spec.title)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=spec.style["dpi"])
+    return buf.getvalue()
+
+def _render_to_cache(spec: ChartSpec) -> Path:
+    path = chart_path(spec)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(render_png(spec))
+    os.replace(tmp, path)
+    return path
+
+def render_charts(specs: list[ChartSpec], workers: int | None = None) -> list[Path]:
+    # cached PNGs are reused as-is; only misses are rasterized, in a process pool when there are several
+    paths = [chart_path(s) for s in specs]
+    todo = list({p: s for p, s in zip(paths, specs) if not p.exists()}.values())
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=min(len(todo), workers or os.cpu_count() or 1)) as pool:
+            list(pool.map(_render_to_cache, todo))
+    else:
+        for s in todo:
+            _render_to_cache(s)
+    return paths
+
+def pack_charts(ticker: str, hist_fy: pd.DataFrame, comps: pd.DataFrame, assumptions: dict) -> list[ChartSpec]:
+    specs = []
+    lines = [c for c in ("revenue", "operating_income", "net_income") if c in hist_fy.columns]
+    if lines and not hist_fy.empty:
+        fy = hist_fy.sort_index().tail(10)
+        specs.append(ChartSpec(
+            "line", f"{ticker}: annual history", [d.strftime("%Y") for d in fy.index],
+            {c: fy[c].tolist() for c in lines}, ylabel="USD",
+        ))
+    if "EV/EBITDA" in comps.columns and comps["EV/EBITDA"].notna().any():
+        specs.append(ChartSpec(
+            "bar", "Trading comps: EV / TTM EBITDA", comps["ticker"].tolist(),
+            {"EV/EBITDA": comps["EV/EBITDA"].tolist()},
+        ))
+    wacc, g = assumptions.get("WACC"), assumptions.get("Terminal_Growth")
+    if wacc is not None and g is not None:
+        waccs = [round(wacc + d, 4) for d in (-0.02, -0.01, 0.0, 0.01, 0.02)]
+        growths = [round(g + d, 4) for d in (-0.01, -0.005, 0.0, 0.005, 0.01)]
+        # perpetuity-growth terminal multiple (1+g)/(WACC-g)
+        specs.append(ChartSpec(
+            "heatmap", "Terminal multiple sensitivity", [f"{w:.1%}" for w in waccs],
+            {f"{gg:.1%}": [(1 + gg) / (w - gg) if w > gg else None for w in waccs] for gg in growths},
+            xlabel="WACC", ylabel="Terminal growth",
+        ))
+    return specs
@@ -1,19 +1,9 @@
-import asyncio
-from pathlib import Path
 import typer
 from rich.console import Console
 from .settings import settings
-from .db import init_db
-from .sec_client import SecClient
-from .ingest import upsert_company, ingest_companyfacts
-from .query import get_company_by_ticker
-from .mappings import load_mapping
-from .normalize import build_statement_history, compute_kpis
-from .marketdata import provider
-from .comps import build_comps_table
-from .excel_builder import build_model_xlsx
-from .pdf_builder import build_pack_pdf
-from .artifacts import artifacts_root, write_json
+
+# Subcommands import what they need when they run, so `edgar --help` and light commands
+# don't pay for pandas, SQLAlchemy, openpyxl, reportlab and matplotlib (see tests/test_startup.py).
 
 app = typer.Typer(add_completion=False)
 console = Console()
@@ -21,93 +11,349 @@ console = Console()
 db_app = typer.Typer()
 sec_app = typer.Typer()
 universe_app = typer.Typer()
+jobs_app = typer.Typer()
 app.add_typer(db_app, name="db")
 app.add_typer(sec_app, name="sec")
 app.add_typer(universe_app, name="universe")
+app.add_typer(jobs_app, name="jobs")
+
+@app.callback()
+def main(offline: bool = typer.Option(False, "--offline", help="Serve SEC data from the local cache only")):
+    if offline:
+        settings.sec_offline = True
 
 @db_app.command("init")
 def db_init():
-    init_db()
-    console.print("[green]DB initialized[/green]")
+    from .db import init_db
+    n = init_db()
+    console.print("[green]DB initialized[/green]" + (f" (backfilled {n} fact_latest rows)" if n else ""))
+
+@db_app.command("rebuild-latest")
+def db_rebuild_latest(cik: int = typer.Option(None, help="Only rebuild this CIK")):
+    from .ingest import rebuild_latest
+    n = rebuild_latest(cik)
+    console.print(f"[green]Rebuilt fact_latest: {n} rows[/green]")
+
+@db_app.command("snapshot")
+def db_snapshot(tickers: str):
+    from . import snapshots
+    from .query import get_company_by_ticker
+    if not snapshots.available():
+        raise typer.BadParameter("pyarrow is not installed (pip install edgar-model-builder[snapshots])")
+    for t in [t.strip().upper() for t in tickers.split(",") if t.strip()]:
+        co = get_company_by_ticker(t)
+        if not co:
+            console.print(f"[red]Unknown ticker: {t} (sync tickers first)[/red]")
+            continue
+        console.print(f"[green]{t}: {snapshots.write_snapshot(co.cik)}[/green]")
 
 @sec_app.command("sync-tickers")
 def sync_tickers():
+    import asyncio
     asyncio.run(_sync_tickers())
 
 async def _sync_tickers():
+    from .ingest import sync_companies
+    from .sec_client import SecClient
     c = SecClient()
     try:
         data = await c.tickers()
-        for _, row in data.items():
-            upsert_company(int(row["cik_str"]), row["ticker"], row["title"])
-        console.print(f"[green]Synced {len(data)} tickers[/green]")
+        res = await sync_companies((int(row["cik_str"]), row["ticker"], row["title"]) for row in data.values())
+        console.print(f"[green]Synced {len(data)} tickers[/green]: {res.inserted} new, {res.updated} changed, "
+                      f"{res.unchanged} unchanged, {res.parked} lost their ticker")
     finally:
         await c.aclose()
 
-@universe_app.command("ingest")
-def universe_ingest(tickers: str):
-    asyncio.run(_universe_ingest([t.strip().upper() for t in tickers.split(",") if t.strip()]))
-
-async def _universe_ingest(tickers: list[str]):
-    c = SecClient()
-    try:
-        for t in tickers:
+@sec_app.command("ingest-bulk")
+def sec_ingest_bulk(path: str, tickers: str = "", workers: int = 0, checkpoint: str = "",
+                    mapping_path: str = "config/mappings/us_gaap.yml"):
+    from .bulk import ingest_bulk
+    from .mappings import load_mapping
+    from .query import get_company_by_ticker
+    ciks = None
+    if tickers:
+        ciks = set()
+        for t in [t.strip().upper() for t in tickers.split(",") if t.strip()]:
             co = get_company_by_ticker(t)
             if not co:
                 console.print(f"[red]Unknown ticker: {t} (sync tickers first)[/red]")
                 continue
-            cf = await c.companyfacts(co.cik)
-            ingest_companyfacts(co.cik, cf)
-            console.print(f"[green]Ingested companyfacts: {t}[/green]")
+            ciks.add(co.cik)
+
+    def progress(member: str, res):
+        console.print(f"{member}: {res.inserted} new, {res.skipped} skipped")
+
+    res = ingest_bulk(path, ciks=ciks, workers=workers or None, checkpoint=checkpoint or None, on_member=progress,
+                      mapping=load_mapping(mapping_path))
+    console.print(
+        f"[green]Bulk ingest: {res.members} members ({res.resumed} already done), "
+        f"{res.loaded.inserted} facts inserted, {res.loaded.skipped} skipped[/green]"
+    )
+    for member, err in res.failed.items():
+        console.print(f"[red]{member}: {err}[/red]")
+
+@universe_app.command("ingest")
+def universe_ingest(tickers: str, concurrency: int = 4, writers: int = 2,
+                    mapping_path: str = "config/mappings/us_gaap.yml"):
+    import asyncio
+    asyncio.run(_universe_ingest([t.strip().upper() for t in tickers.split(",") if t.strip()], concurrency, writers,
+                                 mapping_path))
+
+async def _universe_ingest(tickers: list[str], concurrency: int = 4, writers: int = 2,
+                           mapping_path: str = "config/mappings/us_gaap.yml"):
+    from rich.table import Table
+    from .mappings import load_mapping
+    from .sec_client import SecClient
+    from .universe import ingest_universe
+    c = SecClient()
+    try:
+        results = await ingest_universe(c, tickers, concurrency=concurrency, writers=writers,
+                                        mapping=load_mapping(mapping_path))
     finally:
         await c.aclose()
 
-@app.command("build-pack")
-def build_pack(ticker: str, peers: str = "", mapping_path: str = "config/mappings/us_gaap.yml"):
-    asyncio.run(_build_pack(ticker.upper(), [p.strip().upper() for p in peers.split(",") if p.strip()], mapping_path))
+    table = Table(title="Universe ingest")
+    for col in ("ticker", "status", "inserted", "skipped", "error"):
+        table.add_column(col)
+    for r in results:
+        status = "[green]ok[/green]" if r.ok else "[red]failed[/red]"
+        table.add_row(r.ticker, status, str(r.inserted), str(r.skipped), r.error or "")
+    console.print(table)
+    failed = sum(1 for r in results if not r.ok)
+    console.print(f"[green]{len(results) - failed} ingested[/green], [red]{failed} failed[/red]")
+
+@universe_app.command("frames")
+def universe_frames(periods: str = typer.Argument(..., help="Calendar periods, e.g. CY2023,CY2024Q1,CY2024Q4I"),
+                    mapping_path: str = "config/mappings/us_gaap.yml",
+                    units: str = typer.Option("", help="Units to request (default: the mapping's first unit_priority)"),
+                    concurrency: int = 4,
+                    resolve_forms: bool = typer.Option(False, "--resolve-forms",
+                                                       help="Read each filer's submissions (one request per filer) "
+                                                            "to learn which form (10-K/10-Q) each value came from")):
+    import asyncio
+    from .ingest import frame_period
+    period_list = [p.strip().upper() for p in periods.split(",") if p.strip()]
+    try:
+        for p in period_list:
+            frame_period(p)
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    unit_list = [u.strip() for u in units.split(",") if u.strip()] or None
+    asyncio.run(_universe_frames(period_list, mapping_path, unit_list, concurrency, resolve_forms))
 
-async def _build_pack(ticker: str, peers: list[str], mapping_path: str):
-    co = get_company_by_ticker(ticker)
-    if not co:
-        raise typer.BadParameter("Ticker not found. Run: edgar sec sync-tickers")
+async def _universe_frames(periods: list[str], mapping_path: str, units: list[str] | None, concurrency: int,
+                           resolve_forms: bool = False):
+    from .mappings import load_mapping
+    from .sec_client import SecClient
+    from .universe import ingest_frames
     c = SecClient()
     try:
-        cf = await c.companyfacts(co.cik)
-        ingest_companyfacts(co.cik, cf)
+        res = await ingest_frames(c, load_mapping(mapping_path), periods, units, concurrency, resolve_forms)
     finally:
         await c.aclose()
+    for name, err in res.failed.items():
+        console.print(f"[red]{name}: {err}[/red]")
+    console.print(f"[green]Frames: {res.requests} requests ({res.missing} not published), "
+                  f"{res.loaded.inserted} facts inserted, {res.loaded.skipped} skipped, "
+                  f"{res.resolved} filings resolved to a form[/green] ({res.unresolved} still unknown), "
+                  f"[red]{len(res.failed)} failed[/red]")
 
-    mapping = load_mapping(mapping_path)
-    hist_fy = build_statement_history(co.cik, mapping, "FY")
-    hist_q = build_statement_history(co.cik, mapping, "Q")
+@app.command("build-pack")
+def build_pack(ticker: str, peers: str = "", mapping_path: str = "config/mappings/us_gaap.yml",
+               force: bool = typer.Option(False, "--force", help="Rebuild even if the manifest says artifacts are current"),
+               profile: bool = typer.Option(False, "--profile", help="Also write a cProfile report to the artifact directory"),
+               metrics_textfile: str = typer.Option("", help="Also write metrics to this Prometheus textfile")):
+    import asyncio
+    from .artifacts import artifacts_root
+    from .metrics import metrics
+    ticker = ticker.upper()
+    peer_list = [p.strip().upper() for p in peers.split(",") if p.strip()]
+    metrics.reset()
+    if profile:
+        import cProfile
+        import pstats
+        prof = cProfile.Profile()
+        prof.runcall(asyncio.run, _build_pack(ticker, peer_list, mapping_path, force))
+    else:
+        asyncio.run(_build_pack(ticker, peer_list, mapping_path, force))
 
-    kpis = compute_kpis(hist_fy, hist_q)
-    for col in ["cash","total_debt"]:
-        if col in hist_q.columns and not hist_q[col].dropna().empty:
-            kpis[col] = float(hist_q[col].dropna().iloc[-1])
+    out_dir = artifacts_root() / ticker
+    console.print(f"Metrics: {metrics.write_json(out_dir / 'metrics.json')}")
+    if metrics_textfile:
+        metrics.write_prometheus(metrics_textfile, {"ticker": ticker})
+    if profile:
+        prof.dump_stats(out_dir / "profile.pstats")
+        with open(out_dir / "profile.txt", "w", encoding="utf-8") as fp:
+            pstats.Stats(prof, stream=fp).sort_stats("cumulative").print_stats(60)
+        console.print(f"Profile: {out_dir / 'profile.txt'} (raw stats in profile.pstats)")
+
+async def _build_pack(ticker: str, peers: list[str], mapping_path: str, force: bool = False):
+    from .db import AsyncSessionLocal, async_database
+    from .ingest import aingest_companyfacts_stream
+    from .mappings import load_mapping
+    from .marketdata import provider
+    from .metrics import inc, span
+    from .pack import DEFAULT_ASSUMPTIONS, build_pack
+    from .query import aget_companies_by_ticker
+    from .sec_client import SecClient
+    from .universe import backfill_mapping
+    mapping = load_mapping(mapping_path)
+    # one async session for the lookups and the ingest
+    async with async_database(), AsyncSessionLocal() as session:
+        companies = await aget_companies_by_ticker([ticker, *peers], session)
+        co = companies.get(ticker)
+        if not co:
+            raise typer.BadParameter("Ticker not found. Run: edgar sec sync-tickers")
+        ciks = {t: companies[t].cik for t in [ticker, *peers] if t in companies}
+        c = SecClient()
+        try:
+            with span("sec_fetch"):
+                fp = await c.companyfacts_stream(co.cik)
+            with fp, span("ingest"):
+                res = await aingest_companyfacts_stream(co.cik, fp, session=session, mapping=mapping)
+            inc("facts_inserted", res.inserted)
+            inc("facts_skipped", res.skipped)
+            # peers ingested in slim mode under an older mapping get its new tags first
+            with span("backfill"):
+                await backfill_mapping(c, [ciks[p] for p in peers if p in ciks], mapping)
+        finally:
+            await c.aclose()
 
     mkt = provider(settings.marketdata_provider)
-    kpis_by_ticker = {ticker: kpis}
-    for p in peers:
-        pco = get_company_by_ticker(p)
-        if pco:
-            ph_fy = build_statement_history(pco.cik, mapping, "FY")
-            ph_q = build_statement_history(pco.cik, mapping, "Q")
-            pk = compute_kpis(ph_fy, ph_q)
-            for col in ["cash","total_debt"]:
-                if col in ph_q.columns and not ph_q[col].dropna().empty:
-                    pk[col] = float(ph_q[col].dropna().iloc[-1])
-            kpis_by_ticker[p] = pk
-
-    comps = build_comps_table(ticker, peers, kpis_by_ticker, mkt)
-
-    assumptions = {"WACC": 0.10, "Terminal_Growth": 0.03}
-    art_root = artifacts_root() / ticker
-    model_path = build_model_xlsx(art_root / "model.xlsx", ticker, hist_fy, hist_q, comps, assumptions)
-    pdf_path = build_pack_pdf(art_root / "pack.pdf", ticker, kpis, comps)
-    data_path = write_json(art_root / "data.json", {"ticker": ticker, "kpis": kpis, "comps": comps.to_dict(orient="records")})
+    paths, todo = build_pack(ticker, peers, ciks, mapping, mkt, DEFAULT_ASSUMPTIONS, force)
+    if not todo:
+        console.print(f"[green]{ticker}: artifacts are up to date[/green] (use --force to rebuild)")
+        return
 
     console.print("[green]Built artifacts[/green]")
-    console.print(model_path)
-    console.print(pdf_path)
-    console.print(data_path)
+    for path in paths:
+        console.print(path)
+
+@app.command("build-universe")
+def build_universe_cmd(tickers: str = typer.Option(..., "--tickers", help="Comma-separated tickers to build packs for"),
+                       peer_groups: str = typer.Option("", help="YAML with default/groups peer lists"),
+                       mapping_path: str = "config/mappings/us_gaap.yml", concurrency: int = 4, writers: int = 2,
+                       workers: int = 0,
+                       force: bool = typer.Option(False, "--force", help="Rebuild even if the manifest says artifacts are current")):
+    import asyncio
+    from .pack import load_peer_groups
+    default_peers, groups = load_peer_groups(peer_groups) if peer_groups else ([], {})
+    targets = [t.strip().upper() for t in tickers.split(",") if t.strip()]
+    asyncio.run(_build_universe(targets, default_peers, groups, mapping_path, concurrency, writers, workers or None, force))
+
+async def _build_universe(targets: list[str], default_peers: list[str], groups: dict[str, list[str]],
+                          mapping_path: str, concurrency: int, writers: int, workers: int | None, force: bool = False):
+    from .mappings import load_mapping
+    from .marketdata import provider
+    from .pack import build_universe
+    from .sec_client import SecClient
+    mapping = load_mapping(mapping_path)
+    mkt = provider(settings.marketdata_provider)
+    c = SecClient()
+    try:
+        res = await build_universe(c, targets, groups, default_peers, mapping, mkt,
+                                   concurrency=concurrency, writers=writers, workers=workers, force=force)
+    finally:
+        await c.aclose()
+
+    for r in res.ingest:
+        if not r.ok:
+            console.print(f"[red]{r.ticker}: ingest failed: {r.error}[/red]")
+    for t, paths in res.built.items():
+        console.print(f"[green]{t}[/green]: " + ", ".join(str(p) for p in paths))
+    for t, err in res.failed.items():
+        console.print(f"[red]{t}: {err}[/red]")
+    console.print(f"[green]{len(res.built)} packs built[/green], {len(res.skipped)} up to date, "
+                  f"[red]{len(res.failed)} failed[/red]")
+
+@app.command("enqueue")
+def enqueue(tickers: str, peer_groups: str = typer.Option("", help="YAML with default/groups peer lists"),
+            mapping_path: str = "config/mappings/us_gaap.yml",
+            label: str = typer.Option("", help="Idempotency label for this run (default: today's UTC date)"),
+            force: bool = typer.Option(False, "--force", help="Queue even what this label already processed, and rebuild packs")):
+    from datetime import datetime, timezone
+    from .jobs import default_queue, enqueue_universe
+    from .pack import load_peer_groups
+    default_peers, groups = load_peer_groups(peer_groups) if peer_groups else ([], {})
+    targets = [t.strip().upper() for t in tickers.split(",") if t.strip()]
+    peers_of = {t: [p for p in groups.get(t, default_peers) if p != t] for t in targets}
+    label = label or datetime.now(timezone.utc).date().isoformat()
+    res = enqueue_universe(default_queue(), targets, peers_of, mapping_path, label, force=force)
+    created = sum(1 for _, c in res if c)
+    console.print(f"[green]Queued {created} jobs[/green], {len(res) - created} already queued or done for {label}")
+
+@app.command("worker")
+def worker(concurrency: int = 2, visibility: float = typer.Option(0, help="Lease seconds (default: JOB_VISIBILITY)"),
+           until_idle: bool = typer.Option(False, "--until-idle", help="Exit once the queue is empty")):
+    import asyncio
+    asyncio.run(_worker(concurrency, visibility or None, until_idle))
+
+async def _worker(concurrency: int, visibility: float | None, until_idle: bool):
+    from .db import async_database
+    from .jobs import default_queue, pipeline_handlers, run_worker
+    from .marketdata import provider
+    from .sec_client import SecClient
+    queue = default_queue()
+    c = SecClient()
+    try:
+        async with async_database():
+            counts = await run_worker(queue, pipeline_handlers(c, provider(settings.marketdata_provider)),
+                                      concurrency, visibility, until_idle=until_idle)
+    finally:
+        await c.aclose()
+    console.print(f"[green]{counts['done']} done[/green], {counts['retried']} retried, {counts['deferred']} deferred, "
+                  f"[red]{counts['dead']} dead[/red]")
+
+@jobs_app.command("status")
+def jobs_status(limit: int = 20):
+    from datetime import datetime
+    from rich.table import Table
+    from .jobs import default_queue
+    queue = default_queue()
+    s = queue.stats()
+    console.print(f"pending {s['pending']}, delayed {s['delayed']}, active {s['active']}, "
+                  f"[green]done {s['done']}[/green], [red]dead {s['dead']}[/red]")
+    table = Table(title="Recent jobs")
+    for col in ("id", "kind", "ticker", "status", "attempts", "updated", "error"):
+        table.add_column(col)
+    for j in queue.jobs(limit):
+        table.add_row(j.id[:12], j.kind, j.payload.get("ticker", ""), j.status, f"{j.attempts}/{j.max_attempts}",
+                      datetime.fromtimestamp(j.updated_at).strftime("%Y-%m-%d %H:%M:%S"), j.error or "")
+    console.print(table)
+
+@app.command("watch")
+def watch_cmd(universe: str = typer.Option(..., help="Comma-separated tickers whose packs to keep current"),
+              peer_groups: str = typer.Option("", help="YAML with default/groups peer lists"),
+              mapping_path: str = "config/mappings/us_gaap.yml",
+              interval: float = typer.Option(300.0, help="Seconds between the starts of two polls"),
+              concurrency: int = 4,
+              once: bool = typer.Option(False, "--once", help="Poll once, queue what changed and exit")):
+    import asyncio
+    from .pack import load_peer_groups
+    default_peers, groups = load_peer_groups(peer_groups) if peer_groups else ([], {})
+    targets = [t.strip().upper() for t in universe.split(",") if t.strip()]
+    peers_of = {t: [p for p in groups.get(t, default_peers) if p != t] for t in targets}
+    asyncio.run(_watch(targets, peers_of, mapping_path, interval, concurrency, once))
+
+async def _watch(targets: list[str], peers_of: dict[str, list[str]], mapping_path: str, interval: float,
+                 concurrency: int, once: bool):
+    from datetime import datetime
+    from .jobs import default_queue
+    from .sec_client import SecClient
+    from .watch import watch
+
+    def report(res):
+        stamp = datetime.now().strftime("%H:%M:%S")
+        for t, err in res.failed.items():
+            console.print(f"[red]{stamp} {t}: {err}[/red]")
+        for t, accn in res.new.items():
+            console.print(f"[green]{stamp} {t}: new filing {accn}[/green]")
+        console.print(f"{stamp} polled {res.polled} ({res.unchanged} unchanged), {len(res.new)} with new filings, "
+                      f"{res.queued} jobs queued")
+
+    c = SecClient(max_age=0)  # every poll revalidates, whatever SEC_CACHE_MAX_AGE says
+    try:
+        await watch(c, default_queue(), targets, peers_of, mapping_path, interval, concurrency,
+                    cycles=1 if once else None, on_poll=report)
+    finally:
+        await c.aclose()
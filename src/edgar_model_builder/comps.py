@@ -1,31 +1,35 @@
 import pandas as pd
 from .marketdata import MarketDataProvider
-from .normalize import compute_kpis
-from .marketdata import provider
 
 def build_comps_table(target_ticker: str, peers: list[str], kpis_by_ticker: dict[str, dict], mkt: MarketDataProvider):
+    tickers = [target_ticker] + peers
+    # EDGAR covers most tickers, so those only need price / market cap; the rest are fetched once,
+    # with fundamentals (best effort), as a fallback for the missing KPIs
+    missing = [
+        t for t in tickers
+        if kpis_by_ticker.get(t, {}).get("ttm_revenue") is None or kpis_by_ticker.get(t, {}).get("ttm_ebitda") is None
+    ]
+    covered = [t for t in tickers if t not in missing]
+    quotes = mkt.quotes(covered, fundamentals=False) if covered else {}
+    fallback = {}
+    if missing:
+        try:
+            fallback = mkt.quotes(missing, fundamentals=True)
+        except Exception:
+            fallback = mkt.quotes(missing, fundamentals=False)
+        quotes.update(fallback)
+
     rows = []
-    for t in [target_ticker] + peers:
-        q = mkt.quote(t)
+    for t in tickers:
+        q = quotes[t]
         k = kpis_by_ticker.get(t, {})
         ttm_rev = k.get("ttm_revenue")
         ttm_ebitda = k.get("ttm_ebitda")
-
-        # --- Fallback (best-effort): if EDGAR fundamentals are missing, pull from marketdata (yfinance) ---
-        _sym = locals().get("ticker") or locals().get("t") or locals().get("symbol")
-        if _sym and (ttm_rev is None or ttm_ebitda is None):
-            try:
-                _q = provider("yfinance").quote(_sym)
-                if ttm_rev is None:
-                    ttm_rev = getattr(_q, "ttm_revenue", None)
-                if ttm_ebitda is None:
-                    ttm_ebitda = getattr(_q, "ttm_ebitda", None)
-                # If EV is missing, backfill from provider too
-                if locals().get("ev", None) is None:
-                    ev = getattr(_q, "ev", None)
-            except Exception:
-                pass
-        # --- end fallback ---
+        if t in fallback:
+            if ttm_rev is None:
+                ttm_rev = getattr(fallback[t], "ttm_revenue", None)
+            if ttm_ebitda is None:
+                ttm_ebitda = getattr(fallback[t], "ttm_ebitda", None)
         mcap = q.market_cap
         ev = None
         if mcap is not None:
@@ -1,13 +1,84 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .settings import settings
 
 class Base(DeclarativeBase):
     pass
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# created on first use so importing models or the CLI never opens a pool or loads a DB driver
+_engine = None
+_sessionmaker = None
 
-def init_db():
+def get_engine():
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        from .metrics import instrument_engine
+        _engine = create_engine(settings.database_url, pool_pre_ping=True)
+        instrument_engine(_engine)
+    return _engine
+
+def SessionLocal(**kw):
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
+    return _sessionmaker(**kw)
+
+def async_database_url(url: str) -> str:
+    # same database through an asyncio driver: psycopg 3 does both, SQLite goes through aiosqlite
+    from sqlalchemy.engine import make_url
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        u = u.set(drivername="sqlite+aiosqlite")
+    elif u.get_backend_name() == "postgresql":
+        u = u.set(drivername="postgresql+psycopg")
+    return u.render_as_string(hide_password=False)
+
+# async connections belong to the event loop that opened them, so the async engine lives only
+# while some caller holds async_database() open and is disposed when the outermost one exits
+_async_engine = None
+_async_sessionmaker = None
+_async_users = 0
+
+@asynccontextmanager
+async def async_database():
+    global _async_engine, _async_sessionmaker, _async_users
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from .metrics import instrument_engine
+        _async_engine = create_async_engine(settings.async_database_url or async_database_url(settings.database_url),
+                                            pool_pre_ping=True)
+        instrument_engine(_async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    _async_users += 1
+    try:
+        yield _async_engine
+    finally:
+        _async_users -= 1
+        if _async_users == 0:
+            engine, _async_engine, _async_sessionmaker = _async_engine, None, None
+            await engine.dispose()
+
+def AsyncSessionLocal(**kw):
+    if _async_sessionmaker is None:
+        raise RuntimeError("AsyncSessionLocal() needs an open `async with async_database():` block")
+    return _async_sessionmaker(**kw)
+
+def __getattr__(name):
+    # `from .db import engine` keeps working
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def init_db() -> int:
+    # also backfills fact_latest for a database whose facts predate it; returns the rows written
     from . import models
-    Base.metadata.create_all(bind=engine)
+    from sqlalchemy import exists, select
+    Base.metadata.create_all(bind=get_engine())
+    with SessionLocal() as s:
+        has = lambda model: s.execute(select(exists().select_from(model))).scalar()
+        backfill = has(models.Fact) and not has(models.FactLatest)
+    if not backfill:
+        return 0
+    from .ingest import rebuild_latest
+    return rebuild_latest()
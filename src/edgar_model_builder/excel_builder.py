@@ -1,15 +1,27 @@
 from pathlib import Path
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import coordinate_to_tuple
+
+HEADER_FONT = Font(bold=True, size=12)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+HEADER_FILL = PatternFill("solid", fgColor="F2F2F2")
+
+def _header_style(cell):
+    cell.font = HEADER_FONT
+    cell.alignment = HEADER_ALIGNMENT
+    cell.fill = HEADER_FILL
 
 def _style_header(ws, row=1):
-    fill = PatternFill("solid", fgColor="F2F2F2")
     for cell in ws[row]:
-        cell.font = Font(bold=True, size=12)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.fill = fill
+        _header_style(cell)
+
+def _width(maxlen: int) -> float:
+    return min(maxlen + 2, 44)
 
 def _autowidth(ws):
     for col in ws.columns:
@@ -17,7 +29,12 @@ def _autowidth(ws):
         for c in col:
             v = "" if c.value is None else str(c.value)
             maxlen = max(maxlen, len(v))
-        ws.column_dimensions[get_column_letter(col[0].column)].width = min(maxlen + 2, 44)
+        ws.column_dimensions[get_column_letter(col[0].column)].width = _width(maxlen)
+
+def _text_len(values: pd.Series) -> int:
+    # longest str() of the non-empty values, i.e. what _autowidth would measure for the column
+    values = values.dropna()
+    return int(values.astype(str).str.len().max()) if len(values) else 0
 
 def _write_df(ws, df: pd.DataFrame, index_name: str = "end"):
     ws.append([index_name] + list(df.columns))
@@ -27,13 +44,101 @@ def _write_df(ws, df: pd.DataFrame, index_name: str = "end"):
     ws.freeze_panes = "A2"
     _autowidth(ws)
 
-def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataFrame, hist_q: pd.DataFrame, comps: pd.DataFrame, assumptions: dict):
-    out_path = Path(out_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    wb = Workbook()
-    wb.remove(wb.active)
+def _write_comps(ws, comps: pd.DataFrame):
+    ws.append(list(comps.columns))
+    for _, row in comps.iterrows():
+        ws.append([None if pd.isna(row[c]) else row[c] for c in comps.columns])
+    _style_header(ws, 1)
+    ws.freeze_panes = "A2"
+    _autowidth(ws)
+
+def _stream_rows(ws, header: list, rows, widths: list[int]):
+    # write-only sheets emit <cols> before the first row, so widths come from the data up front
+    for i, n in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = _width(n)
+    ws.freeze_panes = "A2"
+    cells = []
+    for v in header:
+        cell = WriteOnlyCell(ws, value=v)
+        _header_style(cell)
+        cells.append(cell)
+    ws.append(cells)
+    for row in rows:
+        ws.append(row)
+
+def _stream_df(ws, df: pd.DataFrame, index_name: str = "end"):
+    df = df.sort_index()
+    ends = pd.Series(df.index.strftime("%Y-%m-%d") if len(df) else [], dtype=object)
+    vals = df.to_numpy(dtype=float, na_value=np.nan)
+    missing = np.isnan(vals)
+    cells = vals.astype(object)
+    cells[missing] = None
+    # numpy's float->str matches str(float), so one vectorized pass measures every column
+    lens = np.where(missing, 0, np.char.str_len(vals.astype(str))).max(axis=0, initial=0)
+    widths = [max(len(index_name), _text_len(ends))] + [max(len(str(c)), int(n)) for c, n in zip(df.columns, lens)]
+    rows = ([end, *row] for end, row in zip(ends.tolist(), cells.tolist()))
+    _stream_rows(ws, [index_name] + list(df.columns), rows, widths)
+
+def _stream_comps(ws, comps: pd.DataFrame):
+    cells = comps.astype(object).where(comps.notna(), None)
+    widths = [max(len(str(c)), _text_len(comps[c])) for c in comps.columns]
+    rows = (list(row) for row in cells.itertuples(index=False, name=None))
+    _stream_rows(ws, list(comps.columns), rows, widths)
+
+class _Grid:
+    # hand-placed cells of the Summary/LBO sheets, rendered into either kind of worksheet
+    def __init__(self):
+        self.values: dict[tuple[int, int], object] = {}
+        self.formats: dict[tuple[int, int], str] = {}
+        self.header_rows: set[int] = set()
+        self.freeze: str | None = None
+
+    def __setitem__(self, ref: str, value):
+        self.values[coordinate_to_tuple(ref)] = value
+
+    def number_format(self, ref: str, fmt: str):
+        self.formats[coordinate_to_tuple(ref)] = fmt
 
-    ws = wb.create_sheet("Summary")
+    def shape(self) -> tuple[int, int]:
+        keys = self.values.keys() | self.formats.keys()
+        return max(r for r, _ in keys), max(c for _, c in keys)
+
+def _fill_grid(ws, g: _Grid):
+    for (r, c), v in g.values.items():
+        ws.cell(row=r, column=c).value = v
+    for (r, c), fmt in g.formats.items():
+        ws.cell(row=r, column=c).number_format = fmt
+    for row in sorted(g.header_rows):
+        _style_header(ws, row)
+    if g.freeze:
+        ws.freeze_panes = g.freeze
+    _autowidth(ws)
+
+def _stream_grid(ws, g: _Grid):
+    # header rows span every used column, like _style_header on a regular sheet
+    max_row, max_col = g.shape()
+    for c in range(1, max_col + 1):
+        n = max((len(str(v)) for (_, cc), v in g.values.items() if cc == c and v is not None), default=0)
+        ws.column_dimensions[get_column_letter(c)].width = _width(n)
+    if g.freeze:
+        ws.freeze_panes = g.freeze
+    for r in range(1, max_row + 1):
+        row = []
+        for c in range(1, max_col + 1):
+            v, fmt = g.values.get((r, c)), g.formats.get((r, c))
+            if fmt is None and r not in g.header_rows:
+                row.append(v)
+                continue
+            cell = WriteOnlyCell(ws, value=v)
+            if fmt is not None:
+                cell.number_format = fmt
+            if r in g.header_rows:
+                _header_style(cell)
+            row.append(cell)
+        ws.append(row)
+
+def _summary_grid(target_ticker: str, assumptions: dict) -> _Grid:
+    ws = _Grid()
     ws["A1"] = "Ticker"
     ws["B1"] = target_ticker
     ws["A3"] = "Assumption"
@@ -45,24 +150,11 @@ def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataF
         r += 1
     ws["A10"] = "Notes"
     ws["B10"] = "Update assumptions + LBO inputs, then refresh outputs."
-    _style_header(ws, 3)
-    _autowidth(ws)
+    ws.header_rows.add(3)
+    return ws
 
-    ws = wb.create_sheet("Hist_FY")
-    _write_df(ws, hist_fy, "end")
-
-    ws = wb.create_sheet("Hist_Q")
-    _write_df(ws, hist_q, "end")
-
-    ws = wb.create_sheet("Comps")
-    ws.append(list(comps.columns))
-    for _, row in comps.iterrows():
-        ws.append([None if pd.isna(row[c]) else row[c] for c in comps.columns])
-    _style_header(ws, 1)
-    ws.freeze_panes = "A2"
-    _autowidth(ws)
-
-    ws = wb.create_sheet("LBO")
+def _lbo_grid(target_ticker: str) -> _Grid:
+    ws = _Grid()
     ws["A1"] = "LBO Module (Starter)"
     ws["A3"] = "Input"
     ws["B3"] = "Value"
@@ -79,10 +171,9 @@ def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataF
     for i, (k, v) in enumerate(inputs, start=4):
         ws[f"A{i}"] = k
         ws[f"B{i}"] = v
-    _style_header(ws, 3)
     ws["D3"] = "Outputs"
     ws["E3"] = "Value"
-    _style_header(ws, 3)
+    ws.header_rows.add(3)
 
     ws["D4"] = "Entry EV"
     ws["D5"] = "Entry Debt"
@@ -95,17 +186,17 @@ def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataF
     ws["D12"] = "Equity IRR"
 
     ws["B4"] = '=IFERROR(INDEX(Comps!$G:$G, MATCH("' + target_ticker + '", Comps!$A:$A, 0)), "")'
-    ws["B4"].number_format = "0.00"
-    ws["B5"].number_format = "0.00"
-    ws["B6"].number_format = "0.00"
-    ws["B7"].number_format = "0.00%"
-    ws["B8"].number_format = "0"
-    ws["B9"].number_format = "0.00"
-    ws["B10"].number_format = "0.00"
-    ws["B11"].number_format = "0.00"
-    ws["B12"].number_format = "0.00"
-    ws["B13"].number_format = "0.00%"
-    ws["B14"].number_format = "0.00%"
+    ws.number_format("B4", "0.00")
+    ws.number_format("B5", "0.00")
+    ws.number_format("B6", "0.00")
+    ws.number_format("B7", "0.00%")
+    ws.number_format("B8", "0")
+    ws.number_format("B9", "0.00")
+    ws.number_format("B10", "0.00")
+    ws.number_format("B11", "0.00")
+    ws.number_format("B12", "0.00")
+    ws.number_format("B13", "0.00%")
+    ws.number_format("B14", "0.00%")
 
     ws["E4"] = "=B4*B5"
     ws["E5"] = "=B4*B6"
@@ -117,11 +208,36 @@ def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataF
     ws["E11"] = "=E10/E6"
     ws["E12"] = '=IFERROR((E11)^(1/B8)-1, "")'
     for rr in range(4, 12):
-        ws[f"E{rr}"].number_format = "0.00"
-    ws["E11"].number_format = "0.00x"
-    ws["E12"].number_format = "0.00%"
-    ws.freeze_panes = "A4"
-    _autowidth(ws)
+        ws.number_format(f"E{rr}", "0.00")
+    ws.number_format("E11", "0.00x")
+    ws.number_format("E12", "0.00%")
+    ws.freeze = "A4"
+    return ws
+
+def build_model_xlsx(out_path: str | Path, target_ticker: str, hist_fy: pd.DataFrame, hist_q: pd.DataFrame, comps: pd.DataFrame, assumptions: dict,
+                     write_only: bool = True):
+    # write_only streams rows straight to the zip instead of building every cell in memory;
+    # write_only=False is the original cell-by-cell path and produces the same workbook content
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    summary = _summary_grid(target_ticker, assumptions)
+    lbo = _lbo_grid(target_ticker)
+
+    if write_only:
+        wb = Workbook(write_only=True)
+        _stream_grid(wb.create_sheet("Summary"), summary)
+        _stream_df(wb.create_sheet("Hist_FY"), hist_fy, "end")
+        _stream_df(wb.create_sheet("Hist_Q"), hist_q, "end")
+        _stream_comps(wb.create_sheet("Comps"), comps)
+        _stream_grid(wb.create_sheet("LBO"), lbo)
+    else:
+        wb = Workbook()
+        wb.remove(wb.active)
+        _fill_grid(wb.create_sheet("Summary"), summary)
+        _write_df(wb.create_sheet("Hist_FY"), hist_fy, "end")
+        _write_df(wb.create_sheet("Hist_Q"), hist_q, "end")
+        _write_comps(wb.create_sheet("Comps"), comps)
+        _fill_grid(wb.create_sheet("LBO"), lbo)
 
     wb.save(out_path)
     return str(out_path)
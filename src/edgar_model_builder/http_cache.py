@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+class OfflineCacheMiss(LookupError):
+    pass
+
+@dataclass
+class CacheEntry:
+    url: str
+    sha256: str
+    size: int
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: float = 0.0
+    accessed_at: float = 0.0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+class PendingBody:
+    def __init__(self, cache: "ResponseCache", url: str, etag: str | None, last_modified: str | None):
+        self.cache, self.url, self.etag, self.last_modified = cache, url, etag, last_modified
+        self._sha = hashlib.sha256()
+        self._z = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._tmp = cache.root / "tmp" / f"{os.getpid()}-{id(self)}.gz"
+        self._tmp.parent.mkdir(parents=True, exist_ok=True)
+        self._fp = self._tmp.open("wb")
+
+    def write(self, chunk: bytes):
+        self._sha.update(chunk)
+        self._fp.write(self._z.compress(chunk))
+
+    def commit(self) -> CacheEntry:
+        self._fp.write(self._z.flush())
+        self._fp.close()
+        sha = self._sha.hexdigest()
+        obj = self.cache._object_path(sha)
+        if obj.exists():
+            self._tmp.unlink(missing_ok=True)
+        else:
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self._tmp, obj)
+            self.cache._grew(obj.stat().st_size)
+        now = time.time()
+        entry = CacheEntry(url=self.url, sha256=sha, size=obj.stat().st_size, etag=self.etag,
+                           last_modified=self.last_modified, fetched_at=now, accessed_at=now)
+        self.cache._save(entry)
+        self.cache.evict()
+        return entry
+
+    def abort(self):
+        self._fp.close()
+        self._tmp.unlink(missing_ok=True)
+
+class ResponseCache:
+    """Content-addressed response store: index/<sha(url)>.json holds validators and points at a
+    gzip-compressed body in objects/<sha(body)>.gz, so identical bodies are stored once."""
+
+    def __init__(self, root: str | Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        # bytes under objects/: summed on the first evict, then kept up to date by writes and deletes.
+        # Other processes sharing the directory only show up at the next walk, which runs when over budget
+        self._total: int | None = None
+
+    def _index_path(self, url: str) -> Path:
+        return self.root / "index" / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _object_path(self, sha: str) -> Path:
+        return self.root / "objects" / sha[:2] / f"{sha}.gz"
+
+    def get(self, url: str) -> CacheEntry | None:
+        p = self._index_path(url)
+        try:
+            entry = CacheEntry(**json.loads(p.read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return None
+        if not self._object_path(entry.sha256).exists():
+            return None
+        return entry
+
+    def _save(self, entry: CacheEntry):
+        _atomic_write(self._index_path(entry.url), json.dumps(asdict(entry)).encode())
+
+    def path(self, entry: CacheEntry) -> Path:
+        return self._object_path(entry.sha256)
+
+    def read(self, entry: CacheEntry) -> bytes:
+        entry.accessed_at = time.time()
+        self._save(entry)
+        return gzip.decompress(self._object_path(entry.sha256).read_bytes())
+
+    def open(self, entry: CacheEntry):
+        entry.accessed_at = time.time()
+        self._save(entry)
+        return gzip.open(self._object_path(entry.sha256), "rb")
+
+    def touch(self, entry: CacheEntry, etag: str | None = None, last_modified: str | None = None):
+        entry.fetched_at = time.time()
+        entry.etag = etag or entry.etag
+        entry.last_modified = last_modified or entry.last_modified
+        self._save(entry)
+
+    def begin(self, url: str, etag: str | None = None, last_modified: str | None = None) -> PendingBody:
+        return PendingBody(self, url, etag, last_modified)
+
+    def put(self, url: str, body: bytes, etag: str | None = None, last_modified: str | None = None) -> CacheEntry:
+        pending = self.begin(url, etag, last_modified)
+        pending.write(body)
+        return pending.commit()
+
+    def export(self, entry: CacheEntry) -> dict:
+        return {**asdict(entry), "body": self._object_path(entry.sha256).read_bytes()}
+
+    def import_(self, blob: dict) -> CacheEntry:
+        blob = dict(blob)
+        body = blob.pop("body")
+        entry = CacheEntry(**blob)
+        obj = self._object_path(entry.sha256)
+        if not obj.exists():
+            _atomic_write(obj, body)
+            self._grew(len(body))
+        entry.accessed_at = time.time()
+        self._save(entry)
+        self.evict()
+        return entry
+
+    def _entries(self) -> list[tuple[Path, CacheEntry]]:
+        out = []
+        for p in (self.root / "index").glob("*.json"):
+            try:
+                out.append((p, CacheEntry(**json.loads(p.read_text(encoding="utf-8")))))
+            except (OSError, ValueError, TypeError):
+                p.unlink(missing_ok=True)
+        return out
+
+    def _grew(self, n: int):
+        if self._total is not None:
+            self._total += n
+
+    def _walk(self) -> tuple[dict[str, Path], dict[str, int]]:
+        objects = {p.stem: p for p in (self.root / "objects").glob("*/*.gz")}
+        return objects, {sha: p.stat().st_size for sha, p in objects.items()}
+
+    def evict(self):
+        if self._total is None:
+            self._total = sum(self._walk()[1].values())
+        if self._total <= self.max_bytes:
+            return
+        # over budget: walk the tree for the real sizes, which also picks up other writers
+        objects, sizes = self._walk()
+        total = sum(sizes.values())
+        entries = sorted(self._entries(), key=lambda e: e[1].accessed_at)
+        refs: dict[str, int] = {}
+        for _, e in entries:
+            refs[e.sha256] = refs.get(e.sha256, 0) + 1
+        for sha in set(objects) - set(refs):
+            objects[sha].unlink(missing_ok=True)
+            total -= sizes[sha]
+        for p, e in entries:
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            refs[e.sha256] -= 1
+            if refs[e.sha256] == 0 and e.sha256 in objects:
+                objects[e.sha256].unlink(missing_ok=True)
+                total -= sizes[e.sha256]
+        self._total = total
@@ -1,7 +1,42 @@
+import asyncio
+import json
+import re
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
+from types import SimpleNamespace
+from typing import BinaryIO, Iterable, Iterator
+import ijson
+from sqlalchemy import and_, bindparam, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
-from .db import SessionLocal
-from .models import Company, Fact
+from .db import AsyncSessionLocal, SessionLocal, async_database
+from .models import FORM_CLASSES, Company, Fact, FactLatest, IngestState, form_class
+from .settings import settings
+
+BATCH_SIZE = 1000
+FACT_KEY = ("cik", "taxonomy", "tag", "unit", "end", "accn")
+LATEST_KEY = ("cik", "taxonomy", "tag", "form_class", "end", "unit")
+NO_FILED = datetime(1900, 1, 1)
+
+# (taxonomy, tag, unit, start, end, fy, fp, form, filed, accn, frame, val) as found in companyfacts
+FactRow = tuple
+# (taxonomy, tag) pairs to keep; None keeps everything
+TagFilter = frozenset[tuple[str, str]] | None
+
+@dataclass
+class LoadResult:
+    inserted: int = 0
+    skipped: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.skipped
+
+    def __iadd__(self, other: "LoadResult"):
+        self.inserted += other.inserted
+        self.skipped += other.skipped
+        return self
 
 def upsert_company(cik: int, ticker: str, name: str):
     s = SessionLocal()
@@ -16,42 +51,488 @@ def upsert_company(cik: int, ticker: str, name: str):
         s.commit()
     finally:
         s.close()
+    from .query import ticker_index
+    ticker_index.invalidate()
+
+@dataclass
+class TickerSync:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # companies whose ticker went to another CIK and that got no new one
+    parked: int = 0
+
+def parked_ticker(cik: int) -> str:
+    # unique per CIK and never a real ticker, so it can hold a released ticker's place
+    return f"#{cik}"
+
+async def sync_companies(rows: Iterable[tuple[int, str, str]], session=None) -> TickerSync:
+    # Diffs (cik, ticker, name) rows against the companies table and applies them in one transaction.
+    # tickers are unique, so any company holding a ticker that now belongs to another CIK is first
+    # parked on a placeholder; swaps and reassignments then never collide mid-transaction.
+    # The first row wins when a CIK or ticker repeats (company_tickers.json lists share classes separately).
+    desired: dict[int, tuple[str, str]] = {}
+    claimed: dict[str, int] = {}
+    for cik, ticker, name in rows:
+        ticker = ticker.upper()
+        if cik in desired or ticker in claimed:
+            continue
+        desired[cik] = (ticker, name)
+        claimed[ticker] = cik
+    result = TickerSync()
+    async with async_database():
+        s = session or AsyncSessionLocal()
+        try:
+            existing = {cik: (ticker, name) for cik, ticker, name
+                        in (await s.execute(select(Company.cik, Company.ticker, Company.name))).all()}
+            park = [{"cik": cik, "ticker": parked_ticker(cik)} for cik, (ticker, _) in existing.items()
+                    if claimed.get(ticker, cik) != cik]
+            updates, inserts = [], []
+            for cik, (ticker, name) in desired.items():
+                if cik not in existing:
+                    inserts.append({"cik": cik, "ticker": ticker, "name": name})
+                elif existing[cik] != (ticker, name):
+                    updates.append({"cik": cik, "ticker": ticker, "name": name})
+                else:
+                    result.unchanged += 1
+            if park:
+                await s.execute(update(Company), park)
+            if updates:
+                await s.execute(update(Company), updates)
+            if inserts:
+                await s.execute(insert(Company), inserts)
+            await s.commit()
+        except Exception:
+            await s.rollback()
+            raise
+        finally:
+            if session is None:
+                await s.close()
+    from .query import ticker_index
+    ticker_index.invalidate()
+    result.inserted, result.updated = len(inserts), len(updates)
+    result.parked = sum(1 for p in park if p["cik"] not in desired)
+    return result
 
 def parse_dt(x: str | None):
     if not x:
         return None
     return datetime.fromisoformat(x)
 
-def ingest_companyfacts(cik: int, companyfacts: dict):
+def flatten_companyfacts(companyfacts: dict, tags: TagFilter = None) -> Iterator[FactRow]:
+    for taxonomy, by_tag in companyfacts.get("facts", {}).items():
+        for tag, payload in by_tag.items():
+            if tags is not None and (taxonomy, tag) not in tags:
+                continue
+            for unit, rows in payload.get("units", {}).items():
+                for r in rows:
+                    yield (
+                        taxonomy, tag, unit,
+                        r.get("start"), r.get("end"), r.get("fy"), r.get("fp"), r.get("form"),
+                        r.get("filed"), r.get("accn"), r.get("frame"), r.get("val"),
+                    )
+
+_FACT_FIELDS = ("start", "end", "fy", "fp", "form", "filed", "accn", "frame", "val")
+
+def iter_companyfacts(fp: BinaryIO, tags: TagFilter = None) -> Iterator[FactRow]:
+    # Incremental equivalent of flatten_companyfacts(json.load(fp)): only the row being parsed is
+    # held in memory. Nesting depth identifies the position in facts.<taxonomy>.<tag>.units.<unit>[].
+    keys: list = [None] * 8
+    depth = 0
+    row = None
+    field = None
+    for event, value in ijson.basic_parse(fp, use_float=True):
+        if event == "map_key":
+            if row is not None:
+                field = value
+            elif depth < len(keys):
+                keys[depth] = value
+        elif event == "start_map" or event == "start_array":
+            depth += 1
+            if (depth == 7 and event == "start_map" and keys[1] == "facts" and keys[4] == "units"
+                    and (tags is None or (keys[2], keys[3]) in tags)):
+                row = {}
+        elif event == "end_map" or event == "end_array":
+            if row is not None and depth == 7:
+                yield (keys[2], keys[3], keys[5], *(row.get(f) for f in _FACT_FIELDS))
+                row = None
+            depth -= 1
+        elif row is not None and depth == 7:
+            row[field] = value
+
+FRAME_RE = re.compile(r"CY(\d{4})(?:Q([1-4]))?(I)?")
+
+def frame_period(period: str) -> str:
+    # CY2023 is an annual duration, CY2023Q2 a quarter, CY2023Q4I the balance at the end of Q4
+    m = FRAME_RE.fullmatch(period)
+    if not m or (m.group(3) and not m.group(2)):
+        raise ValueError(f"Unsupported frames period: {period}")
+    return period
+
+def iter_frame(fp: BinaryIO, taxonomy: str, tag: str, unit: str, period: str) -> Iterator[tuple[int, FactRow]]:
+    # one /api/xbrl/frames document: the latest-filed value of every filer for one period. Calendar
+    # periods say nothing about the filer's fiscal year (a September year end files its Dec-31
+    # balance in a 10-Q), so form and fiscal period stay NULL and the rows stay out of fact_latest
+    # until the form is known (see aresolve_frame_forms, or a companyfacts ingest of the filing)
+    frame_period(period)
+    for d in ijson.items(fp, "data.item", use_float=True):
+        yield int(d["cik"]), (taxonomy, tag, unit, d.get("start"), d.get("end"), None, None, None,
+                              None, d.get("accn"), period, d.get("val"))
+
+def _fact_values(cik: int, row: FactRow) -> dict:
+    taxonomy, tag, unit, start, end, fy, fp, form, filed, accn, frame, val = row
+    if not end:
+        raise ValueError("fact without end date")
+    return {
+        "cik": cik,
+        "taxonomy": taxonomy,
+        "tag": tag,
+        "unit": unit,
+        "start": parse_dt(start),
+        "end": parse_dt(end),
+        "fy": fy,
+        "fp": fp,
+        "form": form,
+        "filed": parse_dt(filed),
+        "accn": accn,
+        "frame": frame,
+        "val": float(val) if val is not None else None,
+    }
+
+# dialects with INSERT .. ON CONFLICT and RETURNING; the others take the per-row paths below
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _dialect_insert(dialect: str, table):
+    return _UPSERT_DIALECTS[dialect](table)
+
+_RETURNED = (Fact.id, Fact.cik, Fact.taxonomy, Fact.tag, Fact.unit, Fact.end, Fact.form, Fact.filed, Fact.val, Fact.accn)
+
+def _insert_ignore(dialect: str):
+    # RETURNING only yields rows that were actually written, which gives exact inserted counts
+    # while letting SQLAlchemy batch the executemany into multi-row VALUES statements
+    return _dialect_insert(dialect, Fact).on_conflict_do_nothing(index_elements=list(FACT_KEY)).returning(*_RETURNED)
+
+# fact_latest keeps the latest filing per key; a filing-date tie goes to the fact stored first, as
+# the statement histories always picked it
+def _latest_rank(r) -> tuple:
+    return (r.filed or NO_FILED, -r.id)
+
+def _upsert_latest(dialect: str):
+    stmt = _dialect_insert(dialect, FactLatest)
+    ex = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=list(LATEST_KEY),
+        set_={c: ex[c] for c in ("val", "filed", "form", "accn", "fact_id")},
+        where=or_(ex.filed > FactLatest.filed, and_(ex.filed == FactLatest.filed, ex.fact_id < FactLatest.fact_id)),
+    )
+
+def _latest_candidates(written) -> list[dict]:
+    best: dict[tuple, tuple[tuple, dict]] = {}
+    for r in written:
+        cls = form_class(r.form)
+        if cls is None or r.val is None:
+            continue
+        key = (r.cik, r.taxonomy, r.tag, cls, r.end, r.unit)
+        cur = best.get(key)
+        if cur is None or _latest_rank(r) > cur[0]:
+            best[key] = (_latest_rank(r), {
+                "cik": r.cik, "taxonomy": r.taxonomy, "tag": r.tag, "form_class": cls, "end": r.end,
+                "unit": r.unit, "val": r.val, "filed": r.filed or NO_FILED, "form": r.form, "accn": r.accn,
+                "fact_id": r.id,
+            })
+    return [row for _, row in best.values()]
+
+def _insert_rows(conn, table, values: list[dict]) -> list:
+    # one plain INSERT per row, each in a savepoint so a unique violation only skips that row
+    written = []
+    for v in values:
+        try:
+            with conn.begin_nested():
+                pk = conn.execute(insert(table).values(v)).inserted_primary_key
+        except IntegrityError:
+            continue
+        written.append(SimpleNamespace(id=pk[0], **v))
+    return written
+
+def _upsert_rows(conn, table, key: tuple[str, ...], values: list[dict], newer=None) -> None:
+    # update the row in place (if newer(v) allows it), else insert it; an insert that hits the
+    # unique key means the stored row exists and wins
+    for v in values:
+        where = [getattr(table, k) == v[k] for k in key]
+        if newer is not None:
+            where.append(newer(v))
+        if conn.execute(update(table).where(*where).values({c: x for c, x in v.items() if c not in key})).rowcount:
+            continue
+        _insert_rows(conn, table, [v])
+
+def _newer_latest(v: dict):
+    # _upsert_latest's condition for one candidate row
+    return or_(FactLatest.filed < v["filed"],
+               and_(FactLatest.filed == v["filed"], FactLatest.fact_id > v["fact_id"]))
+
+def write_facts(conn, values: list[dict]) -> list:
+    # inserts the rows that are not stored yet and returns them (with their ids)
+    if conn.dialect.name in _UPSERT_DIALECTS:
+        return conn.execute(_insert_ignore(conn.dialect.name), values).all()
+    return _insert_rows(conn, Fact, values)
+
+def update_latest(conn, written) -> None:
+    candidates = _latest_candidates(written)
+    if not candidates:
+        return
+    if conn.dialect.name in _UPSERT_DIALECTS:
+        conn.execute(_upsert_latest(conn.dialect.name), candidates)
+    else:
+        _upsert_rows(conn, FactLatest, LATEST_KEY, candidates, _newer_latest)
+
+def write_state(conn, state: dict) -> None:
+    if conn.dialect.name in _UPSERT_DIALECTS:
+        conn.execute(_upsert_state(conn.dialect.name), state)
+    else:
+        _upsert_rows(conn, IngestState, ("cik",), [state])
+
+def _rebuild_latest_stmts(cik: int | None):
+    filed = func.coalesce(Fact.filed, literal(NO_FILED))
+    cls = case(*((Fact.form.in_(forms), literal(c)) for c, forms in FORM_CLASSES.items()))
+    rn = func.row_number().over(
+        partition_by=[Fact.cik, Fact.taxonomy, Fact.tag, cls, Fact.end, Fact.unit],
+        order_by=[filed.desc(), Fact.id],
+    )
+    all_forms = [f for forms in FORM_CLASSES.values() for f in forms]
+    ranked = select(
+        Fact.cik, Fact.taxonomy, Fact.tag, cls.label("form_class"), Fact.end, Fact.unit, Fact.val,
+        filed.label("filed"), Fact.form, Fact.accn, Fact.id.label("fact_id"), rn.label("rn"),
+    ).where(Fact.val.is_not(None), Fact.form.in_(all_forms))
+    clear = delete(FactLatest)
+    if cik is not None:
+        ranked = ranked.where(Fact.cik == cik)
+        clear = clear.where(FactLatest.cik == cik)
+    ranked = ranked.subquery()
+    cols = [c for c in ranked.c if c.name != "rn"]
+    return clear, insert(FactLatest).from_select([c.name for c in cols], select(*cols).where(ranked.c.rn == 1))
+
+def rebuild_latest(cik: int | None = None) -> int:
     s = SessionLocal()
     try:
-        facts = companyfacts.get("facts", {})
-        for taxonomy, tags in facts.items():
-            for tag, payload in tags.items():
-                units = payload.get("units", {})
-                for unit, rows in units.items():
-                    for r in rows:
-                        val = r.get("val")
-                        try:
-                            f = Fact(
-                                cik=cik,
-                                taxonomy=taxonomy,
-                                tag=tag,
-                                unit=unit,
-                                start=parse_dt(r.get("start")),
-                                end=parse_dt(r["end"]),
-                                fy=r.get("fy"),
-                                fp=r.get("fp"),
-                                form=r.get("form"),
-                                filed=parse_dt(r.get("filed")),
-                                accn=r.get("accn"),
-                                frame=r.get("frame"),
-                                val=float(val) if val is not None else None,
-                            )
-                            s.add(f)
-                            s.flush()
-                        except (IntegrityError, ValueError, TypeError):
-                            s.rollback()
+        for stmt in _rebuild_latest_stmts(cik):
+            s.execute(stmt)
+        count = select(func.count()).select_from(FactLatest)
+        if cik is not None:
+            count = count.where(FactLatest.cik == cik)
+        n = s.execute(count).scalar_one()
         s.commit()
     finally:
         s.close()
+    from . import snapshots
+    snapshots.facts_changed(cik)
+    return n
+
+def slim_tags(mapping) -> TagFilter:
+    return mapping.tags if mapping is not None and settings.slim_ingest else None
+
+def ingest_state(cik: int, mapping, tags: TagFilter) -> dict:
+    return {
+        "cik": cik,
+        "mapping_digest": mapping.digest if mapping is not None else None,
+        "tags": json.dumps(sorted(f"{t[0]}/{t[1]}" for t in tags)) if tags is not None else None,
+        "updated_at": datetime.now(),
+    }
+
+def state_tags(state: IngestState | None) -> TagFilter:
+    if state is None or state.tags is None:
+        return None
+    return frozenset(tuple(t.split("/", 1)) for t in json.loads(state.tags))
+
+def _upsert_state(dialect: str):
+    stmt = _dialect_insert(dialect, IngestState)
+    return stmt.on_conflict_do_update(
+        index_elements=["cik"], set_={c: stmt.excluded[c] for c in ("mapping_digest", "tags", "updated_at")},
+    )
+
+def _batched(rows: Iterable, n: int):
+    it = iter(rows)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def _batch_values(cik: int, batch: list[FactRow], result: LoadResult) -> list[dict]:
+    values = []
+    for row in batch:
+        try:
+            values.append(_fact_values(cik, row))
+        except (ValueError, TypeError):
+            result.skipped += 1
+    return values
+
+_UPGRADED = ("start", "fy", "fp", "form", "filed", "frame")
+
+def _unfiled_keys(cik: int):
+    # facts loaded from frames (see iter_frame) carry no filing date or form of their own
+    return select(*(getattr(Fact, k) for k in FACT_KEY)).where(
+        Fact.cik == cik, Fact.filed.is_(None), Fact.accn.is_not(None))
+
+def _fact_key(v: dict) -> tuple:
+    return tuple(v[k] for k in FACT_KEY)
+
+def _upgrades(values: list[dict], unfiled: set) -> list[dict]:
+    # the same fact seen again in companyfacts brings its filing date and form
+    out = []
+    for v in values:
+        if v["filed"] is not None and _fact_key(v) in unfiled:
+            unfiled.discard(_fact_key(v))
+            out.append({f"b_{k}": v[k] for k in (*FACT_KEY, *_UPGRADED)})
+    return out
+
+def _upgrade_unfiled():
+    return (
+        update(Fact)
+        .where(*(getattr(Fact, k) == bindparam(f"b_{k}") for k in FACT_KEY), Fact.filed.is_(None))
+        .values({k: bindparam(f"b_{k}") for k in _UPGRADED})
+    )
+
+def load_facts(cik: int, rows: Iterable[FactRow], batch_size: int = BATCH_SIZE, state: dict | None = None) -> LoadResult:
+    # `state` (see ingest_state) is recorded in the same transaction as the facts it describes
+    result = LoadResult()
+    s = SessionLocal()
+    try:
+        conn = s.connection()
+        unfiled = {tuple(r) for r in conn.execute(_unfiled_keys(cik))}
+        upgraded = 0
+        for batch in _batched(rows, batch_size):
+            values = _batch_values(cik, batch, result)
+            if not values:
+                continue
+            written = write_facts(conn, values)
+            update_latest(conn, written)
+            result.inserted += len(written)
+            result.skipped += len(values) - len(written)
+            if unfiled and (upgrades := _upgrades(values, unfiled)):
+                conn.execute(_upgrade_unfiled(), upgrades)
+                upgraded += len(upgrades)
+        if upgraded:
+            for stmt in _rebuild_latest_stmts(cik):
+                conn.execute(stmt)
+        if state is not None:
+            write_state(conn, state)
+        s.commit()
+    finally:
+        s.close()
+    if result.inserted or upgraded:
+        from . import snapshots
+        snapshots.facts_changed(cik)
+    return result
+
+async def aload_facts(cik: int, rows: Iterable[FactRow], batch_size: int = BATCH_SIZE, session=None,
+                      state: dict | None = None) -> LoadResult:
+    # async counterpart of load_facts: batches are parsed in a worker thread and written without
+    # blocking the event loop, so fetches keep running while the database works
+    result = LoadResult()
+    batches = _batched(rows, batch_size)
+    async with async_database():
+        s = session or AsyncSessionLocal()
+        try:
+            conn = await s.connection()
+            unfiled = {tuple(r) for r in await conn.execute(_unfiled_keys(cik))}
+            upgraded = 0
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                values = _batch_values(cik, batch, result)
+                if not values:
+                    continue
+                written = await conn.run_sync(write_facts, values)
+                await conn.run_sync(update_latest, written)
+                result.inserted += len(written)
+                result.skipped += len(values) - len(written)
+                if unfiled and (upgrades := _upgrades(values, unfiled)):
+                    await conn.execute(_upgrade_unfiled(), upgrades)
+                    upgraded += len(upgrades)
+            if upgraded:
+                for stmt in _rebuild_latest_stmts(cik):
+                    await conn.execute(stmt)
+            if state is not None:
+                await conn.run_sync(write_state, state)
+            await s.commit()
+        except Exception:
+            await s.rollback()
+            raise
+        finally:
+            if session is None:
+                await s.close()
+    if result.inserted or upgraded:
+        from . import snapshots
+        await asyncio.to_thread(snapshots.facts_changed, cik)
+    return result
+
+async def aload_frame(rows: Iterable[tuple[int, FactRow]], batch_size: int = BATCH_SIZE, session=None) -> LoadResult:
+    # (cik, row) pairs across many filers. The rows have no form yet, so fact_latest is left alone;
+    # without a filing date, any fact from a companyfacts ingest ranks above them once they get one,
+    # and the same fact arriving through companyfacts replaces their metadata (see _upgrades)
+    result = LoadResult()
+    batches = _batched(rows, batch_size)
+    async with async_database():
+        s = session or AsyncSessionLocal()
+        try:
+            conn = await s.connection()
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                values = []
+                for cik, row in batch:
+                    try:
+                        values.append(_fact_values(cik, row))
+                    except (ValueError, TypeError):
+                        result.skipped += 1
+                if not values:
+                    continue
+                written = await conn.run_sync(write_facts, values)
+                result.inserted += len(written)
+                result.skipped += len(values) - len(written)
+            await s.commit()
+        except Exception:
+            await s.rollback()
+            raise
+        finally:
+            if session is None:
+                await s.close()
+    return result
+
+def _formless_frame_accns():
+    return select(Fact.cik, Fact.accn).distinct().where(
+        Fact.form.is_(None), Fact.filed.is_(None), Fact.accn.is_not(None), Fact.frame.is_not(None))
+
+async def aformless_frame_accns(session) -> dict[int, set[str]]:
+    # accession numbers of frames rows still waiting for a form, by CIK
+    out: dict[int, set[str]] = {}
+    for cik, accn in (await session.execute(_formless_frame_accns())).all():
+        out.setdefault(cik, set()).add(accn)
+    return out
+
+async def aresolve_frame_forms(forms: dict[int, dict[str, str]], session) -> int:
+    # forms: cik -> {accn: form} as listed in the filer's submissions; sets the form of that filing's
+    # frames rows and rebuilds fact_latest for those CIKs. Returns the number of filings resolved
+    params = [{"b_cik": cik, "b_accn": a, "b_form": f} for cik, by_accn in forms.items() for a, f in by_accn.items()]
+    if not params:
+        return 0
+    conn = await session.connection()
+    stmt = (update(Fact)
+            .where(Fact.cik == bindparam("b_cik"), Fact.accn == bindparam("b_accn"), Fact.form.is_(None))
+            .values(form=bindparam("b_form")))
+    await conn.execute(stmt, params)
+    for cik in forms:
+        for stmt in _rebuild_latest_stmts(cik):
+            await conn.execute(stmt)
+    await session.commit()
+    from . import snapshots
+    for cik in forms:
+        await asyncio.to_thread(snapshots.facts_changed, cik)
+    return len(params)
+
+def ingest_companyfacts(cik: int, companyfacts: dict, mapping=None) -> LoadResult:
+    # with SLIM_INGEST=1 and a mapping, only the mapping's tags are stored
+    tags = slim_tags(mapping)
+    return load_facts(cik, flatten_companyfacts(companyfacts, tags), state=ingest_state(cik, mapping, tags))
+
+def ingest_companyfacts_stream(cik: int, fp: BinaryIO, batch_size: int = BATCH_SIZE, mapping=None) -> LoadResult:
+    tags = slim_tags(mapping)
+    return load_facts(cik, iter_companyfacts(fp, tags), batch_size, ingest_state(cik, mapping, tags))
+
+async def aingest_companyfacts_stream(cik: int, fp: BinaryIO, batch_size: int = BATCH_SIZE, session=None,
+                                      mapping=None) -> LoadResult:
+    tags = slim_tags(mapping)
+    return await aload_facts(cik, iter_companyfacts(fp, tags), batch_size, session, ingest_state(cik, mapping, tags))
@@ -0,0 +1,484 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from .metrics import inc
+from .settings import settings
+
+try:
+    import redis
+except ImportError:  # optional: pip install edgar-model-builder[redis]
+    redis = None
+
+MAX_BACKOFF = 300.0
+OPEN = ("queued", "active")  # states a job leaves only by finishing, failing for good or timing out
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    key: str | None = None
+    # queued -> active -> done | queued (retry) | dead (attempts used up)
+    status: str = "queued"
+    attempts: int = 0
+    max_attempts: int = 3
+    error: str | None = None
+    worker: str | None = None
+    lease: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+class NotReady(Exception):
+    # raised by a handler whose inputs are still being produced; the job goes back on the
+    # queue after `delay` seconds without using up an attempt
+    def __init__(self, reason: str = "", delay: float = 5.0):
+        super().__init__(reason)
+        self.delay = delay
+
+class InMemoryQueue:
+    # one process only (tests, single-node runs); the clock is injectable so visibility
+    # timeouts and retry delays can be tested without sleeping
+    def __init__(self, clock=time.time, key_ttl: float | None = None):
+        self.clock = clock
+        self.key_ttl = key_ttl or settings.job_key_ttl
+        self._lock = threading.Lock()
+        self._jobs: dict[str, Job] = {}
+        self._pending: deque[str] = deque()
+        self._delayed: dict[str, float] = {}
+        self._inflight: dict[str, float] = {}
+        self._keys: dict[str, tuple[str, float]] = {}
+        self._counts: Counter = Counter()
+
+    def enqueue(self, kind: str, payload: dict, key: str | None = None, max_attempts: int | None = None,
+                delay: float = 0.0) -> tuple[Job, bool]:
+        with self._lock:
+            now = self.clock()
+            if key:
+                held = self._keys.get(key)
+                if held and held[1] > now and held[0] in self._jobs:
+                    return replace(self._jobs[held[0]]), False
+            job = Job(uuid.uuid4().hex, kind, payload, key, max_attempts=max_attempts or settings.job_max_attempts,
+                      created_at=now, updated_at=now)
+            self._jobs[job.id] = job
+            if key:
+                self._keys[key] = (job.id, now + self.key_ttl)
+            if delay > 0:
+                self._delayed[job.id] = now + delay
+            else:
+                self._pending.append(job.id)
+            return replace(job), True
+
+    def claim(self, worker: str, visibility: float | None = None) -> Job | None:
+        with self._lock:
+            now = self.clock()
+            for id, deadline in list(self._inflight.items()):
+                if deadline <= now:
+                    # the worker died or stalled: retry, or give up if that was the last attempt
+                    del self._inflight[id]
+                    job = self._jobs[id]
+                    self._settle(job, "dead" if job.attempts >= job.max_attempts else "queued", "visibility timeout", 0, now)
+            for id, due in list(self._delayed.items()):
+                if due <= now:
+                    del self._delayed[id]
+                    self._pending.append(id)
+            if not self._pending:
+                return None
+            job = self._jobs[self._pending.popleft()]
+            job.attempts += 1
+            job.status, job.worker, job.lease, job.updated_at = "active", worker, uuid.uuid4().hex, now
+            self._inflight[job.id] = now + (visibility or settings.job_visibility)
+            return replace(job)
+
+    def _settle(self, job: Job, status: str, error: str | None, delay: float, now: float) -> None:
+        job.status, job.lease, job.updated_at = status, None, now
+        if error:
+            job.error = error
+        if status == "queued":
+            self._delayed[job.id] = now + delay
+            return
+        self._counts[status] += 1
+        if status == "dead" and job.key and self._keys.get(job.key, ("",))[0] == job.id:
+            del self._keys[job.key]  # let a later enqueue try again
+
+    def _finish(self, job: Job, op: str, error: str | None = None, delay: float = 0.0) -> str | None:
+        with self._lock:
+            cur = self._jobs.get(job.id)
+            if cur is None or not job.lease or cur.lease != job.lease:
+                return None  # the lease expired and the job was handed to someone else
+            now = self.clock()
+            if op == "extend":
+                self._inflight[job.id] = now + delay
+                return "active"
+            del self._inflight[job.id]
+            if op == "release":
+                cur.attempts -= 1
+                status = "queued"
+            elif op == "fail":
+                status = "dead" if cur.attempts >= cur.max_attempts else "queued"
+            else:
+                status = "done"
+            self._settle(cur, status, error, delay, now)
+            return status
+
+    def ack(self, job: Job) -> str | None:
+        return self._finish(job, "done")
+
+    def fail(self, job: Job, error: str, retry_in: float = 0.0) -> str | None:
+        return self._finish(job, "fail", error, retry_in)
+
+    def release(self, job: Job, delay: float = 0.0) -> str | None:
+        return self._finish(job, "release", None, delay)
+
+    def extend(self, job: Job, visibility: float | None = None) -> str | None:
+        return self._finish(job, "extend", None, visibility or settings.job_visibility)
+
+    def get(self, id: str) -> Job | None:
+        with self._lock:
+            job = self._jobs.get(id)
+            return replace(job) if job else None
+
+    def key_job(self, key: str) -> Job | None:
+        # the job holding an idempotency key, while the key lasts
+        with self._lock:
+            held = self._keys.get(key)
+            if held and held[1] > self.clock() and held[0] in self._jobs:
+                return replace(self._jobs[held[0]])
+            return None
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._pending), "delayed": len(self._delayed), "active": len(self._inflight),
+                    "done": self._counts["done"], "dead": self._counts["dead"]}
+
+    def jobs(self, limit: int = 20) -> list[Job]:
+        with self._lock:
+            return [replace(j) for j in list(self._jobs.values())[::-1][:limit]]
+
+# both scripts run on Redis' clock so workers on hosts with skewed clocks agree on deadlines.
+# KEYS: pending, delayed, inflight; ARGV: key prefix, visibility, worker, lease, job ttl
+_CLAIM = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local p = ARGV[1]
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)) do
+  redis.call('ZREM', KEYS[3], id)
+  local jk = p .. 'job:' .. id
+  if tonumber(redis.call('HGET', jk, 'attempts')) >= tonumber(redis.call('HGET', jk, 'max_attempts')) then
+    redis.call('HSET', jk, 'status', 'dead', 'lease', '', 'error', 'visibility timeout', 'updated_at', tostring(now))
+    redis.call('HINCRBY', p .. 'counts', 'dead', 1)
+    redis.call('EXPIRE', jk, tonumber(ARGV[5]))
+    local key = redis.call('HGET', jk, 'key')
+    if key and key ~= '' and redis.call('GET', p .. 'key:' .. key) == id then redis.call('DEL', p .. 'key:' .. key) end
+  else
+    redis.call('HSET', jk, 'status', 'queued', 'lease', '', 'error', 'visibility timeout', 'updated_at', tostring(now))
+    redis.call('LPUSH', KEYS[1], id)
+  end
+end
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+  redis.call('ZREM', KEYS[2], id)
+  redis.call('LPUSH', KEYS[1], id)
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then return false end
+local jk = p .. 'job:' .. id
+redis.call('HINCRBY', jk, 'attempts', 1)
+redis.call('HSET', jk, 'status', 'active', 'worker', ARGV[3], 'lease', ARGV[4], 'updated_at', tostring(now))
+redis.call('ZADD', KEYS[3], now + tonumber(ARGV[2]), id)
+return id
+"""
+
+# KEYS: job, inflight, delayed, idempotency key, counts; ARGV: id, lease, op, error, delay, job ttl
+_FINISH = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local jk, id, op = KEYS[1], ARGV[1], ARGV[3]
+if redis.call('HGET', jk, 'lease') ~= ARGV[2] or ARGV[2] == '' then return false end
+if op == 'extend' then
+  redis.call('ZADD', KEYS[2], now + tonumber(ARGV[5]), id)
+  return 'active'
+end
+redis.call('ZREM', KEYS[2], id)
+local status = 'done'
+if op == 'release' then
+  redis.call('HINCRBY', jk, 'attempts', -1)
+  status = 'queued'
+elseif op == 'fail' then
+  status = 'queued'
+  if tonumber(redis.call('HGET', jk, 'attempts')) >= tonumber(redis.call('HGET', jk, 'max_attempts')) then status = 'dead' end
+end
+redis.call('HSET', jk, 'status', status, 'lease', '', 'updated_at', tostring(now))
+if ARGV[4] ~= '' then redis.call('HSET', jk, 'error', ARGV[4]) end
+if status == 'queued' then
+  redis.call('ZADD', KEYS[3], now + tonumber(ARGV[5]), id)
+  return status
+end
+redis.call('HINCRBY', KEYS[5], status, 1)
+redis.call('EXPIRE', jk, tonumber(ARGV[6]))
+if status == 'dead' and redis.call('GET', KEYS[4]) == id then redis.call('DEL', KEYS[4]) end
+return status
+"""
+
+# idempotency check, job hash and queue push in one step, so no enqueuer sees a key without its job
+# and a crash can't leave one behind. KEYS: job, pending, delayed, recent, idempotency key (or '');
+# ARGV: key prefix, id, key ttl, delay, created_at, then the hash's field/value pairs
+_ENQUEUE = """
+local p, id = ARGV[1], ARGV[2]
+if KEYS[5] ~= '' then
+  local held = redis.call('GET', KEYS[5])
+  if held and redis.call('EXISTS', p .. 'job:' .. held) == 1 then return held end
+  redis.call('SET', KEYS[5], id, 'EX', tonumber(ARGV[3]))
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 6))
+local delay = tonumber(ARGV[4])
+if delay > 0 then
+  local t = redis.call('TIME')
+  redis.call('ZADD', KEYS[3], tonumber(t[1]) + tonumber(t[2]) / 1000000 + delay, id)
+else
+  redis.call('LPUSH', KEYS[2], id)
+end
+redis.call('ZADD', KEYS[4], ARGV[5], id)
+redis.call('ZREMRANGEBYRANK', KEYS[4], 0, -1001)
+return id
+"""
+
+def _decode(v) -> str:
+    return v.decode() if isinstance(v, bytes) else v
+
+class RedisQueue:
+    # jobs are hashes under `prefix`job:<id>; ids move between a pending list, a delayed zset (due
+    # time) and an inflight zset (lease deadline). Idempotency keys are SET NX with a TTL, so a
+    # (ticker, accn) that was already processed is not queued again until the key expires
+    def __init__(self, url: str | None = None, client=None, prefix: str = "edgar:jobs:", key_ttl: float | None = None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("redis is not installed (pip install edgar-model-builder[redis])")
+            client = redis.Redis.from_url(url or settings.redis_url)
+        self.client = client
+        self.prefix = prefix
+        self.key_ttl = int(key_ttl or settings.job_key_ttl)
+        self._claim = client.register_script(_CLAIM)
+        self._enqueue = client.register_script(_ENQUEUE)
+        self._finish_script = client.register_script(_FINISH)
+
+    def _k(self, name: str) -> str:
+        return self.prefix + name
+
+    def enqueue(self, kind: str, payload: dict, key: str | None = None, max_attempts: int | None = None,
+                delay: float = 0.0) -> tuple[Job, bool]:
+        while True:
+            job = Job(uuid.uuid4().hex, kind, payload, key, max_attempts=max_attempts or settings.job_max_attempts)
+            fields = {"id": job.id, "kind": kind, "payload": json.dumps(payload), "key": key or "", "status": "queued",
+                      "attempts": 0, "max_attempts": job.max_attempts, "error": "", "worker": "", "lease": "",
+                      "created_at": job.created_at, "updated_at": job.updated_at}
+            held = _decode(self._enqueue(
+                keys=[self._k("job:" + job.id), self._k("pending"), self._k("delayed"), self._k("recent"),
+                      self._k("key:" + key) if key else ""],
+                args=[self.prefix, job.id, self.key_ttl, delay, job.created_at,
+                      *(x for kv in fields.items() for x in kv)]))
+            if held == job.id:
+                return job, True
+            existing = self.get(held)
+            if existing:
+                return existing, False
+            # the job holding the key expired since the script looked; try again
+
+    def claim(self, worker: str, visibility: float | None = None) -> Job | None:
+        id = self._claim(keys=[self._k("pending"), self._k("delayed"), self._k("inflight")],
+                         args=[self.prefix, visibility or settings.job_visibility, worker, uuid.uuid4().hex, self.key_ttl])
+        return self.get(_decode(id)) if id else None
+
+    def _finish(self, job: Job, op: str, error: str | None = None, delay: float = 0.0) -> str | None:
+        status = self._finish_script(
+            keys=[self._k("job:" + job.id), self._k("inflight"), self._k("delayed"),
+                  self._k("key:" + (job.key or "")), self._k("counts")],
+            args=[job.id, job.lease or "", op, error or "", delay, self.key_ttl])
+        return _decode(status) if status else None
+
+    def ack(self, job: Job) -> str | None:
+        return self._finish(job, "done")
+
+    def fail(self, job: Job, error: str, retry_in: float = 0.0) -> str | None:
+        return self._finish(job, "fail", error, retry_in)
+
+    def release(self, job: Job, delay: float = 0.0) -> str | None:
+        return self._finish(job, "release", None, delay)
+
+    def extend(self, job: Job, visibility: float | None = None) -> str | None:
+        return self._finish(job, "extend", None, visibility or settings.job_visibility)
+
+    def get(self, id: str) -> Job | None:
+        h = {_decode(k): _decode(v) for k, v in self.client.hgetall(self._k("job:" + id)).items()}
+        if not h:
+            return None
+        return Job(h["id"], h["kind"], json.loads(h["payload"]), h["key"] or None, h["status"], int(h["attempts"]),
+                   int(h["max_attempts"]), h["error"] or None, h["worker"] or None, h["lease"] or None,
+                   float(h["created_at"]), float(h["updated_at"]))
+
+    def key_job(self, key: str) -> Job | None:
+        held = self.client.get(self._k("key:" + key))
+        return self.get(_decode(held)) if held else None
+
+    def stats(self) -> dict[str, int]:
+        pipe = self.client.pipeline()
+        pipe.llen(self._k("pending"))
+        pipe.zcard(self._k("delayed"))
+        pipe.zcard(self._k("inflight"))
+        pipe.hgetall(self._k("counts"))
+        pending, delayed, active, counts = pipe.execute()
+        counts = {_decode(k): int(v) for k, v in counts.items()}
+        return {"pending": pending, "delayed": delayed, "active": active,
+                "done": counts.get("done", 0), "dead": counts.get("dead", 0)}
+
+    def jobs(self, limit: int = 20) -> list[Job]:
+        ids = self.client.zrevrange(self._k("recent"), 0, limit - 1)
+        return [j for j in (self.get(_decode(i)) for i in ids) if j]
+
+def default_queue():
+    if settings.job_backend == "redis":
+        return RedisQueue()
+    if settings.job_backend == "memory":
+        return InMemoryQueue()
+    raise ValueError(f"Unknown JOB_BACKEND: {settings.job_backend}")
+
+def enqueue_universe(queue, targets: list[str], peers_of: dict[str, list[str]], mapping_path: str, label: str,
+                     accns: dict[str, str] | None = None, force: bool = False) -> list[tuple[Job, bool]]:
+    # one ingest per company however many packs it is in, keyed by the run label; each pack
+    # renders once its companies' ingests have finished. With accns (ticker -> new accession
+    # number, from watch mode) only those companies are ingested, keyed by (ticker, accn), and only
+    # the packs that include one of them are rebuilt. force drops the keys so everything runs again
+    members = {t: [t, *peers_of.get(t, [])] for t in targets}
+    if accns is not None:
+        members = {t: m for t, m in members.items() if any(x in accns for x in m)}
+    needed = [x for x in dict.fromkeys(x for m in members.values() for x in m) if accns is None or x in accns]
+    out, ingest = [], {}
+    for t in needed:
+        accn = accns[t] if accns is not None else None
+        job, created = queue.enqueue("ingest", {"ticker": t, "mapping": mapping_path, "accn": accn},
+                                     key=None if force else f"ingest:{t}:{accn or label}")
+        ingest[t] = job
+        out.append((job, created))
+    for t, m in members.items():
+        tag = label if accns is None else ",".join(sorted(accns[x] for x in m if x in accns))
+        out.append(queue.enqueue("render", {"ticker": t, "peers": m[1:], "mapping": mapping_path, "force": force,
+                                            "after": [ingest[x].id for x in m if x in ingest]},
+                                 key=None if force else f"render:{t}:{tag}"))
+    return out
+
+def _mentions(fp, needle: bytes) -> bool:
+    # streamed substring search; the tail of each chunk catches a match across the boundary
+    tail = b""
+    for chunk in iter(lambda: fp.read(1 << 20), b""):
+        if needle in chunk or needle in tail + chunk[:len(needle)]:
+            return True
+        tail = chunk[-len(needle):]
+    return False
+
+def pipeline_handlers(client, mkt, wait: float = 5.0) -> dict:
+    # ingest -> normalize (warms the shared fundamentals cache) and render, which waits for the
+    # ingests of its ticker and peers and fails if one of them died
+    from .db import AsyncSessionLocal, async_database
+    from .ingest import aingest_companyfacts_stream
+    from .mappings import load_mapping
+    from .normalize import company_fundamentals
+    from .pack import build_pack
+    from .query import aget_companies_by_ticker, fact_watermark
+    mappings = lru_cache(maxsize=None)(load_mapping)
+
+    async def ingest(queue, job: Job):
+        t, path = job.payload["ticker"], job.payload["mapping"]
+        async with async_database(), AsyncSessionLocal() as session:
+            co = (await aget_companies_by_ticker([t], session)).get(t)
+            if co is None:
+                raise LookupError(f"unknown ticker {t} (sync tickers first)")
+            with await client.companyfacts_stream(co.cik) as fp:
+                # the XBRL API can lag the submissions feed that queued this filing: fail (and retry
+                # with backoff) rather than record the filing as processed without its facts
+                accn = job.payload.get("accn")
+                if accn and not await asyncio.to_thread(_mentions, fp, accn.encode()):
+                    raise LookupError(f"companyfacts does not include {accn} yet")
+                fp.seek(0)
+                res = await aingest_companyfacts_stream(co.cik, fp, session=session, mapping=mappings(path))
+        inc("facts_inserted", res.inserted)
+        inc("facts_skipped", res.skipped)
+        mark = await asyncio.to_thread(fact_watermark, co.cik)
+        await asyncio.to_thread(queue.enqueue, "normalize", {"ticker": t, "cik": co.cik, "mapping": path},
+                                key=f"normalize:{t}:{mark}")
+
+    async def normalize(queue, job: Job):
+        await asyncio.to_thread(company_fundamentals, job.payload["cik"], mappings(job.payload["mapping"]))
+
+    async def render(queue, job: Job):
+        p = job.payload
+        after = [j for j in await asyncio.to_thread(lambda: [queue.get(i) for i in p.get("after", [])]) if j]
+        waiting = [j for j in after if j.status in OPEN]
+        if waiting:
+            raise NotReady(f"waiting for {len(waiting)} ingest jobs", wait)
+        # a pack built without one of its companies' data must not hold the render key
+        dead = [j.payload["ticker"] for j in after if j.status == "dead"]
+        if dead:
+            raise RuntimeError(f"ingest failed for {', '.join(dead)}")
+        tickers = [p["ticker"], *p["peers"]]
+        companies = await aget_companies_by_ticker(tickers)
+        ciks = {t: companies[t].cik for t in tickers if t in companies}
+        if p["ticker"] not in ciks:
+            raise LookupError(f"unknown ticker {p['ticker']} (sync tickers first)")
+        await asyncio.to_thread(build_pack, p["ticker"], p["peers"], ciks, mappings(p["mapping"]), mkt,
+                                None, p.get("force", False))
+
+    return {"ingest": ingest, "normalize": normalize, "render": render}
+
+async def run_worker(queue, handlers: dict, concurrency: int = 1, visibility: float | None = None,
+                     poll: float = 1.0, until_idle: bool = False, backoff: float = 5.0,
+                     name: str | None = None) -> Counter:
+    # `concurrency` jobs at a time; a heartbeat keeps each lease alive while its handler runs, so a
+    # job is only handed to another worker if this one dies. Failures retry with exponential backoff
+    visibility = visibility or settings.job_visibility
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    counts: Counter = Counter()
+
+    async def run(job: Job):
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(visibility / 3)
+                await asyncio.to_thread(queue.extend, job, visibility)
+
+        hb = asyncio.create_task(heartbeat())
+        try:
+            handler = handlers.get(job.kind)
+            if handler is None:
+                raise ValueError(f"no handler for job kind {job.kind!r}")
+            await handler(queue, job)
+        except NotReady as e:
+            status = await asyncio.to_thread(queue.release, job, e.delay) and "deferred"
+        except Exception as e:
+            status = await asyncio.to_thread(queue.fail, job, f"{type(e).__name__}: {e}",
+                                             min(MAX_BACKOFF, backoff * 2 ** (job.attempts - 1)))
+            status = {"queued": "retried"}.get(status, status)
+        else:
+            status = await asyncio.to_thread(queue.ack, job)
+        finally:
+            hb.cancel()
+        status = status or "lost"  # lease expired mid-run; whoever holds it now decides
+        counts[status] += 1
+        inc(f"jobs_{status}")
+
+    async def slot():
+        while True:
+            job = await asyncio.to_thread(queue.claim, name, visibility)
+            if job is None:
+                s = await asyncio.to_thread(queue.stats)
+                if until_idle and not (s["pending"] or s["delayed"] or s["active"]):
+                    return
+                await asyncio.sleep(poll)
+                continue
+            await run(job)
+
+    await asyncio.gather(*(slot() for _ in range(max(1, concurrency))))
+    return counts
@@ -0,0 +1,61 @@
+import hashlib
+import json
+from pathlib import Path
+from . import __version__
+from .artifacts import write_json
+from .mappings import Mapping
+from .marketdata import Quote
+from .query import fact_watermark
+
+MANIFEST = "manifest.json"
+# which inputs each artifact is rendered from; data.json has no assumptions in it
+ARTIFACT_INPUTS = {
+    "model.xlsx": ("facts", "mapping", "assumptions", "quotes", "version"),
+    "pack.pdf": ("facts", "mapping", "assumptions", "quotes", "version"),
+    "data.json": ("facts", "mapping", "quotes", "version"),
+}
+
+def pack_inputs(tickers: list[str], ciks: dict[str, int], mapping: Mapping, assumptions: dict,
+                quotes: dict[str, Quote]) -> dict:
+    # fact watermarks carry the latest filing date and accession number of each company in the pack
+    return {
+        "facts": {t: fact_watermark(ciks[t]) if t in ciks else None for t in tickers},
+        "mapping": mapping.digest,
+        "assumptions": assumptions,
+        "quotes": {t: [quotes[t].price, quotes[t].market_cap] if t in quotes else None for t in tickers},
+        "version": __version__,
+    }
+
+def fingerprint(inputs: dict, name: str) -> str:
+    raw = json.dumps({k: inputs[k] for k in ARTIFACT_INPUTS[name]}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def load_manifest(out_dir: str | Path) -> dict:
+    try:
+        return json.loads((Path(out_dir) / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def stale_artifacts(out_dir: str | Path, inputs: dict) -> list[str]:
+    # an artifact is reused only if its inputs match and the file on disk is the one we wrote
+    out_dir = Path(out_dir)
+    entries = load_manifest(out_dir).get("artifacts", {})
+    stale = []
+    for name in ARTIFACT_INPUTS:
+        entry = entries.get(name) or {}
+        path = out_dir / name
+        if (entry.get("fingerprint") != fingerprint(inputs, name) or not path.exists()
+                or entry.get("sha256") != _file_sha256(path)):
+            stale.append(name)
+    return stale
+
+def record_artifacts(out_dir: str | Path, inputs: dict, names: list[str]) -> str:
+    out_dir = Path(out_dir)
+    manifest = load_manifest(out_dir)
+    entries = manifest.get("artifacts", {})
+    for name in names:
+        entries[name] = {"fingerprint": fingerprint(inputs, name), "sha256": _file_sha256(out_dir / name)}
+    return write_json(out_dir / MANIFEST, {"version": __version__, "inputs": inputs, "artifacts": entries})
@@ -1,5 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from pathlib import Path
+import hashlib
+import json
 import yaml
 
 @dataclass(frozen=True)
@@ -12,6 +14,17 @@ class Mapping:
     unit_priority: list[str]
     lines: dict[str, list[TagRef]]
 
+    @property
+    def digest(self) -> str:
+        # changes whenever the effective mapping changes; used to version cached results
+        raw = json.dumps(asdict(self), sort_keys=True)
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    @property
+    def tags(self) -> frozenset[tuple[str, str]]:
+        # every (taxonomy, tag) any line reads; all that a slim ingest keeps
+        return frozenset((r.taxonomy, r.tag) for refs in self.lines.values() for r in refs)
+
 def load_mapping(path: str | Path) -> Mapping:
     p = Path(path)
     d = yaml.safe_load(p.read_text(encoding="utf-8"))
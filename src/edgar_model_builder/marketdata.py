@@ -1,8 +1,15 @@
 from __future__ import annotations
 
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional, Protocol
+from typing import Callable, Iterable, Optional, Protocol
+
+from .cache import make_key, shared_cache
+from .metrics import inc
+from .settings import settings
 
 
 @dataclass
@@ -18,16 +25,25 @@ class Quote:
 
 
 class MarketDataProvider(Protocol):
-    def quote(self, ticker: str) -> Quote: ...
+    # fundamentals=False only needs price / market cap and lets providers skip slow lookups
+    def quote(self, ticker: str, fundamentals: bool = True) -> Quote: ...
+
+    def quotes(self, tickers: Iterable[str], fundamentals: bool = True) -> dict[str, Quote]: ...
 
 
 class NullProvider:
-    def quote(self, ticker: str) -> Quote:
+    def quote(self, ticker: str, fundamentals: bool = True) -> Quote:
         return Quote(price=None, market_cap=None, currency=None)
 
+    def quotes(self, tickers: Iterable[str], fundamentals: bool = True) -> dict[str, Quote]:
+        return {t: self.quote(t, fundamentals) for t in tickers}
+
 
 class YFinanceProvider:
-    def quote(self, ticker: str) -> Quote:
+    def quotes(self, tickers: Iterable[str], fundamentals: bool = True) -> dict[str, Quote]:
+        return {t: self.quote(t, fundamentals) for t in tickers}
+
+    def quote(self, ticker: str, fundamentals: bool = True) -> Quote:
         # Hard-disable switch
         if os.getenv("EDGAR_DISABLE_YFINANCE", "0") == "1":
             return Quote(price=None, market_cap=None, currency=None)
@@ -69,10 +85,11 @@ class YFinanceProvider:
 
             # ---- Fundamentals (best effort): t.info (can be slower / blocked) ----
             info = {}
-            try:
-                info = t.info if hasattr(t, "info") else {}
-            except Exception:
-                info = {}
+            if fundamentals:
+                try:
+                    info = t.info if hasattr(t, "info") else {}
+                except Exception:
+                    info = {}
 
             ev = info.get("enterpriseValue") or mcap
             ttm_revenue = info.get("totalRevenue")
@@ -107,6 +124,77 @@ class YFinanceProvider:
             return Quote(price=None, market_cap=None, currency=None)
 
 
+class CachedProvider:
+    # In-process TTL cache + bounded parallel batch fetches. A cached quote with fundamentals also
+    # satisfies price-only requests, so each symbol is fetched at most once per TTL window.
+    # An empty quote (failed lookup) is only kept in memory, for negative_ttl.
+
+    def __init__(self, inner: MarketDataProvider, ttl: float = 900.0, max_workers: int = 8,
+                 clock: Callable[[], float] = time.monotonic, shared=None, negative_ttl: float = 30.0):
+        self.inner = inner
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self.shared = shared
+        self._clock = clock
+        self._cache: dict[str, tuple[float, bool, Quote]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, ticker: str, fundamentals: bool) -> Quote | None:
+        with self._lock:
+            hit = self._cache.get(ticker)
+        if hit is None:
+            return None
+        expires, has_fundamentals, q = hit
+        if expires < self._clock() or (fundamentals and not has_fundamentals):
+            return None
+        return q
+
+    def _fetch(self, ticker: str, fundamentals: bool) -> Quote:
+        # the shared tier (disk / Redis) lets parallel edgar processes reuse each other's quotes
+        q, has_fundamentals, ttl = None, fundamentals, self.ttl
+        if self.shared is not None:
+            q, has_fundamentals = self.shared.get(make_key("quote", ticker, True)), True
+            if q is None and not fundamentals:
+                q, has_fundamentals = self.shared.get(make_key("quote", ticker, False)), False
+        if q is not None:
+            inc("quote_shared_hits")
+        else:
+            inc("quote_provider_calls")
+            q, has_fundamentals = self.inner.quote(ticker, fundamentals), fundamentals
+            if q.price is None and q.market_cap is None:
+                ttl = min(self.ttl, self.negative_ttl)
+            elif self.shared is not None:
+                self.shared.set(make_key("quote", ticker, fundamentals), q, self.ttl)
+        with self._lock:
+            self._cache[ticker] = (self._clock() + ttl, has_fundamentals, q)
+        return q
+
+    def quote(self, ticker: str, fundamentals: bool = True) -> Quote:
+        q = self._cached(ticker, fundamentals)
+        inc("quote_requests")
+        if q is not None:
+            inc("quote_cache_hits")
+            return q
+        return self._fetch(ticker, fundamentals)
+
+    def quotes(self, tickers: Iterable[str], fundamentals: bool = True) -> dict[str, Quote]:
+        tickers = list(dict.fromkeys(tickers))
+        out = {t: self._cached(t, fundamentals) for t in tickers}
+        missing = [t for t, q in out.items() if q is None]
+        inc("quote_requests", len(tickers))
+        inc("quote_cache_hits", len(tickers) - len(missing))
+        if len(missing) == 1 or self.max_workers <= 1:
+            out.update({t: self._fetch(t, fundamentals) for t in missing})
+        elif missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                out.update(zip(missing, pool.map(lambda t: self._fetch(t, fundamentals), missing)))
+        return out
+
+
+_providers: dict[str, CachedProvider] = {}
+
+
 def provider(name: str | None = None) -> MarketDataProvider:
     # Env override wins
     env_name = os.getenv("MARKETDATA_PROVIDER")
@@ -116,6 +204,11 @@ def provider(name: str | None = None) -> MarketDataProvider:
     if n in {"", "none", "null", "off", "disabled"}:
         return NullProvider()
     if n in {"yfinance", "yf"}:
-        return YFinanceProvider()
+        if "yfinance" not in _providers:
+            _providers["yfinance"] = CachedProvider(
+                YFinanceProvider(), ttl=settings.quote_ttl, max_workers=settings.quote_workers,
+                shared=shared_cache(),
+            )
+        return _providers["yfinance"]
 
     raise ValueError(f"Unknown provider: {chosen}")
@@ -0,0 +1,98 @@
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from . import __version__
+
+class Metrics:
+    # process-wide counters and timing spans; cheap enough to leave on everywhere
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: dict[str, float] = defaultdict(float)
+            self.spans: list[dict] = []
+            self._t0 = time.perf_counter()
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({"name": name, "start": round(start - self._t0, 6), "seconds": round(end - start, 6)})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            totals: dict[str, float] = defaultdict(float)
+            for s in self.spans:
+                totals[s["name"]] += s["seconds"]
+            return {
+                "version": __version__,
+                "stages": {k: round(v, 6) for k, v in totals.items()},
+                "spans": list(self.spans),
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write_json(self, path: str | Path) -> str:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.snapshot(), indent=2), encoding="utf-8")
+        return str(path)
+
+    def write_prometheus(self, path: str | Path, labels: dict[str, str] | None = None) -> str:
+        # node_exporter textfile format; written via rename so the collector never sees a partial file
+        snap = self.snapshot()
+        labels = labels or {}
+
+        def fmt(extra: dict) -> str:
+            pairs = {**labels, **extra}
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs.items()) + "}" if pairs else ""
+
+        lines = ["# TYPE edgar_stage_seconds gauge"]
+        for stage, seconds in snap["stages"].items():
+            lines.append(f"edgar_stage_seconds{fmt({'stage': stage})} {seconds}")
+        for name, value in snap["counters"].items():
+            metric = "edgar_" + re.sub(r"[^a-zA-Z0-9_]", "_", name)
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{fmt({})} {value}")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        tmp.replace(path)
+        return str(path)
+
+metrics = Metrics()
+inc = metrics.inc
+span = metrics.span
+
+def instrument_engine(engine) -> None:
+    # count every statement and the rows the driver reports for it (-1, e.g. SQLite SELECTs, counts as 0)
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._edgar_t0 = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        inc("sql_statements")
+        t0 = getattr(context, "_edgar_t0", None)
+        if t0 is not None:
+            inc("sql_seconds", time.perf_counter() - t0)
+        if executemany:
+            inc("sql_executemany_params", len(parameters))
+        if cursor.rowcount and cursor.rowcount > 0:
+            inc("sql_rows", cursor.rowcount)
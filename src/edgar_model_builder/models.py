@@ -3,6 +3,23 @@ from sqlalchemy.orm import Mapped, mapped_column
 from datetime import datetime
 from .db import Base
 
+FORM_CLASSES = {
+    "FY": ("10-K","20-F","40-F"),
+    "Q": ("10-Q",),
+}
+
+def form_class(form: str | None) -> str | None:
+    for cls, forms in FORM_CLASSES.items():
+        if form in forms:
+            return cls
+    return None
+
+def form_class_for(forms: tuple[str,...]) -> str | None:
+    for cls, cls_forms in FORM_CLASSES.items():
+        if set(forms) == set(cls_forms):
+            return cls
+    return None
+
 class Company(Base):
     __tablename__ = "companies"
     cik: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -30,3 +47,35 @@ class Fact(Base):
         UniqueConstraint("cik","taxonomy","tag","unit","end","accn", name="uq_fact_key"),
         Index("ix_fact_tag_end", "taxonomy", "tag", "end"),
     )
+
+class FactLatest(Base):
+    # Most recently filed non-null value per (cik, taxonomy, tag, form class, end, unit), kept
+    # up to date by the ingest path; ties on filed keep the first-loaded fact (lowest fact_id).
+    __tablename__ = "fact_latest"
+    cik: Mapped[int] = mapped_column(Integer, primary_key=True)
+    taxonomy: Mapped[str] = mapped_column(String(32), primary_key=True)
+    tag: Mapped[str] = mapped_column(String(128), primary_key=True)
+    form_class: Mapped[str] = mapped_column(String(2), primary_key=True)
+    end: Mapped[datetime] = mapped_column(DateTime(timezone=False), primary_key=True)
+    unit: Mapped[str] = mapped_column(String(32), primary_key=True)
+    val: Mapped[float] = mapped_column(Float, nullable=False)
+    filed: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
+    form: Mapped[str] = mapped_column(String(16), nullable=False)
+    accn: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    fact_id: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index(
+            "ix_fact_latest_cover", "cik", "taxonomy", "tag", "form_class", "end",
+            postgresql_include=["unit", "val", "filed", "fact_id"],
+        ),
+    )
+
+class IngestState(Base):
+    # what the stored facts of a CIK cover: `tags` is the JSON list of "taxonomy/tag" a slim ingest
+    # kept, or NULL when whole companyfacts documents were loaded
+    __tablename__ = "ingest_state"
+    cik: Mapped[int] = mapped_column(Integer, primary_key=True)
+    mapping_digest: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    tags: Mapped[str | None] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=False), nullable=False)
@@ -1,11 +1,16 @@
 from datetime import datetime
 import pandas as pd
+from sqlalchemy import Integer, String, and_, case, column, func, select, tuple_, values
 from .mappings import Mapping
 from .db import SessionLocal
-from .models import Fact
+from .models import FORM_CLASSES, FactLatest
+from .query import fact_watermark
+from .settings import settings
+from .cache import get_cache, make_key
+from . import snapshots
 
-FORMS_FY = ("10-K","20-F","40-F")
-FORMS_Q = ("10-Q",)
+FORMS_FY = FORM_CLASSES["FY"]
+FORMS_Q = FORM_CLASSES["Q"]
 
 def _best_unit(units: list[str], priority: list[str]):
     for p in priority:
@@ -13,59 +18,153 @@ def _best_unit(units: list[str], priority: list[str]):
             return p
     return units[0] if units else None
 
-def _facts_for_tag(cik: int, taxonomy: str, tag: str):
+FACT_COLUMNS = ["taxonomy", "tag", "unit", "end", "val", "filed"]
+
+def _mapping_refs(mapping: Mapping) -> pd.DataFrame:
+    refs = [(line, ref.taxonomy, ref.tag, rank)
+            for line, line_refs in mapping.lines.items()
+            for rank, ref in enumerate(line_refs)]
+    return pd.DataFrame(refs, columns=["line", "taxonomy", "tag", "rank"])
+
+def _fact_rows(cik: int, pairs: list[tuple[str, str]], form_class: str):
+    # fact_latest already holds the latest filing per unit; the pandas dedup only picks across units
+    if not pairs:
+        return []
+    if snapshots.enabled():
+        df = snapshots.read_rows(cik, pairs, form_class)
+        if df is None:
+            snapshots.write_snapshot(cik)
+            df = snapshots.read_rows(cik, pairs, form_class)
+        if df is not None:
+            return df[FACT_COLUMNS]
     s = SessionLocal()
     try:
         q = (
-            s.query(Fact)
-            .filter(Fact.cik == cik, Fact.taxonomy == taxonomy, Fact.tag == tag)
+            select(FactLatest.taxonomy, FactLatest.tag, FactLatest.unit, FactLatest.end, FactLatest.val, FactLatest.filed)
+            .where(
+                FactLatest.cik == cik,
+                FactLatest.form_class == form_class,
+                tuple_(FactLatest.taxonomy, FactLatest.tag).in_(pairs),
+            )
+            .order_by(FactLatest.fact_id)
         )
-        return q.all()
+        return s.execute(q).all()
     finally:
         s.close()
 
-def _select_latest_per_end(rows):
-    if not rows:
-        return pd.DataFrame(columns=["end","val","filed","form","unit"])
-    df = pd.DataFrame([{
-        "end": r.end,
-        "val": r.val,
-        "filed": r.filed or datetime(1900,1,1),
-        "form": r.form or "",
-        "unit": r.unit,
-    } for r in rows if r.val is not None and r.end is not None])
+def _group_keys(df: pd.DataFrame) -> list[str]:
+    return ["cik"] if "cik" in df.columns else []
+
+def _select_latest_per_end(df: pd.DataFrame):
+    # most recently filed value per ([cik,] taxonomy, tag, end); the stable sort keeps load order on ties
+    keys = _group_keys(df) + ["taxonomy", "tag", "end"]
+    df = df.assign(filed=df["filed"].fillna(datetime(1900, 1, 1)))
+    df = df.sort_values(keys + ["filed"], ascending=[True] * len(keys) + [False], kind="stable")
+    return df.drop_duplicates(subset=keys, keep="first")
+
+def _coalesce_lines(latest: pd.DataFrame, refs: pd.DataFrame, lines: list[str]):
+    # per ([cik,] line, end) take the highest-priority tag that has a value
+    index = _group_keys(latest) + ["end"]
+    df = latest.merge(refs, on=["taxonomy", "tag"])
     if df.empty:
-        return df
-    df = df.sort_values(["end","filed"], ascending=[True, False])
-    df = df.drop_duplicates(subset=["end"], keep="first")
-    return df
-
-def build_statement_history(cik: int, mapping: Mapping, period: str):
-    forms = FORMS_FY if period == "FY" else FORMS_Q
-    out = {}
-    for line, refs in mapping.lines.items():
-        collected = []
-        for ref in refs:
-            rows = _facts_for_tag(cik, ref.taxonomy, ref.tag)
-            rows = [r for r in rows if (r.form in forms)]
-            if not rows:
-                continue
-            df = _select_latest_per_end(rows)
+        return pd.DataFrame()
+    df = df.sort_values(["line"] + index + ["rank"], kind="stable").drop_duplicates(subset=["line"] + index, keep="first")
+    wide = df.pivot(index=index if len(index) > 1 else "end", columns="line", values="val")
+    wide = wide[[line for line in lines if line in wide.columns]]
+    wide.columns.name = None
+    return wide.sort_index()
+
+def history_from_rows(rows, mapping: Mapping):
+    df = pd.DataFrame(rows, columns=FACT_COLUMNS)
+    if df.empty:
+        return pd.DataFrame()
+    return _coalesce_lines(_select_latest_per_end(df), _mapping_refs(mapping), list(mapping.lines))
+
+def _period_class(period: str) -> str:
+    return "FY" if period == "FY" else "Q"
+
+def _mapping_pairs(mapping: Mapping) -> list[tuple[str, str]]:
+    return list(dict.fromkeys((ref.taxonomy, ref.tag) for refs in mapping.lines.values() for ref in refs))
+
+def build_statement_history(cik: int, mapping: Mapping, period: str, watermark: str | None = None):
+    # callers get a copy, so editing the frame never changes what the cache hands out next
+    cache = get_cache()
+    key = make_key("history", cik, mapping.digest, period, watermark or fact_watermark(cik))
+    df = cache.get(key)
+    if df is None:
+        df = history_from_rows(_fact_rows(cik, _mapping_pairs(mapping), _period_class(period)), mapping)
+        cache.set(key, df, settings.cache_ttl)
+    return df.copy()
+
+def _history_many_sql(ciks: list[int], mapping: Mapping, form_class: str):
+    # dedup (latest filing per tag/end across units) and tag-priority coalescing done warehouse-side
+    refs = values(
+        column("line", String), column("taxonomy", String), column("tag", String), column("rank", Integer),
+        name="refs",
+    ).data([(line, ref.taxonomy, ref.tag, rank)
+            for line, line_refs in mapping.lines.items() for rank, ref in enumerate(line_refs)])
+    fl = FactLatest
+    ranked = (
+        select(
+            fl.cik, fl.end, fl.val, refs.c.line, refs.c.rank,
+            func.row_number().over(
+                partition_by=[fl.cik, refs.c.line, fl.taxonomy, fl.tag, fl.end],
+                order_by=[fl.filed.desc(), fl.fact_id],
+            ).label("rn"),
+        )
+        .join_from(fl, refs, and_(fl.taxonomy == refs.c.taxonomy, fl.tag == refs.c.tag))
+        .where(fl.cik.in_(ciks), fl.form_class == form_class)
+        .subquery("ranked")
+    )
+    picked = (
+        select(
+            ranked.c.cik, ranked.c.end, ranked.c.line, ranked.c.val,
+            func.row_number().over(
+                partition_by=[ranked.c.cik, ranked.c.line, ranked.c.end], order_by=ranked.c.rank,
+            ).label("pick"),
+        )
+        .where(ranked.c.rn == 1)
+        .subquery("picked")
+    )
+    return (
+        select(picked.c.cik, picked.c.end,
+               *(func.max(case((picked.c.line == line, picked.c.val))).label(line) for line in mapping.lines))
+        .where(picked.c.pick == 1)
+        .group_by(picked.c.cik, picked.c.end)
+        .order_by(picked.c.cik, picked.c.end)
+    )
+
+def build_statement_history_many(ciks: list[int], mapping: Mapping, period: str):
+    ciks = list(dict.fromkeys(ciks))
+    if not ciks or not mapping.lines:
+        return pd.DataFrame()
+    cls = _period_class(period)
+    s = SessionLocal()
+    try:
+        if s.get_bind().dialect.name == "postgresql":
+            rows = s.execute(_history_many_sql(ciks, mapping, cls)).all()
+            df = pd.DataFrame(rows, columns=["cik", "end", *mapping.lines])
             if df.empty:
-                continue
-            collected.append(df[["end","val","unit"]].rename(columns={"val": ref.tag, "unit": "unit"}))
-        if not collected:
-            continue
-        merged = collected[0]
-        for df in collected[1:]:
-            merged = merged.merge(df, on=["end","unit"], how="outer")
-        merged = merged.sort_values("end")
-        merged[line] = merged[[c for c in merged.columns if c not in ("end","unit")]].bfill(axis=1).iloc[:,0]
-        out[line] = merged[["end", line]].set_index("end")[line]
-    if not out:
+                return pd.DataFrame()
+            df["end"] = pd.to_datetime(df["end"])
+            return df.set_index(["cik", "end"]).dropna(axis=1, how="all").astype(float)
+        q = (
+            select(FactLatest.cik, FactLatest.taxonomy, FactLatest.tag, FactLatest.unit, FactLatest.end,
+                   FactLatest.val, FactLatest.filed)
+            .where(
+                FactLatest.cik.in_(ciks),
+                FactLatest.form_class == cls,
+                tuple_(FactLatest.taxonomy, FactLatest.tag).in_(_mapping_pairs(mapping)),
+            )
+            .order_by(FactLatest.fact_id)
+        )
+        rows = s.execute(q).all()
+    finally:
+        s.close()
+    df = pd.DataFrame(rows, columns=["cik", *FACT_COLUMNS])
+    if df.empty:
         return pd.DataFrame()
-    result = pd.DataFrame(out).sort_index()
-    return result
+    return _coalesce_lines(_select_latest_per_end(df), _mapping_refs(mapping), list(mapping.lines))
 
 def compute_kpis(df_fy: pd.DataFrame, df_q: pd.DataFrame):
     k = {}
@@ -81,3 +180,53 @@ def compute_kpis(df_fy: pd.DataFrame, df_q: pd.DataFrame):
         if ttm_oi is not None and da is not None:
             k["ttm_ebitda"] = float(ttm_oi + da)
     return k
+
+def _fundamental_kpis(hist_fy: pd.DataFrame, hist_q: pd.DataFrame):
+    kpis = compute_kpis(hist_fy, hist_q)
+    for col in ["cash","total_debt"]:
+        if col in hist_q.columns and not hist_q[col].dropna().empty:
+            kpis[col] = float(hist_q[col].dropna().iloc[-1])
+    return kpis
+
+def company_fundamentals(cik: int, mapping: Mapping):
+    # FY/Q histories plus TTM KPIs and latest balance sheet items, cached per data watermark
+    mark = fact_watermark(cik)
+    hist_fy = build_statement_history(cik, mapping, "FY", mark)
+    hist_q = build_statement_history(cik, mapping, "Q", mark)
+    cache = get_cache()
+    key = make_key("kpis", cik, mapping.digest, mark)
+    kpis = cache.get(key)
+    if kpis is None:
+        kpis = _fundamental_kpis(hist_fy, hist_q)
+        cache.set(key, kpis, settings.cache_ttl)
+    return hist_fy, hist_q, dict(kpis)
+
+def _panel_slice(panel: pd.DataFrame, cik: int) -> pd.DataFrame:
+    if panel.empty or cik not in panel.index.get_level_values("cik"):
+        return pd.DataFrame()
+    return panel.xs(cik, level="cik").dropna(axis=1, how="all")
+
+def fundamentals_many(ciks: list[int], mapping: Mapping) -> dict[int, tuple]:
+    # company_fundamentals for a whole universe: cache misses are built with two batched queries
+    # and written back under the same keys, so later single-company calls hit the cache
+    cache = get_cache()
+    out, todo = {}, {}
+    for cik in dict.fromkeys(ciks):
+        mark = fact_watermark(cik)
+        keys = [make_key("history", cik, mapping.digest, p, mark) for p in ("FY", "Q")]
+        keys.append(make_key("kpis", cik, mapping.digest, mark))
+        hit = [cache.get(k) for k in keys]
+        if any(v is None for v in hit):
+            todo[cik] = keys
+        else:
+            out[cik] = (hit[0].copy(), hit[1].copy(), dict(hit[2]))
+    if todo:
+        panel_fy = build_statement_history_many(list(todo), mapping, "FY")
+        panel_q = build_statement_history_many(list(todo), mapping, "Q")
+        for cik, keys in todo.items():
+            hist_fy, hist_q = _panel_slice(panel_fy, cik), _panel_slice(panel_q, cik)
+            kpis = _fundamental_kpis(hist_fy, hist_q)
+            for k, v in zip(keys, (hist_fy, hist_q, kpis)):
+                cache.set(k, v, settings.cache_ttl)
+            out[cik] = (hist_fy.copy(), hist_q.copy(), dict(kpis))
+    return out
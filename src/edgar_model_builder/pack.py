@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import pandas as pd
+import yaml
+from .artifacts import artifacts_root, write_json
+from .charts import pack_charts, render_charts
+from .comps import build_comps_table
+from .db import async_database
+from .excel_builder import build_model_xlsx
+from .manifest import ARTIFACT_INPUTS, pack_inputs, record_artifacts, stale_artifacts
+from .mappings import Mapping
+from .marketdata import MarketDataProvider
+from .metrics import span
+from .normalize import company_fundamentals, fundamentals_many
+from .pdf_builder import build_pack_pdf
+from .query import aget_companies_by_ticker
+from .universe import TickerResult, ingest_universe
+
+DEFAULT_ASSUMPTIONS = {"WACC": 0.10, "Terminal_Growth": 0.03}
+
+@dataclass
+class UniverseResult:
+    ingest: list[TickerResult] = field(default_factory=list)
+    built: dict[str, list[str]] = field(default_factory=dict)
+    skipped: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+def load_peer_groups(path: str | Path) -> tuple[list[str], dict[str, list[str]]]:
+    d = yaml.safe_load(Path(path).read_text(encoding="utf-8")) or {}
+    default = [t.upper() for t in d.get("default", [])]
+    groups = {t.upper(): [p.upper() for p in peers] for t, peers in (d.get("groups") or {}).items()}
+    return default, groups
+
+def render_pack(out_dir: str | Path, ticker: str, hist_fy: pd.DataFrame, hist_q: pd.DataFrame,
+                kpis: dict, comps: pd.DataFrame, assumptions: dict, chart_workers: int | None = None,
+                only: list[str] | None = None) -> list[str]:
+    out_dir = Path(out_dir)
+    names = list(ARTIFACT_INPUTS) if only is None else only
+    paths = []
+    if "model.xlsx" in names:
+        with span("render_xlsx"):
+            paths.append(build_model_xlsx(out_dir / "model.xlsx", ticker, hist_fy, hist_q, comps, assumptions))
+    if "pack.pdf" in names:
+        with span("render_charts"):
+            charts = render_charts(pack_charts(ticker, hist_fy, comps, assumptions), workers=chart_workers)
+        with span("render_pdf"):
+            paths.append(build_pack_pdf(out_dir / "pack.pdf", ticker, kpis, comps, charts))
+    if "data.json" in names:
+        with span("render_json"):
+            paths.append(write_json(out_dir / "data.json", {"ticker": ticker, "kpis": kpis, "comps": comps.to_dict(orient="records")}))
+    return paths
+
+def plan_pack(ticker: str, peers: list[str], ciks: dict[str, int], mapping: Mapping, mkt: MarketDataProvider,
+              assumptions: dict, force: bool = False) -> tuple[dict, list[str]]:
+    # the pack's input fingerprints and the artifacts whose recorded fingerprints no longer match
+    tickers = [ticker] + peers
+    inputs = pack_inputs(tickers, ciks, mapping, assumptions, mkt.quotes(tickers, fundamentals=False))
+    return inputs, list(ARTIFACT_INPUTS) if force else stale_artifacts(artifacts_root() / ticker, inputs)
+
+def build_pack(ticker: str, peers: list[str], ciks: dict[str, int], mapping: Mapping, mkt: MarketDataProvider,
+               assumptions: dict | None = None, force: bool = False) -> tuple[list[str], list[str]]:
+    # one pack from what is already in the database: (written paths, rebuilt artifact names),
+    # both empty when the manifest says everything is current
+    assumptions = assumptions or DEFAULT_ASSUMPTIONS
+    out_dir = artifacts_root() / ticker
+    with span("plan"):
+        inputs, todo = plan_pack(ticker, peers, ciks, mapping, mkt, assumptions, force)
+    if not todo:
+        return [], []
+    with span("normalize"):
+        hist_fy, hist_q, kpis = company_fundamentals(ciks[ticker], mapping)
+        kpis_by_ticker = {ticker: kpis}
+        for p in peers:
+            if p in ciks:
+                kpis_by_ticker[p] = company_fundamentals(ciks[p], mapping)[2]
+    with span("comps"):
+        comps = build_comps_table(ticker, peers, kpis_by_ticker, mkt)
+    paths = render_pack(out_dir, ticker, hist_fy, hist_q, kpis, comps, assumptions, only=todo)
+    record_artifacts(out_dir, inputs, todo)
+    return paths, todo
+
+def _render_task(args) -> tuple[str, list[str] | Exception]:
+    ticker = args[1]
+    try:
+        return ticker, render_pack(*args)
+    except Exception as e:
+        return ticker, e
+
+async def build_universe(client, targets: list[str], peer_groups: dict[str, list[str]], default_peers: list[str],
+                         mapping: Mapping, mkt: MarketDataProvider, concurrency: int = 4, writers: int = 2,
+                         workers: int | None = None, assumptions: dict | None = None,
+                         force: bool = False) -> UniverseResult:
+    # every company is ingested and normalized once, however many packs it appears in as a peer,
+    # and packs whose manifest still matches their inputs are not rebuilt at all
+    assumptions = assumptions or DEFAULT_ASSUMPTIONS
+    peers_of = {t: [p for p in peer_groups.get(t, default_peers) if p != t] for t in targets}
+    needed = list(dict.fromkeys(targets + [p for ps in peers_of.values() for p in ps]))
+
+    result = UniverseResult()
+    async with async_database():
+        result.ingest = await ingest_universe(client, needed, concurrency=concurrency, writers=writers, mapping=mapping)
+        companies = await aget_companies_by_ticker(needed)
+    ciks = {t: companies[t].cik for t in needed if t in companies}
+    mkt.quotes(needed, fundamentals=False)
+
+    plans = {}
+    for t in targets:
+        if t not in ciks:
+            result.failed[t] = "unknown ticker (sync tickers first)"
+            continue
+        inputs, todo = plan_pack(t, peers_of[t], ciks, mapping, mkt, assumptions, force)
+        if todo:
+            plans[t] = (inputs, todo)
+        else:
+            result.skipped.append(t)
+    involved = list(dict.fromkeys(x for t in plans for x in [t] + peers_of[t] if x in ciks))
+    fundamentals = fundamentals_many([ciks[t] for t in involved], mapping)
+    kpis_by_ticker = {t: fundamentals[ciks[t]][2] for t in involved}
+
+    tasks = []
+    for t, (_, todo) in plans.items():
+        hist_fy, hist_q, kpis = fundamentals[ciks[t]]
+        comps = build_comps_table(t, peers_of[t], kpis_by_ticker, mkt)
+        tasks.append((artifacts_root() / t, t, hist_fy, hist_q, kpis, comps, assumptions, 1, todo))
+
+    # rasterize every pack's charts in one pool up front; the render tasks then only read cached PNGs
+    render_charts([spec for task in tasks if "pack.pdf" in task[8]
+                   for spec in pack_charts(task[1], task[2], task[5], task[6])], workers=workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for ticker, out in pool.map(_render_task, tasks):
+            if isinstance(out, Exception):
+                result.failed[ticker] = f"render failed: {out}"
+            else:
+                inputs, todo = plans[ticker]
+                record_artifacts(artifacts_root() / ticker, inputs, todo)
+                result.built[ticker] = out
+    return result
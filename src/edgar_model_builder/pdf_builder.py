@@ -1,25 +1,11 @@
 from pathlib import Path
-import io
 import pandas as pd
-import matplotlib.pyplot as plt
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
 
-def _chart_to_png_bytes(df: pd.DataFrame, x, y, title: str):
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    ax.plot(df[x], df[y])
-    ax.set_title(title)
-    ax.tick_params(axis='x', rotation=45)
-    buf = io.BytesIO()
-    fig.tight_layout()
-    fig.savefig(buf, format="png", dpi=200)
-    plt.close(fig)
-    buf.seek(0)
-    return buf
-
-def build_pack_pdf(out_path: str | Path, ticker: str, kpis: dict, comps: pd.DataFrame):
+def build_pack_pdf(out_path: str | Path, ticker: str, kpis: dict, comps: pd.DataFrame, charts: list[Path] | None = None):
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
     c = canvas.Canvas(str(out_path), pagesize=letter)
@@ -53,6 +39,15 @@ def build_pack_pdf(out_path: str | Path, ticker: str, kpis: dict, comps: pd.Data
             ty = h - 72
             c.setFont("Helvetica", 8)
 
+    # pre-rendered PNGs (see charts.render_charts), one per page at full text width
+    for path in charts or []:
+        c.showPage()
+        img = ImageReader(str(path))
+        iw, ih = img.getSize()
+        cw = w - 2 * inch
+        ch = cw * ih / iw
+        c.drawImage(img, inch, h - inch - ch, width=cw, height=ch)
+
     c.showPage()
     c.save()
     return str(out_path)
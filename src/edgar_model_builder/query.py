@@ -1,17 +1,74 @@
+import threading
+import time
 from datetime import datetime
-from sqlalchemy import select, desc
-from .db import SessionLocal
-from .models import Company, Fact
+from sqlalchemy import func, select, desc
+from .db import AsyncSessionLocal, SessionLocal, async_database
+from .models import Company, Fact, FactLatest, form_class_for
+
+class TickerIndex:
+    # the whole companies table as ticker -> Company (~10k rows), loaded on the first lookup and
+    # reused for the rest of the process. Writes in this process invalidate it; a ticker missing from
+    # the index reloads it at most once every MISS_REFRESH seconds, which picks up another process's sync.
+    MISS_REFRESH = 30.0
+
+    def __init__(self):
+        self._by_ticker: dict[str, Company] | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self, tickers: list[str]) -> bool:
+        if self._by_ticker is None:
+            return False
+        if all(t in self._by_ticker for t in tickers):
+            return True
+        return time.monotonic() - self._loaded_at < self.MISS_REFRESH
+
+    def _set(self, companies) -> None:
+        self._by_ticker = {c.ticker: c for c in companies}
+        self._loaded_at = time.monotonic()
+
+    def refresh(self) -> None:
+        with self._lock, SessionLocal() as s:
+            self._set(s.execute(select(Company)).scalars().all())
+
+    async def arefresh(self, session=None) -> None:
+        async with async_database():
+            s = session or AsyncSessionLocal()
+            try:
+                self._set((await s.execute(select(Company))).scalars().all())
+            finally:
+                if session is None:
+                    await s.close()
+
+    def invalidate(self) -> None:
+        self._by_ticker = None
+
+    def get_many(self, tickers: list[str]) -> dict[str, Company]:
+        tickers = [t.upper() for t in tickers]
+        if not self._current(tickers):
+            self.refresh()
+        return {t: self._by_ticker[t] for t in tickers if t in self._by_ticker}
+
+    async def aget_many(self, tickers: list[str], session=None) -> dict[str, Company]:
+        tickers = [t.upper() for t in tickers]
+        if not self._current(tickers):
+            await self.arefresh(session)
+        return {t: self._by_ticker[t] for t in tickers if t in self._by_ticker}
+
+ticker_index = TickerIndex()
 
 def get_company_by_ticker(ticker: str) -> Company | None:
-    s = SessionLocal()
-    try:
-        q = select(Company).where(Company.ticker == ticker.upper())
-        return s.execute(q).scalars().first()
-    finally:
-        s.close()
+    return ticker_index.get_many([ticker]).get(ticker.upper())
+
+async def aget_company_by_ticker(ticker: str, session=None) -> Company | None:
+    return (await ticker_index.aget_many([ticker], session)).get(ticker.upper())
+
+async def aget_companies_by_ticker(tickers: list[str], session=None) -> dict[str, Company]:
+    return await ticker_index.aget_many(tickers, session)
 
 def latest_fact_for_period(cik: int, taxonomy: str, tag: str, unit: str, end: datetime, forms: tuple[str,...]):
+    # read from facts, not fact_latest: this answers with value-less facts too. The lookup is a prefix
+    # of the facts unique key, so it is indexed either way
     s = SessionLocal()
     try:
         q = (
@@ -33,6 +90,15 @@ def latest_fact_for_period(cik: int, taxonomy: str, tag: str, unit: str, end: da
 def list_period_ends(cik: int, forms: tuple[str,...]):
     s = SessionLocal()
     try:
+        cls = form_class_for(forms)
+        if cls is not None:
+            q = (
+                select(FactLatest.end)
+                .where(FactLatest.cik == cik, FactLatest.form_class == cls)
+                .distinct()
+                .order_by(desc(FactLatest.end))
+            )
+            return [r[0] for r in s.execute(q).all()]
         q = (
             select(Fact.end)
             .where(Fact.cik == cik, Fact.form.in_(forms))
@@ -42,3 +108,17 @@ def list_period_ends(cik: int, forms: tuple[str,...]):
         return [r[0] for r in s.execute(q).all()]
     finally:
         s.close()
+
+def fact_watermark(cik: int) -> str:
+    # max(fact_id) moves when a newer fact takes over a row; the row count and the sum of fact ids
+    # also catch rows that join or are reranked onto older facts (frames forms, form upgrades)
+    s = SessionLocal()
+    try:
+        filed, accn, fact_id, n, ids = s.execute(
+            select(func.max(FactLatest.filed), func.max(FactLatest.accn), func.max(FactLatest.fact_id),
+                   func.count(), func.sum(FactLatest.fact_id))
+            .where(FactLatest.cik == cik)
+        ).one()
+    finally:
+        s.close()
+    return f"{filed.isoformat() if filed else ''}|{accn or ''}|{fact_id or 0}|{n}|{ids or 0}"
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from .metrics import inc
+from .settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: the file backend falls back to limiting this process only
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # optional: pip install edgar-model-builder[redis]
+    redis = None
+
+MIN_FACTOR = 0.1  # a throttled rate never drops below a tenth of SEC_RPS
+RECOVERY = 0.02  # rate factor regained per second after a throttle (~25s from half speed back to full)
+DEFAULT_PAUSE = 2.0  # pause after a 429/403 without Retry-After, divided by the current rate factor
+MAX_PAUSE = 600.0
+
+def _apply(state: dict, op: str, now: float, rate: float, retry_after: float | None) -> tuple[dict, float]:
+    # GCRA token bucket: `tat` is when the next request may go out. "acquire" reserves that slot and
+    # returns the wait; "throttle" halves the rate factor and holds every client until `blocked`.
+    factor = min(1.0, state.get("factor", 1.0) + (now - state.get("factor_at", now)) * RECOVERY)
+    tat, blocked, wait = state.get("tat", 0.0), state.get("blocked", 0.0), 0.0
+    if op == "throttle":
+        factor = max(MIN_FACTOR, factor / 2)
+        pause = retry_after if retry_after is not None else DEFAULT_PAUSE / factor
+        blocked = max(blocked, now + min(MAX_PAUSE, pause))
+    else:
+        start = max(tat, now, blocked)
+        wait = start - now
+        tat = start + 1.0 / (rate * factor)
+    return {"tat": tat, "blocked": blocked, "factor": factor, "factor_at": now}, wait
+
+class RateLimiter:
+    # in-process bucket; subclasses keep the same state somewhere every process can see
+    # (set `shared`, so their file locks and round trips run in a worker thread, off the event loop)
+    shared = False
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._state: dict = {}
+        self._lock = threading.Lock()
+
+    def _update(self, op: str, retry_after: float | None = None) -> float:
+        with self._lock:
+            self._state, wait = _apply(self._state, op, time.time(), self.rate, retry_after)
+        return wait
+
+    async def _aupdate(self, op: str, retry_after: float | None = None) -> float:
+        if self.shared:
+            return await asyncio.to_thread(self._update, op, retry_after)
+        return self._update(op, retry_after)
+
+    async def acquire(self) -> float:
+        wait = await self._aupdate("acquire")
+        if wait > 0:
+            inc("sec_rate_waits")
+            inc("sec_rate_wait_seconds", wait)
+            await asyncio.sleep(wait)
+        return wait
+
+    def throttle(self, retry_after: float | None = None) -> None:
+        inc("sec_throttled")
+        self._update("throttle", retry_after)
+
+    async def athrottle(self, retry_after: float | None = None) -> None:
+        inc("sec_throttled")
+        await self._aupdate("throttle", retry_after)
+
+class FileRateLimiter(RateLimiter):
+    # every process on the host locks, reads and rewrites one small JSON state file
+    shared = True
+
+    def __init__(self, rate: float, path: str | Path):
+        super().__init__(rate)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _update(self, op: str, retry_after: float | None = None) -> float:
+        with self._lock, open(self.path, "a+", encoding="utf-8") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.seek(0)
+            try:
+                state = json.loads(fp.read() or "{}")
+            except ValueError:
+                state = {}
+            state, wait = _apply(state, op, time.time(), self.rate, retry_after)
+            fp.seek(0)
+            fp.truncate()
+            fp.write(json.dumps(state))
+            fp.flush()
+        return wait
+
+# _apply in Lua, on Redis' clock so hosts with skewed clocks still share one schedule
+_REDIS_SCRIPT = """
+local s = redis.call('HMGET', KEYS[1], 'tat', 'blocked', 'factor', 'factor_at')
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, op, retry_after = tonumber(ARGV[1]), ARGV[2], tonumber(ARGV[3])
+local min_factor, recovery, default_pause, max_pause = tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6]), tonumber(ARGV[7])
+local tat, blocked = tonumber(s[1]) or 0, tonumber(s[2]) or 0
+local factor = math.min(1, (tonumber(s[3]) or 1) + (now - (tonumber(s[4]) or now)) * recovery)
+local wait = 0
+if op == 'throttle' then
+  factor = math.max(min_factor, factor / 2)
+  local pause = retry_after
+  if pause < 0 then pause = default_pause / factor end
+  blocked = math.max(blocked, now + math.min(max_pause, pause))
+else
+  local start = math.max(tat, now, blocked)
+  wait = start - now
+  tat = start + 1 / (rate * factor)
+end
+redis.call('HSET', KEYS[1], 'tat', tostring(tat), 'blocked', tostring(blocked), 'factor', tostring(factor), 'factor_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+class RedisRateLimiter(RateLimiter):
+    # one budget for every host; an unreachable Redis degrades to this process's own bucket
+    shared = True
+
+    def __init__(self, rate: float, url: str | None = None, client=None, key: str = "edgar:sec:ratelimit"):
+        super().__init__(rate)
+        if client is None:
+            if redis is None:
+                raise RuntimeError("redis is not installed (pip install edgar-model-builder[redis])")
+            client = redis.Redis.from_url(url or settings.redis_url)
+        self.client = client
+        self.key = key
+        self._script = client.register_script(_REDIS_SCRIPT)
+
+    def _update(self, op: str, retry_after: float | None = None) -> float:
+        try:
+            return float(self._script(keys=[self.key], args=[
+                self.rate, op, -1 if retry_after is None else retry_after,
+                MIN_FACTOR, RECOVERY, DEFAULT_PAUSE, MAX_PAUSE,
+            ]))
+        except Exception:
+            inc("sec_rate_redis_errors")
+            return super()._update(op, retry_after)
+
+def default_rate_file() -> Path:
+    # host-wide by default, whatever directory each process runs from
+    return Path(settings.sec_rate_file or os.path.join(tempfile.gettempdir(), "edgar-sec-ratelimit.json"))
+
+def default_limiter() -> RateLimiter:
+    backend = settings.sec_rate_backend
+    if backend == "redis":
+        return RedisRateLimiter(settings.sec_rps)
+    if backend == "file" and fcntl is not None:
+        return FileRateLimiter(settings.sec_rps, default_rate_file())
+    if backend not in ("file", "local"):
+        raise ValueError(f"Unknown SEC_RATE_BACKEND: {backend}")
+    return RateLimiter(settings.sec_rps)
+
+def retry_after(headers) -> float | None:
+    # Retry-After is either delay-seconds or an HTTP date
+    raw = headers.get("Retry-After")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
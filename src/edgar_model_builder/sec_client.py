@@ -1,11 +1,58 @@
+import asyncio
+import json
+import shutil
+import tempfile
+from typing import Any, BinaryIO
 import httpx
-from aiolimiter import AsyncLimiter
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from tenacity.wait import wait_base
+from .cache import make_key, remote_cache
+from .http_cache import CacheEntry, OfflineCacheMiss, ResponseCache
+from .metrics import inc
+from .ratelimit import MAX_PAUSE, RateLimiter, default_limiter, retry_after
 from .settings import settings
 
+SHARED_MAX_BYTES = 64 * 1024 * 1024
+
+def default_cache() -> ResponseCache | None:
+    if not settings.sec_cache_dir:
+        return None
+    return ResponseCache(settings.sec_cache_dir, settings.sec_cache_max_mb * 1024 * 1024)
+
+def _retryable(e: BaseException) -> bool:
+    # a 404 is an answer (e.g. no frame for that tag and period), not a transient failure
+    if isinstance(e, OfflineCacheMiss):
+        return False
+    return not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404)
+
+class wait_retry_after(wait_base):
+    # the server's Retry-After when it sent one, otherwise the fallback schedule
+    def __init__(self, fallback: wait_base):
+        self.fallback = fallback
+
+    def __call__(self, retry_state) -> float:
+        e = retry_state.outcome.exception()
+        delay = retry_after(e.response.headers) if isinstance(e, httpx.HTTPStatusError) else None
+        if delay is None:
+            return self.fallback(retry_state)
+        inc("sec_retry_after_seconds", min(MAX_PAUSE, delay))
+        return min(MAX_PAUSE, delay)
+
 class SecClient:
-    def __init__(self):
-        self._limiter = AsyncLimiter(max_rate=settings.sec_rps, time_period=1.0)
+    def __init__(self, cache: ResponseCache | None = None, max_age: float | None = None,
+                 offline: bool | None = None, transport: httpx.AsyncBaseTransport | None = None, shared=None,
+                 limiter: RateLimiter | None = None):
+        # shared with every other process on the host (or cluster, with SEC_RATE_BACKEND=redis)
+        self._limiter = limiter if limiter is not None else default_limiter()
+        self._cache = cache if cache is not None else default_cache()
+        self._shared = shared if shared is not None else remote_cache()
+        self._scratch = None
+        if self._cache is None:
+            # bodies are always spooled to disk so they can be parsed incrementally
+            self._scratch = tempfile.mkdtemp(prefix="edgar-sec-")
+            self._cache = ResponseCache(self._scratch, max_bytes=1 << 62)
+        self._max_age = settings.sec_cache_max_age if max_age is None else max_age
+        self._offline = settings.sec_offline if offline is None else offline
         self._client = httpx.AsyncClient(
             timeout=httpx.Timeout(30.0),
             headers={
@@ -13,25 +60,115 @@ class SecClient:
                 "Accept-Encoding": "gzip, deflate, br",
                 "Accept": "application/json",
             },
+            transport=transport,
         )
 
     async def aclose(self):
         await self._client.aclose()
+        if self._scratch:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+
+    @retry(
+        stop=stop_after_attempt(5),
+        wait=wait_retry_after(wait_exponential(multiplier=0.6, min=0.6, max=8)),
+        retry=retry_if_exception(_retryable),
+        before_sleep=lambda _: inc("sec_http_retries"),
+    )
+    async def fetch(self, url: str) -> CacheEntry:
+        entry = self._cache.get(url)
+        if entry is None and self._shared is not None:
+            # another host may already hold this body (and validators) in the shared tier
+            # (Redis round trips and file copies run in a worker thread, off the event loop)
+            blob = await asyncio.to_thread(self._shared.get, make_key("sec", url))
+            if blob is not None:
+                inc("sec_shared_cache_hits")
+                entry = await asyncio.to_thread(self._cache.import_, blob)
+        if entry is not None and (self._offline or entry.age <= self._max_age):
+            inc("sec_cache_hits")
+            return entry
+        if self._offline:
+            raise OfflineCacheMiss(f"Offline and not cached: {url}")
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        await self._limiter.acquire()
+        inc("sec_http_requests")
+        async with self._client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 304 and entry is not None:
+                inc("sec_http_not_modified")
+                self._cache.touch(entry, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+                return entry
+            if r.status_code in (429, 403):
+                # SEC's throttling answers: slow every client sharing the limiter, not just this request
+                await self._limiter.athrottle(retry_after(r.headers))
+            r.raise_for_status()
+            pending = self._cache.begin(url, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+            try:
+                async for chunk in r.aiter_bytes():
+                    inc("sec_http_bytes", len(chunk))
+                    pending.write(chunk)
+            except BaseException:
+                pending.abort()
+                raise
+            entry = pending.commit()
+        if self._shared is not None and entry.size <= SHARED_MAX_BYTES:
+            await asyncio.to_thread(self._share, url, entry)
+        return entry
+
+    def _share(self, url: str, entry: CacheEntry) -> None:
+        self._shared.set(make_key("sec", url), self._cache.export(entry), settings.cache_ttl)
+
+    async def get_bytes(self, url: str) -> bytes:
+        return self._cache.read(await self.fetch(url))
 
-    @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=0.6, min=0.6, max=8))
     async def get_json(self, url: str):
-        async with self._limiter:
-            r = await self._client.get(url)
-        r.raise_for_status()
-        return r.json()
+        return json.loads(await self.get_bytes(url))
+
+    async def get_json_changed(self, url: str, seen: str | None) -> tuple[str, Any]:
+        # (body digest, parsed body), the body None while the digest is still `seen`: a poll that
+        # revalidates to 304 costs neither a download nor a parse
+        entry = await self.fetch(url)
+        if entry.sha256 == seen:
+            return seen, None
+        return entry.sha256, json.loads(self._cache.read(entry))
+
+    async def open(self, url: str) -> BinaryIO:
+        return self._cache.open(await self.fetch(url))
 
     async def tickers(self):
-        return await self.get_json("https://www.sec.gov/files/company_tickers.json")
+        return await self.get_json(f"{settings.sec_www_base}/files/company_tickers.json")
+
+    def companyfacts_url(self, cik: int) -> str:
+        cik10 = str(cik).zfill(10)
+        return f"{settings.sec_data_base}/api/xbrl/companyfacts/CIK{cik10}.json"
 
     async def companyfacts(self, cik: int):
+        return await self.get_json(self.companyfacts_url(cik))
+
+    async def companyfacts_stream(self, cik: int) -> BinaryIO:
+        return await self.open(self.companyfacts_url(cik))
+
+    def submissions_url(self, cik: int) -> str:
         cik10 = str(cik).zfill(10)
-        return await self.get_json(f"https://data.sec.gov/api/xbrl/companyfacts/CIK{cik10}.json")
+        return f"{settings.sec_data_base}/submissions/CIK{cik10}.json"
 
     async def submissions(self, cik: int):
-        cik10 = str(cik).zfill(10)
-        return await self.get_json(f"https://data.sec.gov/submissions/CIK{cik10}.json")
+        return await self.get_json(self.submissions_url(cik))
+
+    async def submissions_changed(self, cik: int, seen: str | None) -> tuple[str, Any]:
+        return await self.get_json_changed(self.submissions_url(cik), seen)
+
+    def frames_url(self, taxonomy: str, tag: str, unit: str, period: str) -> str:
+        # compound units are spelled USD-per-shares in frames URLs (USD/shares in companyfacts)
+        unit = unit.replace("/", "-per-")
+        return f"{settings.sec_data_base}/api/xbrl/frames/{taxonomy}/{tag}/{unit}/{period}.json"
+
+    async def frames(self, taxonomy: str, tag: str, unit: str, period: str):
+        return await self.get_json(self.frames_url(taxonomy, tag, unit, period))
+
+    async def frames_stream(self, taxonomy: str, tag: str, unit: str, period: str) -> BinaryIO:
+        return await self.open(self.frames_url(taxonomy, tag, unit, period))
@@ -0,0 +1,115 @@
+import os
+from pathlib import Path
+import pandas as pd
+from sqlalchemy import select
+from .db import SessionLocal
+from .models import FactLatest
+from .query import fact_watermark as watermark
+from .settings import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # optional: pip install edgar-model-builder[snapshots]
+    pa = pc = None
+
+COLUMNS = ["taxonomy", "tag", "form_class", "unit", "end", "val", "filed", "fact_id"]
+_DICT_COLUMNS = ("taxonomy", "tag", "form_class", "unit")
+
+def available() -> bool:
+    return pa is not None
+
+def enabled() -> bool:
+    return settings.fact_snapshots and available()
+
+def snapshot_path(cik: int) -> Path:
+    return Path(settings.artifacts_dir) / "snapshots" / f"CIK{cik:010d}.arrow"
+
+def mark_path(cik: int) -> Path:
+    # watermark of the CIK's fact_latest rows as of the last write, saved by every path that changes them
+    return snapshot_path(cik).with_suffix(".mark")
+
+def saved_watermark(cik: int) -> str | None:
+    try:
+        return mark_path(cik).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+
+def record_watermark(cik: int, mark: str | None = None) -> None:
+    path = mark_path(cik)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(watermark(cik) if mark is None else mark, encoding="utf-8")
+    os.replace(tmp, path)
+
+def facts_changed(cik: int | None) -> None:
+    # called after a write to fact_latest: rewrites the snapshot, or at least moves its saved watermark
+    # so the stale file is never read. None means every CIK changed
+    if cik is None:
+        for path in (Path(settings.artifacts_dir) / "snapshots").glob("*.mark"):
+            path.unlink(missing_ok=True)
+    elif enabled():
+        write_snapshot(cik)
+    elif snapshot_path(cik).exists():
+        record_watermark(cik)
+
+def _schema(mark: str):
+    fields = []
+    for name in COLUMNS:
+        if name in _DICT_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif name in ("end", "filed"):
+            fields.append(pa.field(name, pa.timestamp("ns")))
+        elif name == "val":
+            fields.append(pa.field(name, pa.float64()))
+        else:
+            fields.append(pa.field(name, pa.int64()))
+    return pa.schema(fields, metadata={"watermark": mark})
+
+def write_snapshot(cik: int) -> Path:
+    mark = watermark(cik)
+    s = SessionLocal()
+    try:
+        rows = s.execute(
+            select(*(getattr(FactLatest, c) for c in COLUMNS))
+            .where(FactLatest.cik == cik)
+            .order_by(FactLatest.fact_id)
+        ).all()
+    finally:
+        s.close()
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    table = pa.Table.from_pandas(df, schema=_schema(mark), preserve_index=False)
+    path = snapshot_path(cik)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    record_watermark(cik, mark)
+    return path
+
+def read_rows(cik: int, pairs: list[tuple[str, str]], form_class: str,
+              verify: bool | None = None) -> pd.DataFrame | None:
+    # Arrow IPC files are memory-mapped, so filtering only touches the pages it reads.
+    # Returns None when there is no snapshot or it is older than the watermark saved by the last
+    # ingest; the database is only asked with verify (FACT_SNAPSHOTS_VERIFY=1, for writers outside
+    # this package) or when no watermark was saved
+    path = snapshot_path(cik)
+    if not path.exists():
+        return None
+    verify = settings.fact_snapshots_verify if verify is None else verify
+    expected = None if verify else saved_watermark(cik)
+    if expected is None:
+        expected = watermark(cik)
+        record_watermark(cik, expected)
+    with pa.memory_map(str(path), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        if (table.schema.metadata or {}).get(b"watermark", b"").decode() != expected:
+            return None
+        table = table.filter(pc.equal(table["form_class"], form_class))
+        keys = pc.binary_join_element_wise(
+            table["taxonomy"].cast(pa.string()), table["tag"].cast(pa.string()), "\x1f"
+        )
+        table = table.filter(pc.is_in(keys, value_set=pa.array([f"{t}\x1f{g}" for t, g in pairs])))
+        plain = pa.schema([pa.field(f.name, pa.string()) if f.name in _DICT_COLUMNS else f for f in table.schema])
+        return table.cast(plain).to_pandas()
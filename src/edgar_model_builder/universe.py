@@ -0,0 +1,164 @@
+import asyncio
+from dataclasses import dataclass, field
+import httpx
+from sqlalchemy import select
+from .db import AsyncSessionLocal, async_database
+from .ingest import (LoadResult, aingest_companyfacts_stream, aload_facts, aload_frame, aformless_frame_accns,
+                     aresolve_frame_forms, frame_period, ingest_state,
+                     iter_companyfacts, iter_frame, state_tags)
+from .metrics import inc
+from .models import IngestState
+from .query import aget_companies_by_ticker
+
+@dataclass
+class TickerResult:
+    ticker: str
+    ok: bool
+    inserted: int = 0
+    skipped: int = 0
+    error: str | None = None
+
+async def ingest_universe(client, tickers: list[str], concurrency: int = 4, writers: int = 2,
+                          mapping=None) -> list[TickerResult]:
+    # fetchers share the client's rate limiter and spool bodies to disk; writers parse them
+    # incrementally on the async engine, each on its own long-lived session, and the bounded
+    # queue caps how many open documents wait on the DB
+    async with async_database():
+        return await _ingest_universe(client, tickers, concurrency, writers, mapping)
+
+async def _ingest_universe(client, tickers: list[str], concurrency: int, writers: int, mapping) -> list[TickerResult]:
+    results: dict[str, TickerResult] = {}
+    todo: asyncio.Queue = asyncio.Queue()
+    companies = await aget_companies_by_ticker(tickers)
+    for t in tickers:
+        co = companies.get(t.upper())
+        if co is None:
+            results[t] = TickerResult(t, False, error="unknown ticker (sync tickers first)")
+        else:
+            todo.put_nowait((t, co.cik))
+    payloads: asyncio.Queue = asyncio.Queue(maxsize=max(1, writers))
+
+    async def fetcher():
+        while True:
+            try:
+                t, cik = todo.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                fp = await client.companyfacts_stream(cik)
+            except Exception as e:
+                results[t] = TickerResult(t, False, error=f"fetch failed: {e}")
+                continue
+            await payloads.put((t, cik, fp))
+
+    async def writer():
+        async with AsyncSessionLocal() as session:
+            while True:
+                item = await payloads.get()
+                if item is None:
+                    return
+                t, cik, fp = item
+                try:
+                    res = await aingest_companyfacts_stream(cik, fp, session=session, mapping=mapping)
+                    results[t] = TickerResult(t, True, inserted=res.inserted, skipped=res.skipped)
+                except Exception as e:
+                    results[t] = TickerResult(t, False, error=f"ingest failed: {e}")
+                finally:
+                    fp.close()
+
+    writer_tasks = [asyncio.create_task(writer()) for _ in range(max(1, writers))]
+    await asyncio.gather(*(fetcher() for _ in range(max(1, concurrency))))
+    for _ in writer_tasks:
+        await payloads.put(None)
+    await asyncio.gather(*writer_tasks)
+
+    return [results[t] for t in tickers]
+
+async def backfill_mapping(client, ciks: list[int], mapping) -> dict[int, LoadResult]:
+    # slim-ingested CIKs lack whatever tags the mapping gained since; load just those from the
+    # companyfacts document, which the client serves from its HTTP cache or revalidates/re-fetches
+    out = {}
+    async with async_database(), AsyncSessionLocal() as session:
+        q = select(IngestState).where(IngestState.cik.in_(ciks))
+        states = {st.cik: st for st in (await session.execute(q)).scalars()}
+        for cik in ciks:
+            have = state_tags(states.get(cik))
+            missing = mapping.tags - have if have is not None else None
+            if not missing:
+                continue
+            inc("backfill_tags", len(missing))
+            with await client.companyfacts_stream(cik) as fp:
+                out[cik] = await aload_facts(cik, iter_companyfacts(fp, missing), session=session,
+                                             state=ingest_state(cik, mapping, have | missing))
+    return out
+
+@dataclass
+class FramesResult:
+    requests: int = 0
+    # (tag, unit, period) combinations the SEC has no frame for, e.g. a duration tag at an instant period
+    missing: int = 0
+    loaded: LoadResult = field(default_factory=LoadResult)
+    # filings whose form was read from the filer's submissions, putting their rows into fact_latest
+    resolved: int = 0
+    # filings still without a form (not in the submissions' recent list, or resolve_forms=False)
+    unresolved: int = 0
+    failed: dict[str, str] = field(default_factory=dict)
+
+async def ingest_frames(client, mapping, periods: list[str], units: list[str] | None = None,
+                        concurrency: int = 4, resolve_forms: bool = False) -> FramesResult:
+    # one frames document per mapped tag, unit and period covers every filer at once; documents are
+    # fetched concurrently and loaded one at a time on a single session. Frames don't say which
+    # form a value came from; with resolve_forms each pending filer's submissions map accession
+    # numbers to forms, one request per filer, so it is off for full-market loads
+    for p in periods:
+        frame_period(p)
+    units = units or mapping.unit_priority[:1]
+    jobs = [(tx, tag, u, p) for tx, tag in sorted(mapping.tags) for u in units for p in periods]
+    result = FramesResult(requests=len(jobs))
+    sem = asyncio.Semaphore(max(1, concurrency))
+    write = asyncio.Lock()
+
+    async with async_database(), AsyncSessionLocal() as session:
+        async def one(job):
+            name = "/".join(job)
+            async with sem:
+                try:
+                    fp = await client.frames_stream(*job)
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 404:
+                        result.missing += 1
+                    else:
+                        result.failed[name] = f"fetch failed: {e}"
+                    return
+                except Exception as e:
+                    result.failed[name] = f"fetch failed: {e}"
+                    return
+            with fp:
+                async with write:
+                    try:
+                        result.loaded += await aload_frame(iter_frame(fp, *job), session=session)
+                    except Exception as e:
+                        result.failed[name] = f"ingest failed: {e}"
+
+        await asyncio.gather(*(one(j) for j in jobs))
+
+        pending = await aformless_frame_accns(session)
+        if resolve_forms and pending:
+            forms = {}
+
+            async def resolve(cik: int, accns: set[str]):
+                async with sem:
+                    try:
+                        doc = await client.submissions(cik)
+                    except Exception as e:
+                        result.failed[f"submissions/{cik}"] = f"fetch failed: {e}"
+                        return
+                recent = (doc.get("filings") or {}).get("recent") or {}
+                found = {a: f for a, f in zip(recent.get("accessionNumber", []), recent.get("form", [])) if a in accns}
+                if found:
+                    forms[cik] = found
+
+            await asyncio.gather(*(resolve(cik, accns) for cik, accns in pending.items()))
+            result.resolved = await aresolve_frame_forms(forms, session)
+        result.unresolved = sum(len(a) for a in pending.values()) - result.resolved
+    return result
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from sqlalchemy import func, select
+from .db import AsyncSessionLocal, async_database
+from .jobs import enqueue_universe
+from .metrics import inc
+from .models import Fact
+from .query import aget_companies_by_ticker
+
+# filings that carry financial statements into companyfacts
+PERIODIC_FORMS = frozenset({"10-K", "10-Q", "20-F", "40-F", "10-K/A", "10-Q/A", "20-F/A", "40-F/A"})
+CHUNK = 500
+
+@dataclass
+class PollResult:
+    polled: int = 0
+    # submissions documents that revalidated to the body already checked
+    unchanged: int = 0
+    # ticker -> newest filing facts has not seen
+    new: dict[str, str] = field(default_factory=dict)
+    failed: dict[str, str] = field(default_factory=dict)
+    queued: int = 0
+
+def periodic_filings(doc: dict) -> list[tuple[str, str]]:
+    # (accession number, filing date) of the XBRL periodic reports in the recent list, newest first
+    r = (doc.get("filings") or {}).get("recent") or {}
+    rows = zip(r.get("accessionNumber", []), r.get("form", []), r.get("filingDate", []), r.get("isXBRL", []))
+    return sorted(((a, d) for a, f, d, x in rows if f in PERIODIC_FORMS and x), key=lambda r: r[1], reverse=True)
+
+async def unseen_filings(session, candidates: dict[int, list[tuple[str, str]]], handled=None) -> dict[int, str]:
+    # newest filing per CIK whose accession number is missing from facts, looking only at filings
+    # on or after the CIK's latest stored filing date (older ones may simply predate the ingest).
+    # handled(cik, accn) drops filings already ingested that brought no facts (see poll)
+    handled = handled or (lambda cik, accn: False)
+    out = {}
+    ciks = list(candidates)
+    for i in range(0, len(ciks), CHUNK):
+        chunk = ciks[i:i + CHUNK]
+        q = select(Fact.cik, func.max(Fact.filed)).where(Fact.cik.in_(chunk)).group_by(Fact.cik)
+        latest = {cik: filed for cik, filed in (await session.execute(q)).all() if filed is not None}
+        recent = {}
+        for cik in chunk:
+            since = latest[cik].date().isoformat() if cik in latest else None
+            fs = [a for a, d in candidates[cik] if (since is None or d >= since) and not handled(cik, a)]
+            if fs and since is None:
+                out[cik] = fs[0]  # nothing ingested yet
+            elif fs:
+                recent[cik] = fs
+        if not recent:
+            continue
+        q = (select(Fact.cik, Fact.accn).distinct()
+             .where(Fact.cik.in_(list(recent)), Fact.accn.in_([a for fs in recent.values() for a in fs])))
+        stored = set((await session.execute(q)).all())
+        for cik, fs in recent.items():
+            new = [a for a in fs if (cik, a) not in stored]
+            if new:
+                out[cik] = new[0]
+    return out
+
+async def poll(client, ciks: dict[str, int], seen: dict[int, str], concurrency: int = 4,
+               queue=None) -> PollResult:
+    # conditional GETs of each company's submissions document; only bodies that changed since the
+    # last poll are parsed and checked against facts. A CIK is marked seen once it has nothing new,
+    # so a filing whose ingest has not landed yet is checked (and re-queued) on every poll. Some
+    # filings never reach facts (a 10-K/A without financial data, or no mapped tags under
+    # SLIM_INGEST=1), so with a queue a filing whose ingest job finished counts as handled
+    res = PollResult(polled=len(ciks))
+    tickers_of: dict[int, list[str]] = {}
+    for t, cik in ciks.items():
+        tickers_of.setdefault(cik, []).append(t)
+
+    def handled(cik: int, accn: str) -> bool:
+        jobs = (queue.key_job(f"ingest:{t}:{accn}") for t in tickers_of.get(cik, []))
+        return any(j is not None and j.status == "done" for j in jobs)
+
+    candidates: dict[int, list[tuple[str, str]]] = {}
+    digests: dict[int, str] = {}
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(t: str, cik: int):
+        async with sem:
+            try:
+                digest, doc = await client.submissions_changed(cik, seen.get(cik))
+            except Exception as e:
+                res.failed[t] = f"submissions failed: {e}"
+                return
+        if doc is None:
+            res.unchanged += 1
+            return
+        digests[cik] = digest
+        candidates[cik] = periodic_filings(doc)
+
+    await asyncio.gather(*(one(t, cik) for t, cik in ciks.items()))
+    async with AsyncSessionLocal() as session:
+        new = await unseen_filings(session, candidates, handled if queue is not None else None)
+    for cik, digest in digests.items():
+        if cik not in new:
+            seen[cik] = digest
+    res.new = {t: new[cik] for t, cik in ciks.items() if cik in new}
+    inc("watch_polls", res.polled)
+    inc("watch_unchanged", res.unchanged)
+    inc("watch_new_filings", len(res.new))
+    return res
+
+async def watch(client, queue, targets: list[str], peers_of: dict[str, list[str]], mapping_path: str,
+                interval: float = 300.0, concurrency: int = 4, cycles: int | None = None,
+                on_poll=None) -> PollResult:
+    # polls every company in the packs, then queues ingest jobs for the companies with new filings
+    # and rebuilds of the packs that include them, keyed by accession number so repeated polls
+    # (and other watchers) never queue the same filing twice
+    needed = list(dict.fromkeys(targets + [p for t in targets for p in peers_of.get(t, [])]))
+    seen: dict[int, str] = {}
+    n = 0
+    async with async_database():
+        companies = await aget_companies_by_ticker(needed)
+        ciks = {t: companies[t].cik for t in needed if t in companies}
+        while True:
+            start = time.monotonic()
+            res = await poll(client, ciks, seen, concurrency, queue)
+            for t in needed:
+                if t not in ciks:
+                    res.failed[t] = "unknown ticker (sync tickers first)"
+            if res.new:
+                jobs = enqueue_universe(queue, targets, peers_of, mapping_path, "", accns=res.new)
+                res.queued = sum(1 for _, created in jobs if created)
+            if on_poll:
+                on_poll(res)
+            n += 1
+            if cycles and n >= cycles:
+                return res
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
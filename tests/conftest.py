@@ -0,0 +1,39 @@
+import os
+import tempfile
+from pathlib import Path
+
+_tmp = Path(tempfile.mkdtemp(prefix="edgar-tests-"))
+os.environ.setdefault("SEC_USER_AGENT", "edgar-tests tests@example.com")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp / 'edgar.db'}")
+os.environ.setdefault("ARTIFACTS_DIR", str(_tmp / "artifacts"))
+os.environ.setdefault("MARKETDATA_PROVIDER", "none")
+os.environ.setdefault("CACHE_BACKENDS", "none")
+os.environ.setdefault("SEC_CACHE_DIR", str(_tmp / "sec"))
+os.environ.setdefault("CHART_CACHE_DIR", str(_tmp / "charts"))
+os.environ.setdefault("SEC_RATE_FILE", str(_tmp / "sec-ratelimit.json"))
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    from edgar_model_builder import models  # noqa: F401
+    from edgar_model_builder.db import Base, engine
+    from edgar_model_builder.query import ticker_index
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    ticker_index.invalidate()
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+
+
+def companyfacts(facts: dict) -> dict:
+    return {"cik": 320193, "entityName": "Test Co", "facts": facts}
+
+
+def fact(end, val, filed="2024-02-01", form="10-K", accn="0000000000-24-000001", start=None, fy=2023, fp="FY"):
+    row = {"end": end, "val": val, "filed": filed, "form": form, "accn": accn, "fy": fy, "fp": fp}
+    if start:
+        row["start"] = start
+    return row
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parents[1] / "benchmarks"
+sys.path.insert(0, str(BENCH))
+
+
+def _results(**p50):
+    return {"params": {"tags": 1}, "stages": {s: {"p50": v} for s, v in p50.items()}}
+
+
+def test_compare_flags_only_real_regressions():
+    from suite import compare
+
+    base = _results(parse=1.0, compute_kpis=0.001)
+    assert compare(_results(parse=1.2, compute_kpis=0.002), base, 0.25) == []
+    assert [r.split(":")[0] for r in compare(_results(parse=1.3, compute_kpis=0.001), base, 0.25)] == ["parse"]
+    assert compare({**_results(parse=9.0), "params": {"tags": 2}}, base, 0.25) == []
+
+
+def test_compare_scales_the_baseline_by_calibration():
+    from suite import compare
+
+    base = {**_results(parse=1.0), "calibration": 0.1}
+    # a machine twice as slow: 1.9s is within budget, 2.6s is not
+    assert compare({**_results(parse=1.9), "calibration": 0.2}, base, 0.25) == []
+    assert len(compare({**_results(parse=2.6), "calibration": 0.2}, base, 0.25)) == 1
+    assert len(compare({**_results(parse=0.7), "calibration": 0.05}, base, 0.25)) == 1
+
+
+def test_suite_runs_offline_and_gates_on_baseline(tmp_path):
+    scratch = tmp_path / "tmp"
+    scratch.mkdir()
+    env = {**os.environ, "TMPDIR": str(scratch),
+           "PYTHONPATH": os.pathsep.join(filter(None, [str(BENCH.parent / "src"), os.environ.get("PYTHONPATH")]))}
+    base = tmp_path / "baseline.json"
+    cmd = [sys.executable, str(BENCH / "suite.py"), "--tags", "12", "--years", "3", "--repeat", "1",
+           "--baseline", str(base)]
+    subprocess.run(cmd + ["--save-baseline"], env=env, check=True, capture_output=True)
+    saved = json.loads(base.read_text())
+    assert set(saved["stages"]) == {"parse", "ingest_companyfacts", "build_statement_history", "compute_kpis",
+                                    "build_comps_table", "build_model_xlsx", "build_pack_pdf"}
+    assert saved["stages"]["parse"]["rows"] == saved["stages"]["ingest_companyfacts"]["rows"] > 0
+    assert saved["calibration"] > 0
+    assert list(scratch.iterdir()) == []
+
+    for stat in saved["stages"].values():
+        stat["p50"] /= 100
+    base.write_text(json.dumps(saved))
+    res = subprocess.run(cmd + ["--min-delta", "0"], env=env, capture_output=True, text=True)
+    assert res.returncode == 1 and "REGRESSION" in res.stderr
+
+
+def test_committed_baseline_covers_the_default_run():
+    from suite import STAGES
+
+    saved = json.loads((BENCH / "baseline.json").read_text())
+    # the documented `python benchmarks/suite.py` gates against it: default scale, scratch SQLite
+    assert saved["params"] == {"tags": 200, "units": 1, "years": 20, "restatements": 1.0, "dialect": "sqlite"}
+    assert set(saved["stages"]) == set(STAGES)
+    assert saved["calibration"] > 0
@@ -0,0 +1,62 @@
+import json
+import zipfile
+from pathlib import Path
+
+from conftest import companyfacts, fact
+
+
+def _archive(path, accn="0000000000-24-000001", broken=True):
+    doc = companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 1.0, accn=accn), fact("2022-12-31", 2.0, accn=accn)]}}}})
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("CIK0000000001.json", json.dumps(doc))
+        zf.writestr("CIK0000000002.json", json.dumps(doc))
+        zf.writestr("CIK0000000003.json", "{not json" if broken else json.dumps(doc))
+        zf.writestr("README.txt", "ignored")
+    return path
+
+
+def test_ingest_bulk_filters_and_resumes(db, tmp_path):
+    from edgar_model_builder.bulk import ingest_bulk
+
+    path = _archive(tmp_path / "companyfacts.zip")
+
+    first = ingest_bulk(path, ciks={1, 3}, workers=2)
+    assert first.members == 2
+    assert first.loaded.inserted == 2
+    assert list(first.failed) == ["CIK0000000003.json"]
+
+    second = ingest_bulk(path, workers=1)
+    assert (second.members, second.resumed) == (3, 1)
+    assert second.loaded.inserted == 2
+
+
+def test_new_archive_at_the_same_path_is_loaded(db, tmp_path):
+    from edgar_model_builder.bulk import default_checkpoint, ingest_bulk
+
+    path = _archive(tmp_path / "companyfacts.zip")
+    first = ingest_bulk(path, workers=1)
+    assert first.loaded.inserted == 4 and list(first.failed) == ["CIK0000000003.json"]
+    assert default_checkpoint(path).exists()  # kept so the failed member can be retried
+
+    # tomorrow's archive, downloaded over today's
+    _archive(path, accn="0000000000-25-000001", broken=False)
+    second = ingest_bulk(path, workers=1)
+    assert (second.resumed, second.loaded.inserted, second.failed) == (0, 6, {})
+    assert not default_checkpoint(path).exists()
+
+
+def test_parse_member_spools_batches(tmp_path, monkeypatch):
+    from edgar_model_builder import bulk
+
+    path = _archive(tmp_path / "companyfacts.zip")
+    monkeypatch.setattr(bulk, "BATCH_SIZE", 1)
+    bulk._init_worker(str(path))
+    member, spooled = bulk._parse_member("CIK0000000001.json", str(tmp_path))
+    # the worker hands back a file of batches, not the rows themselves
+    assert isinstance(spooled, str)
+    assert [r[4] for r in bulk._spooled_rows(spooled)] == ["2023-12-31", "2022-12-31"]
+    member, err = bulk._parse_member("CIK0000000003.json", str(tmp_path))
+    assert isinstance(err, Exception)
+    # a member that fails to parse leaves no spool file behind
+    assert sorted(tmp_path.iterdir()) == sorted([path, Path(spooled)])
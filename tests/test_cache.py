@@ -0,0 +1,74 @@
+import pytest
+
+from edgar_model_builder.cache import DiskCache, MemoryCache, RedisCache, TieredCache, make_key, set_cache
+
+from conftest import companyfacts, fact
+
+
+def test_memory_cache_is_lru_and_expires(monkeypatch):
+    c = MemoryCache(max_items=2)
+    c.set("a", 1)
+    c.set("b", None)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b", "miss") == "miss"
+    c.set("t", 4, ttl=0.001)
+    import time
+    time.sleep(0.01)
+    assert c.get("t") is None
+
+
+def test_tiered_cache_backfills_from_disk_and_redis(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis_tier = RedisCache(client=fakeredis.FakeRedis())
+    redis_tier.set("k", {"v": 1}, ttl=60)
+
+    memory, disk = MemoryCache(), DiskCache(tmp_path)
+    tiered = TieredCache([memory, disk, redis_tier])
+    assert tiered.get("k") == {"v": 1}
+    assert memory.get("k") == {"v": 1}
+    assert disk.get("k") == {"v": 1}
+
+    # an entry this version can't unpickle is a miss, not an error
+    redis_tier.client.set("bad", b"\x80\x05not a pickle")
+    assert redis_tier.get("bad", "miss") == "miss"
+
+
+def test_history_cache_keys_follow_mapping_and_new_facts(db):
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.mappings import Mapping, TagRef
+    from edgar_model_builder.metrics import metrics
+    from edgar_model_builder.normalize import build_statement_history
+
+    cache = MemoryCache()
+    set_cache(cache)
+    try:
+        rev = Mapping(["USD"], {"revenue": [TagRef("us-gaap", "Revenues")]})
+        ni = Mapping(["USD"], {"revenue": [TagRef("us-gaap", "NetIncomeLoss")]})
+        assert rev.digest != ni.digest
+        ingest_companyfacts(1, companyfacts({"us-gaap": {
+            "Revenues": {"units": {"USD": [fact("2023-12-31", 100.0, accn="A1")]}},
+            "NetIncomeLoss": {"units": {"USD": [fact("2023-12-31", 7.0, accn="A1")]}},
+        }}))
+
+        first = build_statement_history(1, rev, "FY")
+        first["revenue"] = 0.0  # callers own their copy
+        metrics.reset()
+        assert build_statement_history(1, rev, "FY")["revenue"].tolist() == [100.0]
+        assert metrics.snapshot()["counters"]["cache_memory_hits"] == 1
+        assert build_statement_history(1, ni, "FY")["revenue"].tolist() == [7.0]
+
+        ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+            fact("2023-12-31", 110.0, accn="A2", filed="2025-01-01"),
+        ]}}}}))
+        assert build_statement_history(1, rev, "FY")["revenue"].tolist() == [110.0]
+    finally:
+        set_cache(None)
+
+
+def test_make_key_is_versioned_and_stable():
+    from edgar_model_builder import __version__
+
+    assert make_key("history", 1, "abc", "FY") == make_key("history", 1, "abc", "FY")
+    assert make_key("history", 1, "abc", "FY") != make_key("history", 1, "abc", "Q")
+    assert f":{__version__}:" in make_key("x")
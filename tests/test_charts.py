@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+
+def _specs():
+    from edgar_model_builder.charts import pack_charts
+
+    fy = pd.DataFrame({"revenue": [100.0, 120.0, np.nan], "net_income": [10.0, 12.0, 15.0]},
+                      index=pd.to_datetime(["2021-12-31", "2022-12-31", "2023-12-31"]))
+    comps = pd.DataFrame({"ticker": ["AAA", "BBB"], "EV/EBITDA": [12.5, None]})
+    return pack_charts("AAA", fy, comps, {"WACC": 0.10, "Terminal_Growth": 0.03})
+
+
+def test_pack_charts_are_cached_by_content(monkeypatch):
+    from edgar_model_builder import charts
+
+    specs = _specs()
+    assert [s.kind for s in specs] == ["line", "bar", "heatmap"]
+    paths = charts.render_charts(specs, workers=2)
+    assert all(p.read_bytes()[:8] == b"\x89PNG\r\n\x1a\n" for p in paths)
+
+    def fail(spec):
+        raise AssertionError("cached chart was re-rendered")
+
+    monkeypatch.setattr(charts, "render_png", fail)
+    assert charts.render_charts(_specs(), workers=1) == paths
+
+    changed = _specs()[0]
+    changed.series["revenue"][0] = 101.0
+    assert charts.chart_path(changed) not in paths
+
+
+def test_pack_pdf_includes_charts(tmp_path):
+    from edgar_model_builder.charts import render_charts
+    from edgar_model_builder.pdf_builder import build_pack_pdf
+
+    comps = pd.DataFrame({"ticker": ["AAA"], "EV/EBITDA": [12.5]})
+    out = build_pack_pdf(tmp_path / "pack.pdf", "AAA", {"ttm_revenue": 1.0}, comps, render_charts(_specs(), workers=1))
+    assert b"/Subtype /Image" in (tmp_path / "pack.pdf").read_bytes()
+    assert out.endswith("pack.pdf")
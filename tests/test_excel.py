@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+
+def _history(periods, freq):
+    rng = np.random.default_rng(0)
+    ends = pd.date_range("2015-03-31", periods=periods, freq=freq)
+    df = pd.DataFrame(rng.normal(0, 1e9, (periods, 4)), index=ends, columns=["revenue", "cogs", "da", "cash"])
+    df.iloc[::3, 1] = np.nan
+    df.iloc[:, 3] = np.nan
+    df.iloc[2, 0] = 0.1 + 0.2
+    return df.iloc[::-1]
+
+
+def _workbook(path):
+    # everything a reader sees: values/formulas, number formats, header styling, widths, panes
+    wb = load_workbook(path)
+    out = {}
+    for ws in wb.worksheets:
+        cells = {}
+        for row in ws.iter_rows():
+            for c in row:
+                if c.value is not None or c.has_style:
+                    cells[c.coordinate] = (c.value, c.number_format, c.font.b, c.fill.fgColor.rgb, c.alignment.horizontal)
+        widths = {get_column_letter(i): ws.column_dimensions[get_column_letter(i)].width
+                  for i in range(1, ws.max_column + 1)}
+        out[ws.title] = (cells, widths, ws.freeze_panes)
+    return out
+
+
+def test_write_only_matches_regular_workbook(tmp_path):
+    from edgar_model_builder.excel_builder import build_model_xlsx
+
+    comps = pd.DataFrame([
+        {"ticker": "AAA", "price": 10.5, "market_cap": None, "ev": np.nan, "ttm_revenue": 1e9,
+         "ttm_ebitda": 2.5e8, "EV/Revenue": None, "EV/EBITDA": 12.25},
+        {"ticker": "BBBBBBBB", "price": None, "market_cap": 3e12, "ev": 3.1e12, "ttm_revenue": None,
+         "ttm_ebitda": None, "EV/Revenue": 4.0, "EV/EBITDA": None},
+    ])
+    args = ("AAA", _history(10, "YE"), _history(40, "QE"), comps, {"WACC": 0.10, "Terminal_Growth": 0.03})
+
+    fast = build_model_xlsx(tmp_path / "fast.xlsx", *args)
+    slow = build_model_xlsx(tmp_path / "slow.xlsx", *args, write_only=False)
+    a, b = _workbook(fast), _workbook(slow)
+    assert list(a) == ["Summary", "Hist_FY", "Hist_Q", "Comps", "LBO"]
+    assert a == b
+    assert a["LBO"][0]["E12"][0] == '=IFERROR((E11)^(1/B8)-1, "")'
+
+
+def test_write_only_handles_empty_history(tmp_path):
+    from edgar_model_builder.excel_builder import build_model_xlsx
+
+    args = ("AAA", pd.DataFrame(), pd.DataFrame(), pd.DataFrame([{"ticker": "AAA", "price": None}]), {})
+    fast = build_model_xlsx(tmp_path / "fast.xlsx", *args)
+    slow = build_model_xlsx(tmp_path / "slow.xlsx", *args, write_only=False)
+    assert _workbook(fast) == _workbook(slow)
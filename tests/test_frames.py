@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import companyfacts, fact
+
+FRAMES = {
+    "/api/xbrl/frames/us-gaap/Revenues/USD/CY2023.json": {
+        "taxonomy": "us-gaap", "tag": "Revenues", "ccp": "CY2023", "uom": "USD", "pts": 2,
+        "data": [
+            {"accn": "0000000001-24-000001", "cik": 1, "entityName": "A Corp", "loc": "US-CA",
+             "start": "2023-01-01", "end": "2023-12-31", "val": 100},
+            {"accn": "0000000002-24-000001", "cik": 2, "entityName": "B Corp", "loc": "US-NY",
+             "start": "2023-01-01", "end": "2023-12-31", "val": 200},
+            # not in its filer's recent submissions, so its form stays unknown
+            {"accn": "0000000003-19-000001", "cik": 3, "entityName": "C Corp", "loc": "US-TX",
+             "start": "2023-01-01", "end": "2023-12-31", "val": 300},
+        ],
+    },
+    # B Corp's fiscal year ends in September: its Dec-31 balance comes from a 10-Q
+    "/api/xbrl/frames/us-gaap/Assets/USD/CY2023Q4I.json": {
+        "taxonomy": "us-gaap", "tag": "Assets", "ccp": "CY2023Q4I", "uom": "USD", "pts": 1,
+        "data": [{"accn": "0000000002-24-000002", "cik": 2, "entityName": "B Corp", "loc": "US-NY",
+                  "end": "2023-12-31", "val": 5000}],
+    },
+    "/submissions/CIK0000000001.json": {"filings": {"recent": {
+        "accessionNumber": ["0000000001-24-000001"], "form": ["10-K"]}}},
+    "/submissions/CIK0000000002.json": {"filings": {"recent": {
+        "accessionNumber": ["0000000002-24-000002", "0000000002-24-000001"], "form": ["10-Q", "10-K"]}}},
+    "/submissions/CIK0000000003.json": {"filings": {"recent": {"accessionNumber": [], "form": []}}},
+    "/api/xbrl/frames/us-gaap/NetIncomeLoss/USD/CY2023.json": {
+        "taxonomy": "us-gaap", "tag": "NetIncomeLoss", "ccp": "CY2023", "uom": "USD", "pts": 1,
+        "data": [{"accn": "0000000001-24-000001", "cik": 1, "entityName": "A Corp", "loc": "US-CA",
+                  "start": "2023-01-01", "end": "2023-12-31", "val": 10}],
+    },
+}
+
+
+@pytest.fixture
+def stub_sec(monkeypatch):
+    from edgar_model_builder.settings import settings
+
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            doc = FRAMES.get(self.path)
+            body = json.dumps(doc).encode() if doc else b"{}"
+            self.send_response(200 if doc else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "sec_data_base", f"http://127.0.0.1:{server.server_port}")
+    yield hits
+    server.shutdown()
+    server.server_close()
+
+
+def _mapping():
+    from edgar_model_builder.mappings import Mapping, TagRef
+
+    return Mapping(unit_priority=["USD"], lines={
+        "revenue": [TagRef("us-gaap", "Revenues")],
+        "net_income": [TagRef("us-gaap", "NetIncomeLoss")],
+        "total_assets": [TagRef("us-gaap", "Assets")],
+    })
+
+
+def test_frame_period():
+    from edgar_model_builder.ingest import frame_period
+
+    for ok in ("CY2023", "CY2024Q2", "CY2024Q4I", "CY2024Q1I"):
+        assert frame_period(ok) == ok
+    for bad in ("CY2024I", "FY2024", "CY24"):
+        with pytest.raises(ValueError):
+            frame_period(bad)
+
+
+def test_ingest_frames_from_stub_server(db, stub_sec, tmp_path):
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.normalize import build_statement_history
+    from edgar_model_builder.sec_client import SecClient
+    from edgar_model_builder.universe import ingest_frames
+
+    async def run(**kw):
+        c = SecClient(cache=ResponseCache(tmp_path / "sec", 1 << 30))
+        try:
+            return await ingest_frames(c, _mapping(), ["CY2023", "CY2023Q4I"], concurrency=3, **kw)
+        finally:
+            await c.aclose()
+
+    # by default only the frames themselves are requested, and the rows wait for a form
+    res = asyncio.run(run())
+    assert (res.requests, res.missing, res.failed) == (6, 3, {})
+    assert (res.loaded.inserted, res.loaded.skipped) == (5, 0)
+    assert (res.resolved, res.unresolved) == (0, 4)
+    # a 404 is final: no retries
+    assert len(stub_sec) == len(set(stub_sec)) == 6
+    assert build_statement_history(2, _mapping(), "FY").empty
+
+    # opting in reads one submissions document per filer
+    stub_sec.clear()
+    res = asyncio.run(run(resolve_forms=True))
+    assert (res.resolved, res.unresolved) == (3, 1)
+    assert sorted(p for p in stub_sec if p.startswith("/submissions/")) == [
+        f"/submissions/CIK000000000{i}.json" for i in (1, 2, 3)]
+
+    fy = build_statement_history(2, _mapping(), "FY")
+    assert fy["revenue"].tolist() == [200.0]
+    # the form comes from the filing, not the calendar period
+    assert "total_assets" not in fy or fy["total_assets"].isna().all()
+    q = build_statement_history(2, _mapping(), "Q")
+    assert q["total_assets"].tolist() == [5000.0]
+    assert build_statement_history(3, _mapping(), "FY").empty
+
+    # the same filing arriving through companyfacts fills in the filing date and form,
+    # and an older filing's comparative does not displace the frame's value
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 100.0, start="2023-01-01", filed="2024-02-01", accn="0000000001-24-000001"),
+        fact("2023-12-31", 90.0, start="2023-01-01", filed="2024-01-15", accn="0000000001-24-000000"),
+    ]}}}}))
+    fy = build_statement_history(1, _mapping(), "FY")
+    assert fy.loc[fy.index[-1], "revenue"] == 100.0
+    assert fy.loc[fy.index[-1], "net_income"] == 10.0
+
+    from sqlalchemy import select
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.models import Fact, FactLatest
+
+    with SessionLocal() as s:
+        upgraded = s.execute(select(Fact).where(Fact.cik == 1, Fact.tag == "Revenues",
+                                                Fact.accn == "0000000001-24-000001")).scalar_one()
+        assert (upgraded.form, upgraded.filed.date().isoformat(), upgraded.frame) == ("10-K", "2024-02-01", None)
+        latest = s.execute(select(FactLatest).where(FactLatest.cik == 1, FactLatest.tag == "Revenues")).scalar_one()
+        assert latest.fact_id == upgraded.id
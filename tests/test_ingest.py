@@ -0,0 +1,227 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from conftest import companyfacts, fact
+
+
+def _doc():
+    return companyfacts({
+        "us-gaap": {
+            "Revenues": {"units": {"USD": [
+                fact("2022-12-31", 100.0, accn="A1"),
+                fact("2023-12-31", 120.0, accn="A2"),
+                fact("2023-12-31", 121.0, accn="A3", filed="2024-05-01"),
+                {"val": 1.0, "accn": "A4"},
+            ]}},
+        },
+        "dei": {
+            "EntityCommonStockSharesOutstanding": {"units": {"shares": [fact("2023-12-31", 15e9, accn="A2")]}},
+        },
+    })
+
+
+def test_ingest_companyfacts_reports_inserted_and_skipped(db):
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.models import Fact
+
+    first = ingest_companyfacts(320193, _doc())
+    assert (first.inserted, first.skipped) == (4, 1)
+
+    again = ingest_companyfacts(320193, _doc())
+    assert (again.inserted, again.skipped) == (0, 5)
+
+    with SessionLocal() as s:
+        assert s.execute(select(func.count()).select_from(Fact)).scalar_one() == 4
+
+
+def test_load_facts_batches_and_dedups_within_batch(db):
+    from edgar_model_builder.ingest import flatten_companyfacts, load_facts
+
+    rows = list(flatten_companyfacts(_doc()))
+    res = load_facts(320193, rows + rows, batch_size=3)
+    assert res.inserted == 4
+    assert res.total == 10
+
+
+def test_iter_companyfacts_matches_flatten():
+    import io
+    import json
+    from edgar_model_builder.ingest import flatten_companyfacts, iter_companyfacts
+
+    doc = _doc()
+    doc["facts"]["us-gaap"]["Revenues"]["label"] = "Revenues"
+    doc["facts"]["us-gaap"]["Revenues"]["description"] = "Nested {\"units\": []} text"
+    streamed = list(iter_companyfacts(io.BytesIO(json.dumps(doc).encode())))
+    assert streamed == list(flatten_companyfacts(doc))
+
+
+def test_fact_latest_incremental_matches_rebuild(db):
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.ingest import ingest_companyfacts, rebuild_latest
+    from edgar_model_builder.models import FORM_CLASSES, FactLatest
+    from edgar_model_builder.query import latest_fact_for_period
+
+    ingest_companyfacts(1, _doc())
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 119.0, accn="OLD", filed="2023-01-01"),
+        fact("2023-12-31", 122.0, accn="NEW", filed="2025-01-01"),
+        fact("2023-12-31", 123.0, accn="TIE", filed="2025-01-01"),
+        fact("2023-12-31", None, accn="NULL", filed="2026-01-01"),
+    ]}}}}))
+
+    def snapshot():
+        with SessionLocal() as s:
+            return sorted(
+                (r.taxonomy, r.tag, r.form_class, r.end, r.unit, r.val, r.accn, r.fact_id)
+                for r in s.query(FactLatest).all()
+            )
+
+    def revenue_2023():
+        return [r[5:7] for r in snapshot() if r[1] == "Revenues" and r[3].year == 2023]
+
+    # a filing-date tie goes to the fact stored first, in one batch or across ingests
+    assert revenue_2023() == [(122.0, "NEW")]
+    for accn, val in (("ZZZ", 124.0), ("AAA", 125.0)):
+        ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+            fact("2023-12-31", val, accn=accn, filed="2025-01-01"),
+        ]}}}}))
+    assert revenue_2023() == [(122.0, "NEW")]
+    # the period lookup still answers with value-less facts
+    got = latest_fact_for_period(1, "us-gaap", "Revenues", "USD", datetime(2023, 12, 31), FORM_CLASSES["FY"])
+    assert (got.accn, got.val) == ("NULL", None)
+
+    incremental = snapshot()
+    assert rebuild_latest() == len(incremental)
+    assert snapshot() == incremental
+
+
+def test_init_db_backfills_fact_latest(db):
+    from edgar_model_builder.db import SessionLocal, init_db
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.models import FactLatest
+
+    ingest_companyfacts(1, _doc())
+    with SessionLocal() as s:
+        before = sorted((r.tag, r.end, r.val, r.fact_id) for r in s.query(FactLatest))
+        # a database whose facts predate fact_latest
+        s.query(FactLatest).delete()
+        s.commit()
+
+    assert init_db() == len(before)
+    with SessionLocal() as s:
+        assert sorted((r.tag, r.end, r.val, r.fact_id) for r in s.query(FactLatest)) == before
+    assert init_db() == 0
+
+
+def test_per_row_fallback_matches_on_conflict(db, monkeypatch):
+    from edgar_model_builder import ingest
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.models import FactLatest, IngestState
+
+    docs = [_doc(), companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 122.0, accn="NEW", filed="2025-01-01"),
+        fact("2023-12-31", 123.0, accn="TIE", filed="2025-01-01"),
+        fact("2023-12-31", 119.0, accn="OLD", filed="2023-01-01"),
+    ]}}}})]
+
+    def load(cik):
+        return [(r.inserted, r.skipped) for d in docs + docs for r in [ingest.ingest_companyfacts(cik, d)]]
+
+    def latest(cik):
+        with SessionLocal() as s:
+            return sorted((r.tag, r.form_class, r.end, r.unit, r.val, r.accn)
+                          for r in s.query(FactLatest).filter_by(cik=cik))
+
+    native = load(1)
+    # a dialect without ON CONFLICT: plain inserts, one savepoint per row
+    monkeypatch.setattr(ingest, "_UPSERT_DIALECTS", {})
+    assert load(2) == native
+    assert latest(2) == latest(1)
+    with SessionLocal() as s:
+        assert s.get(IngestState, 2) is not None
+
+
+def test_watermark_moves_when_older_facts_enter_latest(db):
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.query import fact_watermark
+
+    # a fact without a form or filing date (as frames load them) stays out of fact_latest...
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2022-12-31", 90.0, accn="A1", filed=None, form=None)]}}}}))
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 100.0, accn="B1", filed="2024-02-01")]}}}}))
+    before = fact_watermark(1)
+    # ...until the same filing brings them; the row joins with its older fact id
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2022-12-31", 90.0, accn="A1", filed="2023-02-01")]}}}}))
+    assert fact_watermark(1) != before
+
+
+def _tag_counts():
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.models import Fact
+
+    with SessionLocal() as s:
+        return dict(s.execute(select(Fact.tag, func.count()).group_by(Fact.tag)).all())
+
+
+def _revenue_mapping(*extra):
+    from edgar_model_builder.mappings import Mapping, TagRef
+
+    lines = {"revenue": [TagRef("us-gaap", "Revenues")]}
+    for tag in extra:
+        lines[tag] = [TagRef("us-gaap", tag)]
+    return Mapping(unit_priority=["USD"], lines=lines)
+
+
+def _slim_doc():
+    doc = _doc()
+    doc["facts"]["us-gaap"]["NetIncomeLoss"] = {"units": {"USD": [fact("2023-12-31", 10.0, accn="A2")]}}
+    return doc
+
+
+def test_slim_ingest_keeps_mapped_tags_and_records_state(db, monkeypatch):
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.ingest import ingest_companyfacts, state_tags
+    from edgar_model_builder.models import Fact, IngestState
+    from edgar_model_builder.settings import settings
+
+    mapping = _revenue_mapping()
+    ingest_companyfacts(1, _slim_doc(), mapping)
+    monkeypatch.setattr(settings, "slim_ingest", True)
+    res = ingest_companyfacts(2, _slim_doc(), mapping)
+
+    assert (res.inserted, res.skipped) == (3, 1)
+    with SessionLocal() as s:
+        full, slim = s.get(IngestState, 1), s.get(IngestState, 2)
+        assert state_tags(full) is None
+        assert state_tags(slim) == {("us-gaap", "Revenues")}
+        assert slim.mapping_digest == mapping.digest
+        by_cik = dict(s.execute(select(Fact.cik, func.count()).group_by(Fact.cik)).all())
+    assert by_cik == {1: 5, 2: 3}
+
+
+def test_backfill_loads_only_tags_the_mapping_gained(db, monkeypatch):
+    import asyncio
+
+    from test_universe import FakeClient
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.settings import settings
+    from edgar_model_builder.universe import backfill_mapping
+
+    monkeypatch.setattr(settings, "slim_ingest", True)
+    ingest_companyfacts(1, _slim_doc(), _revenue_mapping())
+    ingest_companyfacts(2, _slim_doc(), None)  # full document, nothing to backfill
+    assert _tag_counts() == {"Revenues": 6, "NetIncomeLoss": 1, "EntityCommonStockSharesOutstanding": 1}
+
+    client = FakeClient({1: _slim_doc(), 2: _slim_doc()})
+    wider = _revenue_mapping("NetIncomeLoss")
+    out = asyncio.run(backfill_mapping(client, [1, 2, 3], wider))
+    assert client.calls == [1]
+    assert (out[1].inserted, out[1].skipped) == (1, 0)
+    assert _tag_counts()["NetIncomeLoss"] == 2
+
+    assert asyncio.run(backfill_mapping(client, [1], wider)) == {}
+    assert client.calls == [1]
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from conftest import companyfacts, fact
+from test_pack import CountingProvider
+from test_universe import FakeClient
+
+
+@pytest.fixture(params=["memory", "redis"])
+def queue(request):
+    from edgar_model_builder.jobs import InMemoryQueue, RedisQueue
+
+    if request.param == "memory":
+        return InMemoryQueue()
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisQueue(client=fakeredis.FakeRedis())
+
+
+def test_idempotency_key(queue):
+    a, created = queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0001")
+    b, again = queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0001")
+    assert (created, again) == (True, False)
+    assert a.id == b.id
+    assert queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0002")[1]
+
+    job = queue.claim("w")
+    assert queue.ack(job) == "done"
+    # processed keys stay claimed, so re-submitting the same filing is a no-op
+    done, created = queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0001")
+    assert not created and done.status == "done"
+    assert queue.key_job("ingest:AAA:0001").id == a.id
+    assert queue.key_job("ingest:AAA:0003") is None
+
+
+def test_concurrent_enqueues_create_one_job(queue):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(8) as pool:
+        got = list(pool.map(lambda _: queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0001"), range(16)))
+    assert sum(created for _, created in got) == 1
+    assert len({j.id for j, _ in got}) == 1
+    assert queue.stats()["pending"] == 1
+
+
+def test_redis_key_left_without_its_job_is_taken_over():
+    pytest.importorskip("lupa")
+    fakeredis = pytest.importorskip("fakeredis")
+    from edgar_model_builder.jobs import RedisQueue
+
+    queue = RedisQueue(client=fakeredis.FakeRedis())
+    queue.client.set(queue._k("key:ingest:AAA:0001"), "gone")  # e.g. its job hash expired
+    job, created = queue.enqueue("ingest", {"ticker": "AAA"}, key="ingest:AAA:0001")
+    assert created and queue.key_job("ingest:AAA:0001").id == job.id
+    assert queue.claim("w").id == job.id
+
+
+def test_retries_then_dead(queue):
+    job, _ = queue.enqueue("ingest", {"ticker": "AAA"}, key="k", max_attempts=2)
+    first = queue.claim("w")
+    assert (first.id, first.attempts, first.status) == (job.id, 1, "active")
+    assert queue.fail(first, "boom") == "queued"
+    second = queue.claim("w")
+    assert second.attempts == 2
+    assert queue.fail(second, "boom again") == "dead"
+    assert queue.claim("w") is None
+    assert queue.get(job.id).error == "boom again"
+    assert queue.stats()["dead"] == 1
+    # a dead job frees its key so the work can be submitted again
+    assert queue.enqueue("ingest", {"ticker": "AAA"}, key="k")[1]
+
+
+def test_visibility_timeout_and_release(queue):
+    queue.enqueue("ingest", {"ticker": "AAA"})
+    stale = queue.claim("w1", visibility=0.01)
+    time.sleep(0.05)
+    job = queue.claim("w2", visibility=30)
+    assert job.id == stale.id and job.attempts == 2 and job.worker == "w2"
+    # the first worker lost its lease and can no longer settle the job
+    assert queue.ack(stale) is None
+    assert queue.extend(job, 30) == "active"
+    assert queue.release(job) == "queued"
+    again = queue.claim("w2")
+    assert again.attempts == 2  # releasing does not use up an attempt
+    assert queue.stats() == {"pending": 0, "delayed": 0, "active": 1, "done": 0, "dead": 0}
+
+
+def test_worker_heartbeat_keeps_lease():
+    from edgar_model_builder.jobs import InMemoryQueue, run_worker
+
+    queue = InMemoryQueue()
+    calls = []
+
+    async def slow(q, job):
+        calls.append(job.attempts)
+        await asyncio.sleep(0.5)
+
+    queue.enqueue("slow", {})
+    counts = asyncio.run(run_worker(queue, {"slow": slow}, concurrency=2, visibility=0.2, poll=0.01, until_idle=True))
+    assert calls == [1]
+    assert counts["done"] == 1
+
+
+def _doc(scale):
+    return companyfacts({"us-gaap": {
+        "Revenues": {"units": {"USD": [fact("2023-12-31", 100.0 * scale)]}},
+        "OperatingIncomeLoss": {"units": {"USD": [fact("2023-12-31", 10.0 * scale)]}},
+    }})
+
+
+def test_worker_runs_universe(db):
+    if os.environ["DATABASE_URL"].startswith("sqlite"):
+        pytest.importorskip("aiosqlite")
+    from edgar_model_builder.artifacts import artifacts_root
+    from edgar_model_builder.ingest import upsert_company
+    from edgar_model_builder.jobs import InMemoryQueue, enqueue_universe, pipeline_handlers, run_worker
+
+    for cik, t in ((1, "AAA"), (2, "BBB"), (3, "CCC")):
+        upsert_company(cik, t, f"{t} Corp")
+    client = FakeClient({1: _doc(1), 2: _doc(2), 3: _doc(3)})
+    queue = InMemoryQueue()
+    peers = {"AAA": ["BBB", "CCC"], "BBB": ["AAA", "CCC"]}
+    jobs = enqueue_universe(queue, ["AAA", "BBB"], peers, "config/mappings/us_gaap.yml", "run-1")
+    assert [j.kind for j, _ in jobs] == ["ingest"] * 3 + ["render"] * 2
+
+    handlers = pipeline_handlers(client, CountingProvider(), wait=0.01)
+    counts = asyncio.run(run_worker(queue, handlers, concurrency=3, poll=0.01, until_idle=True, backoff=0))
+
+    # each company is fetched once however many packs it is in; renders waited for their ingests
+    assert sorted(client.calls) == [1, 2, 3]
+    assert counts["done"] == 3 + 3 + 2  # ingest, normalize, render
+    assert counts["dead"] == 0
+    for t in ("AAA", "BBB"):
+        assert (artifacts_root() / t / "pack.pdf").exists()
+
+    # the same run submitted again finds everything done
+    again = enqueue_universe(queue, ["AAA", "BBB"], peers, "config/mappings/us_gaap.yml", "run-1")
+    assert not any(created for _, created in again)
@@ -0,0 +1,72 @@
+import threading
+
+from edgar_model_builder.marketdata import CachedProvider, Quote
+
+
+class FakeProvider:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def quote(self, ticker, fundamentals=True):
+        with self.lock:
+            self.calls.append((ticker, fundamentals))
+        return Quote(price=10.0, market_cap=100.0, ttm_revenue=50.0 if fundamentals else None)
+
+    def quotes(self, tickers, fundamentals=True):
+        return {t: self.quote(t, fundamentals) for t in tickers}
+
+
+def test_cached_provider_fetches_each_symbol_once_per_ttl():
+    now = [0.0]
+    fake = FakeProvider()
+    mkt = CachedProvider(fake, ttl=60, max_workers=4, clock=lambda: now[0])
+
+    got = mkt.quotes(["AAA", "BBB", "CCC", "AAA"], fundamentals=False)
+    assert sorted(got) == ["AAA", "BBB", "CCC"]
+    mkt.quotes(["AAA", "BBB"], fundamentals=False)
+    assert sorted(fake.calls) == [("AAA", False), ("BBB", False), ("CCC", False)]
+
+    assert mkt.quote("AAA").ttm_revenue == 50.0
+    assert mkt.quote("AAA", fundamentals=False).ttm_revenue == 50.0
+    assert len(fake.calls) == 4
+
+    now[0] = 61
+    mkt.quote("BBB", fundamentals=False)
+    assert fake.calls[-1] == ("BBB", False)
+
+
+def test_cached_provider_retries_empty_quotes_soon():
+    from edgar_model_builder.cache import MemoryCache
+
+    now = [0.0]
+    fake = FakeProvider()
+    fake.quote = lambda ticker, fundamentals=True: fake.calls.append(ticker) or Quote()
+    shared = MemoryCache()
+    mkt = CachedProvider(fake, ttl=900, clock=lambda: now[0], shared=shared, negative_ttl=30)
+
+    mkt.quote("AAA")
+    mkt.quote("AAA")
+    assert fake.calls == ["AAA"]
+    # a second process does not reuse the failure
+    CachedProvider(fake, shared=shared).quote("AAA")
+    assert fake.calls == ["AAA", "AAA"]
+    now[0] = 31
+    mkt.quote("AAA")
+    assert fake.calls == ["AAA", "AAA", "AAA"]
+
+
+def test_comps_fetches_each_ticker_once():
+    from edgar_model_builder.comps import build_comps_table
+
+    fake = FakeProvider()
+    kpis = {"AAA": {"ttm_revenue": 20.0, "ttm_ebitda": 5.0, "cash": 10.0, "total_debt": 30.0}}
+    df = build_comps_table("AAA", ["BBB"], kpis, CachedProvider(fake))
+
+    # BBB has no EDGAR KPIs, so its one quote carries the fundamentals fallback
+    assert sorted(fake.calls) == [("AAA", False), ("BBB", True)]
+    assert df.set_index("ticker").loc["BBB", "ttm_revenue"] == 50.0
+    row = df.set_index("ticker").loc["AAA"]
+    assert row["ev"] == 120.0
+    assert row["EV/Revenue"] == 6.0
+    assert row["EV/EBITDA"] == 24.0
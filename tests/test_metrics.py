@@ -0,0 +1,46 @@
+import json
+
+import httpx
+
+from conftest import companyfacts, fact
+
+
+def test_build_pack_writes_metrics_and_profile(db, tmp_path, monkeypatch):
+    from typer.testing import CliRunner
+    from edgar_model_builder import sec_client
+    from edgar_model_builder.artifacts import artifacts_root
+    from edgar_model_builder.cli import app
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.ingest import upsert_company
+
+    doc = companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [fact("2023-12-31", 100.0)]}}}})
+    body = json.dumps(doc).encode()
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, content=body)
+
+    real = sec_client.SecClient
+    monkeypatch.setattr(sec_client, "SecClient", lambda: real(
+        cache=ResponseCache(tmp_path / "sec", 10_000_000), transport=httpx.MockTransport(handler)))
+    upsert_company(7, "MET", "Metrics Corp")
+    prom = tmp_path / "edgar.prom"
+
+    res = CliRunner().invoke(app, ["build-pack", "MET", "--force", "--profile", "--metrics-textfile", str(prom)])
+    assert res.exit_code == 0, res.output
+
+    out = artifacts_root() / "MET"
+    m = json.loads((out / "metrics.json").read_text())
+    assert {"sec_fetch", "ingest", "plan", "normalize", "comps", "render_xlsx", "render_pdf"} <= set(m["stages"])
+    c = m["counters"]
+    assert c["sec_http_requests"] == 2 and c["sec_http_retries"] == 1
+    assert c["sec_http_bytes"] == len(body)
+    assert c["facts_inserted"] == 1
+    assert c["sql_statements"] > 0 and c["sql_rows"] >= 1
+    assert 'edgar_stage_seconds{ticker="MET",stage="ingest"}' in prom.read_text()
+    assert "edgar_sec_http_requests" in prom.read_text()
+    assert "cumulative" in (out / "profile.txt").read_text()
+    assert (out / "profile.pstats").exists()
@@ -0,0 +1,115 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import companyfacts, fact
+
+
+def _mapping():
+    from edgar_model_builder.mappings import Mapping, TagRef
+
+    return Mapping(
+        unit_priority=["USD"],
+        lines={
+            "revenue": [TagRef("us-gaap", "Revenues"), TagRef("us-gaap", "SalesRevenueNet")],
+            "net_income": [TagRef("us-gaap", "NetIncomeLoss")],
+        },
+    )
+
+
+def test_build_statement_history_latest_filing_and_tag_priority(db):
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.normalize import build_statement_history
+
+    ingest_companyfacts(1, companyfacts({"us-gaap": {
+        "Revenues": {"units": {"USD": [
+            fact("2023-12-31", 100.0, accn="A1", filed="2024-02-01"),
+            fact("2023-12-31", 105.0, accn="A2", filed="2025-02-01"),
+            fact("2023-09-30", 70.0, accn="Q3", form="10-Q"),
+        ]}},
+        "SalesRevenueNet": {"units": {"USD": [
+            fact("2022-12-31", 90.0, accn="B1"),
+            fact("2023-12-31", 1.0, accn="B2", filed="2026-01-01"),
+        ]}},
+        "NetIncomeLoss": {"units": {"USD": [fact("2023-12-31", 10.0, accn="A1")]}},
+    }}))
+
+    fy = build_statement_history(1, _mapping(), "FY")
+    expected = pd.DataFrame(
+        {"revenue": [90.0, 105.0], "net_income": [float("nan"), 10.0]},
+        index=pd.DatetimeIndex([datetime(2022, 12, 31), datetime(2023, 12, 31)], name="end"),
+    )
+    pd.testing.assert_frame_equal(fy, expected)
+
+    q = build_statement_history(1, _mapping(), "Q")
+    assert list(q.columns) == ["revenue"]
+    assert q["revenue"].tolist() == [70.0]
+
+    assert build_statement_history(2, _mapping(), "FY").empty
+
+
+def test_build_statement_history_many_matches_per_cik(db):
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.normalize import build_statement_history, build_statement_history_many
+
+    for cik, scale in ((1, 1.0), (2, 10.0)):
+        ingest_companyfacts(cik, companyfacts({"us-gaap": {
+            "Revenues": {"units": {"USD": [
+                fact("2023-12-31", 100.0 * scale, accn="A1", filed="2024-02-01"),
+                fact("2023-12-31", 105.0 * scale, accn="A2", filed="2025-02-01"),
+            ]}},
+            "SalesRevenueNet": {"units": {"USD": [fact("2022-12-31", 90.0 * scale, accn="B1")]}},
+            "NetIncomeLoss": {"units": {"USD": [fact("2021-12-31", scale, accn="C1")]}} if cik == 2 else {"units": {}},
+        }}))
+
+    panel = build_statement_history_many([1, 2, 3], _mapping(), "FY")
+    assert panel.index.names == ["cik", "end"]
+    assert list(panel.columns) == ["revenue", "net_income"]
+    for cik in (1, 2):
+        single = build_statement_history(cik, _mapping(), "FY")
+        got = panel.xs(cik, level="cik").dropna(axis=1, how="all")[list(single.columns)]
+        pd.testing.assert_frame_equal(got, single, check_freq=False)
+
+    assert build_statement_history_many([3], _mapping(), "FY").empty
+
+
+def test_snapshot_reads_match_database_and_invalidate(db, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from edgar_model_builder import snapshots
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.normalize import build_statement_history
+    from edgar_model_builder.settings import settings
+
+    doc = companyfacts({"us-gaap": {
+        "Revenues": {"units": {"USD": [fact("2023-12-31", 100.0, accn="A1"), fact("2022-12-31", 90.0, accn="A0")]}},
+        "NetIncomeLoss": {"units": {"USD": [fact("2023-12-31", 10.0, accn="A1")]}},
+    }})
+    ingest_companyfacts(1, doc)
+    from_db = build_statement_history(1, _mapping(), "FY")
+
+    monkeypatch.setattr(settings, "fact_snapshots", True)
+    path = snapshots.snapshot_path(1)
+    path.unlink(missing_ok=True)
+    pd.testing.assert_frame_equal(build_statement_history(1, _mapping(), "FY"), from_db)
+    assert path.exists()
+    mark = snapshots.saved_watermark(1)
+    # reads check the watermark saved at ingest, not the database
+    with monkeypatch.context() as m:
+        m.setattr(snapshots, "watermark", lambda cik: pytest.fail("read queried the database"))
+        assert snapshots.read_rows(1, [("us-gaap", "Revenues")], "FY")["val"].tolist() == [100.0, 90.0]
+    pd.testing.assert_frame_equal(build_statement_history(1, _mapping(), "FY"), from_db)
+
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 101.0, accn="A2", filed="2025-01-01"),
+    ]}}}}))
+    assert snapshots.saved_watermark(1) != mark
+    assert build_statement_history(1, _mapping(), "FY")["revenue"].tolist() == [90.0, 101.0]
+
+    # with snapshots off, an ingest still moves the saved watermark so the old file is never read
+    monkeypatch.setattr(settings, "fact_snapshots", False)
+    ingest_companyfacts(1, companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [
+        fact("2023-12-31", 102.0, accn="A3", filed="2025-02-01"),
+    ]}}}}))
+    assert snapshots.read_rows(1, [("us-gaap", "Revenues")], "FY") is None
+    assert snapshots.read_rows(1, [("us-gaap", "Revenues")], "FY", verify=True) is None
@@ -0,0 +1,105 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+from conftest import companyfacts, fact
+from test_universe import FakeClient
+
+
+class CountingProvider:
+    def __init__(self):
+        from edgar_model_builder.marketdata import NullProvider
+        self.inner = NullProvider()
+        self.calls = []
+
+    def quote(self, ticker, fundamentals=True):
+        return self.inner.quote(ticker, fundamentals)
+
+    def quotes(self, tickers, fundamentals=True):
+        tickers = list(tickers)
+        self.calls.append(tickers)
+        return self.inner.quotes(tickers, fundamentals)
+
+
+def _doc(scale):
+    return companyfacts({"us-gaap": {
+        "Revenues": {"units": {"USD": [
+            fact("2023-12-31", 100.0 * scale),
+            fact("2023-09-30", 25.0 * scale, form="10-Q", fp="Q3", start="2023-07-01"),
+        ]}},
+        "OperatingIncomeLoss": {"units": {"USD": [fact("2023-12-31", 10.0 * scale)]}},
+    }})
+
+
+def test_fundamentals_many_matches_single(db):
+    from edgar_model_builder.ingest import ingest_companyfacts
+    from edgar_model_builder.mappings import load_mapping
+    from edgar_model_builder.normalize import company_fundamentals, fundamentals_many
+
+    mapping = load_mapping("config/mappings/us_gaap.yml")
+    for cik in (1, 2):
+        ingest_companyfacts(cik, _doc(cik))
+
+    many = fundamentals_many([1, 2, 3], mapping)
+    for cik in (1, 2, 3):
+        fy, q, kpis = company_fundamentals(cik, mapping)
+        pd.testing.assert_frame_equal(many[cik][0], fy, check_freq=False)
+        pd.testing.assert_frame_equal(many[cik][1], q, check_freq=False)
+        assert many[cik][2] == kpis
+
+
+def test_build_universe_ingests_each_company_once(db, tmp_path):
+    from edgar_model_builder.ingest import upsert_company
+    from edgar_model_builder.mappings import load_mapping
+    from edgar_model_builder.pack import build_universe, load_peer_groups
+
+    for cik, t in ((1, "AAA"), (2, "BBB"), (3, "CCC")):
+        upsert_company(cik, t, f"{t} Corp")
+    cfg = tmp_path / "peers.yml"
+    cfg.write_text("default: [BBB, CCC]\ngroups:\n  CCC: [aaa]\n", encoding="utf-8")
+    default, groups = load_peer_groups(cfg)
+    assert default == ["BBB", "CCC"] and groups == {"CCC": ["AAA"]}
+
+    client = FakeClient({1: _doc(1), 2: _doc(2), 3: _doc(3)})
+    mkt = CountingProvider()
+    mapping = load_mapping("config/mappings/us_gaap.yml")
+    res = asyncio.run(build_universe(client, ["AAA", "BBB", "CCC", "ZZZ"], groups, default, mapping, mkt, workers=2))
+
+    assert sorted(client.calls) == [1, 2, 3]
+    assert set(res.built) == {"AAA", "BBB", "CCC"}
+    assert "unknown ticker" in res.failed["ZZZ"]
+    assert mkt.calls[0] == ["AAA", "BBB", "CCC", "ZZZ"]
+    for paths in res.built.values():
+        assert all(Path(p).exists() for p in paths)
+
+
+def test_build_universe_skips_current_artifacts(db, monkeypatch):
+    from edgar_model_builder import pack
+    from edgar_model_builder.artifacts import artifacts_root
+    from edgar_model_builder.ingest import upsert_company
+    from edgar_model_builder.mappings import load_mapping
+
+    shutil.rmtree(artifacts_root() / "AAA", ignore_errors=True)
+    for cik, t in ((1, "AAA"), (2, "BBB")):
+        upsert_company(cik, t, f"{t} Corp")
+    client = FakeClient({1: _doc(1), 2: _doc(2)})
+    mapping = load_mapping("config/mappings/us_gaap.yml")
+
+    def run(**kw):
+        return asyncio.run(pack.build_universe(client, ["AAA"], {}, ["BBB"], mapping, CountingProvider(), workers=1, **kw))
+
+    first = run()
+    assert first.built and (artifacts_root() / "AAA" / "manifest.json").exists()
+
+    second = run()
+    assert second.built == {} and second.skipped == ["AAA"]
+
+    changed = run(assumptions={"WACC": 0.09, "Terminal_Growth": 0.03})
+    assert sorted(Path(p).name for p in changed.built["AAA"]) == ["model.xlsx", "pack.pdf"]
+
+    (artifacts_root() / "AAA" / "data.json").write_text("{}", encoding="utf-8")
+    assert [Path(p).name for p in run(assumptions={"WACC": 0.09, "Terminal_Growth": 0.03}).built["AAA"]] == ["data.json"]
+
+    assert len(run(force=True).built["AAA"]) == 3
@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import time
+
+import httpx
+import pytest
+
+
+def _stamps(path, rate, n):
+    from edgar_model_builder.ratelimit import FileRateLimiter
+
+    limiter = FileRateLimiter(rate, path)
+
+    async def run():
+        slots = []
+        for _ in range(n):
+            t = time.time()
+            # roughly when the limiter scheduled this request, however late the sleep woke up
+            slots.append(t + await limiter.acquire())
+        return slots
+
+    return asyncio.run(run())
+
+
+def test_file_limiter_is_shared_across_processes(tmp_path):
+    path, rate = tmp_path / "rate.json", 40.0
+    with multiprocessing.get_context("fork").Pool(3) as pool:
+        stamps = sorted(t for part in pool.starmap(_stamps, [(path, rate, 8)] * 3) for t in part)
+    gaps = [b - a for a, b in zip(stamps, stamps[1:])]
+    # 24 requests from three processes still leave one at a time, 1/rate apart
+    assert min(gaps) > 0.5 / rate
+    assert stamps[-1] - stamps[0] >= 23 * 0.95 / rate
+
+
+def test_throttle_pauses_and_slows_everyone(tmp_path):
+    from edgar_model_builder.ratelimit import FileRateLimiter
+
+    a, b = FileRateLimiter(20.0, tmp_path / "rate.json"), FileRateLimiter(20.0, tmp_path / "rate.json")
+
+    async def run():
+        await a.acquire()
+        a.throttle(retry_after=0.3)
+        t0 = time.monotonic()
+        await b.acquire()
+        t1 = time.monotonic()
+        await b.acquire()
+        return t1 - t0, time.monotonic() - t1
+
+    paused, gap = asyncio.run(run())
+    assert paused >= 0.25
+    assert gap >= 0.9 * 2 / 20.0  # the rate was halved
+
+
+def test_shared_limiter_updates_off_the_event_loop(tmp_path):
+    from edgar_model_builder.ratelimit import FileRateLimiter
+
+    class SlowLock(FileRateLimiter):
+        def _update(self, op, retry_after=None):
+            time.sleep(0.2)  # a contended lock file
+            return super()._update(op, retry_after)
+
+    limiter, ticks = SlowLock(10.0, tmp_path / "rate.json"), []
+
+    async def tick():
+        for _ in range(10):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        async def acquire():
+            await limiter.acquire()
+            return len(ticks)
+        return (await asyncio.gather(acquire(), tick()))[0]
+
+    # other tasks kept running while the limiter waited for its lock
+    assert asyncio.run(run()) >= 5
+
+
+def test_retry_after_parsing():
+    from email.utils import formatdate
+    from edgar_model_builder.ratelimit import retry_after
+
+    assert retry_after({"Retry-After": "7"}) == 7.0
+    assert 28 <= retry_after({"Retry-After": formatdate(time.time() + 30, usegmt=True)}) <= 30
+    assert retry_after({"Retry-After": "soon"}) is None
+    assert retry_after({}) is None
+
+
+def test_client_honours_retry_after_on_429(tmp_path):
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.metrics import metrics
+    from edgar_model_builder.ratelimit import FileRateLimiter
+    from edgar_model_builder.sec_client import SecClient
+
+    calls = []
+
+    def handler(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.4"})
+        return httpx.Response(200, json={"ok": True})
+
+    async def run():
+        c = SecClient(cache=ResponseCache(tmp_path / "cache", 10_000_000), transport=httpx.MockTransport(handler),
+                      limiter=FileRateLimiter(10.0, tmp_path / "rate.json"))
+        try:
+            return await c.get_json("https://example.test/x.json")
+        finally:
+            await c.aclose()
+
+    metrics.reset()
+    assert asyncio.run(run()) == {"ok": True}
+    assert calls[1] - calls[0] >= 0.38
+    counters = metrics.snapshot()["counters"]
+    assert counters["sec_throttled"] == 1
+    assert counters["sec_retry_after_seconds"] == pytest.approx(0.4)
+
+
+def test_redis_limiter_shares_one_schedule():
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua
+    fakeredis = pytest.importorskip("fakeredis")
+    from edgar_model_builder.ratelimit import RedisRateLimiter
+
+    client = fakeredis.FakeRedis()
+    a, b = RedisRateLimiter(10.0, client=client), RedisRateLimiter(10.0, client=client)
+
+    async def run():
+        return [await x.acquire() for x in (a, b, a, b)]
+
+    waits = asyncio.run(run())
+    assert waits[0] == pytest.approx(0, abs=0.05)
+    assert sum(waits) >= 0.25
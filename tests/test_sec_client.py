@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+
+def _client(tmp_path, handler, **kw):
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.sec_client import SecClient
+
+    cache = ResponseCache(tmp_path / "cache", max_bytes=10_000_000)
+    return SecClient(cache=cache, transport=httpx.MockTransport(handler), **kw), cache
+
+
+def test_conditional_request_serves_304_from_cache(tmp_path):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"facts": {}}, headers={"ETag": '"v1"'})
+
+    async def run():
+        c, _ = _client(tmp_path, handler)
+        try:
+            return await c.companyfacts(320193), await c.companyfacts(320193)
+        finally:
+            await c.aclose()
+
+    first, second = asyncio.run(run())
+    assert first == second == {"facts": {}}
+    assert seen == [None, '"v1"']
+
+
+def test_offline_mode_uses_cache_and_fails_on_miss(tmp_path):
+    from edgar_model_builder.http_cache import OfflineCacheMiss
+
+    def handler(request):
+        raise AssertionError("network used in offline mode")
+
+    async def run():
+        c, cache = _client(tmp_path, handler, offline=True)
+        cache.put("https://data.sec.gov/api/xbrl/companyfacts/CIK0000000001.json", b'{"cik": 1}')
+        try:
+            assert await c.companyfacts(1) == {"cik": 1}
+            with pytest.raises(OfflineCacheMiss):
+                await c.companyfacts(2)
+        finally:
+            await c.aclose()
+
+    asyncio.run(run())
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    import os
+    from edgar_model_builder.http_cache import ResponseCache
+
+    cache = ResponseCache(tmp_path, max_bytes=1_500)
+    a = cache.put("a", os.urandom(1000))
+    a.accessed_at = 0
+    cache._save(a)
+    cache.put("b", os.urandom(1000))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+def test_cache_walks_objects_only_when_over_budget(tmp_path, monkeypatch):
+    import os
+    from edgar_model_builder.http_cache import ResponseCache
+
+    cache = ResponseCache(tmp_path, max_bytes=2_500)
+    walks = []
+    walk = cache._walk
+    monkeypatch.setattr(cache, "_walk", lambda: walks.append(1) or walk())
+    for url in "abc":
+        cache.put(url, os.urandom(1000))
+    cache.import_(cache.export(cache.get("c")) | {"url": "d"})
+    # one walk to load the running total, no more until the third body pushes it over budget
+    assert len(walks) == 2
+    assert cache.get("a") is None and cache.get("d") is not None
+    assert cache._total == sum(p.stat().st_size for p in (tmp_path / "objects").glob("*/*.gz"))
+
+
+def test_shared_tier_lets_a_second_client_revalidate(tmp_path):
+    from edgar_model_builder.cache import MemoryCache
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.sec_client import SecClient
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"cik": 1}, headers={"ETag": '"v1"'})
+
+    shared = MemoryCache()
+
+    async def run(root):
+        c = SecClient(cache=ResponseCache(root, 10_000_000), shared=shared, transport=httpx.MockTransport(handler))
+        try:
+            return await c.companyfacts(1)
+        finally:
+            await c.aclose()
+
+    assert asyncio.run(run(tmp_path / "host-a")) == {"cik": 1}
+    assert asyncio.run(run(tmp_path / "host-b")) == {"cik": 1}
+    assert seen == [None, '"v1"']
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+# modules that only specific subcommands need; importing the CLI must not pull them in
+HEAVY = ("pandas", "numpy", "sqlalchemy", "openpyxl", "reportlab", "matplotlib", "httpx", "pyarrow", "yfinance")
+IMPORT_BUDGET_US = 300_000
+
+
+def _importtime(code: str):
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, env=os.environ.copy(), check=True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return res.stdout, times
+
+
+def test_cli_import_stays_light():
+    _, times = _importtime("import edgar_model_builder.cli")
+    assert sorted(m for m in times if m.split(".")[0] in HEAVY) == []
+    assert times["edgar_model_builder.cli"] < IMPORT_BUDGET_US
+
+
+def test_help_does_not_load_heavy_modules():
+    code = (
+        "import sys\n"
+        "from edgar_model_builder.cli import app\n"
+        "try:\n    app(['--help'])\nexcept SystemExit:\n    pass\n"
+        f"print(sorted(m for m in sys.modules if m.split('.')[0] in {HEAVY!r}))\n"
+    )
+    out, _ = _importtime(code)
+    assert "build-universe" in out
+    assert out.strip().splitlines()[-1] == "[]"
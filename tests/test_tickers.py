@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+if os.environ["DATABASE_URL"].startswith("sqlite"):
+    pytest.importorskip("aiosqlite")
+
+
+def _companies():
+    from sqlalchemy import select
+    from edgar_model_builder.db import SessionLocal
+    from edgar_model_builder.models import Company
+
+    with SessionLocal() as s:
+        return {c.cik: (c.ticker, c.name) for c in s.execute(select(Company)).scalars()}
+
+
+def test_sync_companies_diffs_and_swaps(db):
+    from edgar_model_builder.ingest import sync_companies
+    from edgar_model_builder.query import get_company_by_ticker
+
+    first = asyncio.run(sync_companies([(1, "aaa", "A"), (2, "BBB", "B"), (3, "CCC", "C"), (4, "DDD", "D")]))
+    assert (first.inserted, first.updated, first.unchanged) == (4, 0, 0)
+    assert get_company_by_ticker("AAA").cik == 1
+
+    # 1 and 2 swap tickers, 3 is renamed, 4 delists and its ticker goes to new CIK 5,
+    # and a second share class of 5 is ignored
+    res = asyncio.run(sync_companies([(1, "BBB", "A"), (2, "AAA", "B"), (3, "CCC", "C Inc"),
+                                      (5, "DDD", "E"), (5, "DDD-B", "E")]))
+    assert (res.inserted, res.updated, res.unchanged, res.parked) == (1, 3, 0, 1)
+    assert _companies() == {1: ("BBB", "A"), 2: ("AAA", "B"), 3: ("CCC", "C Inc"), 4: ("#4", "D"), 5: ("DDD", "E")}
+    # the index was invalidated by the sync, not left pointing at the old owners
+    assert get_company_by_ticker("AAA").cik == 2
+    assert get_company_by_ticker("DDD").cik == 5
+
+    again = asyncio.run(sync_companies([(1, "BBB", "A"), (2, "AAA", "B")]))
+    assert (again.inserted, again.updated, again.unchanged, again.parked) == (0, 0, 2, 0)
+
+
+def test_sync_companies_is_one_bulk_transaction(db):
+    from edgar_model_builder.ingest import sync_companies
+    from edgar_model_builder.metrics import metrics
+
+    rows = [(cik, f"T{cik}", f"Company {cik}") for cik in range(1, 10001)]
+    metrics.reset()
+    t0 = time.perf_counter()
+    asyncio.run(sync_companies(rows))
+    res = asyncio.run(sync_companies([(cik, t, f"{name} Inc" if cik % 10 == 0 else name) for cik, t, name in rows]))
+    assert (res.updated, res.unchanged) == (1000, 9000)
+    assert time.perf_counter() - t0 < 10
+    # a handful of statements per sync rather than one transaction per company
+    assert metrics.snapshot()["counters"]["sql_statements"] < 100
+    assert len(_companies()) == 10000
+
+
+def test_ticker_index_serves_repeat_lookups(db):
+    from edgar_model_builder.ingest import upsert_company
+    from edgar_model_builder.metrics import metrics
+    from edgar_model_builder.query import get_company_by_ticker, ticker_index
+
+    upsert_company(1, "AAA", "A")
+    upsert_company(2, "BBB", "B")
+    assert get_company_by_ticker("aaa").cik == 1
+    metrics.reset()
+    for _ in range(50):
+        assert get_company_by_ticker("BBB").cik == 2
+        assert get_company_by_ticker("ZZZ") is None
+    assert metrics.snapshot()["counters"].get("sql_statements", 0) == 0
+
+    ticker_index.refresh()
+    assert ticker_index.get_many(["AAA", "BBB", "ZZZ"]).keys() == {"AAA", "BBB"}
@@ -0,0 +1,38 @@
+import asyncio
+import io
+import json
+
+from conftest import companyfacts, fact
+
+
+class FakeClient:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    async def companyfacts_stream(self, cik):
+        self.calls.append(cik)
+        await asyncio.sleep(0)
+        if cik not in self.docs:
+            raise RuntimeError("404")
+        return io.BytesIO(json.dumps(self.docs[cik]).encode())
+
+
+def test_ingest_universe_reports_per_ticker(db):
+    from edgar_model_builder.ingest import upsert_company
+    from edgar_model_builder.universe import ingest_universe
+
+    upsert_company(1, "AAA", "A Corp")
+    upsert_company(2, "BBB", "B Corp")
+    upsert_company(3, "CCC", "C Corp")
+    doc = companyfacts({"us-gaap": {"Revenues": {"units": {"USD": [fact("2023-12-31", 1.0)]}}}})
+    client = FakeClient({1: doc, 2: doc})
+
+    results = asyncio.run(ingest_universe(client, ["AAA", "BBB", "CCC", "ZZZ"], concurrency=3, writers=2))
+
+    assert [r.ticker for r in results] == ["AAA", "BBB", "CCC", "ZZZ"]
+    assert [r.ok for r in results] == [True, True, False, False]
+    assert results[0].inserted == 1
+    assert "fetch failed" in results[2].error
+    assert "unknown ticker" in results[3].error
+    assert sorted(client.calls) == [1, 2, 3]
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import httpx
+import pytest
+
+from conftest import companyfacts, fact
+from test_pack import CountingProvider
+
+OLD, NEW, AMEND = "0000000001-24-000001", "0000000001-24-000002", "0000000001-24-000003"
+
+
+def _submissions(*filings):
+    accns, forms, dates = zip(*filings)
+    return {"filings": {"recent": {"accessionNumber": list(accns), "form": list(forms), "filingDate": list(dates),
+                                   "isXBRL": [1] * len(filings)}}}
+
+
+class Edgar:
+    # MockTransport handler with ETags, so polls revalidate the way data.sec.gov answers them
+    def __init__(self, docs):
+        self.docs = docs
+        self.requests = []
+
+    def __call__(self, request):
+        name = "/".join(request.url.path.split("/")[-2:])
+        body = json.dumps(self.docs[name]).encode()
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        status = 304 if request.headers.get("If-None-Match") == etag else 200
+        self.requests.append((name, status))
+        return httpx.Response(status, content=body if status == 200 else b"", headers={"ETag": etag})
+
+
+def test_periodic_filings():
+    from edgar_model_builder.watch import periodic_filings
+
+    doc = _submissions((OLD, "10-K", "2024-02-01"), ("x-1", "4", "2024-06-01"), (NEW, "10-Q", "2024-05-01"),
+                       ("x-2", "10-Q", "2024-07-01"))
+    doc["filings"]["recent"]["isXBRL"][3] = 0
+    assert periodic_filings(doc) == [(NEW, "2024-05-01"), (OLD, "2024-02-01")]
+    assert periodic_filings({}) == []
+
+
+def test_watch_queues_only_companies_with_new_filings(db, tmp_path, monkeypatch):
+    if os.environ["DATABASE_URL"].startswith("sqlite"):
+        pytest.importorskip("aiosqlite")
+    from edgar_model_builder.http_cache import ResponseCache
+    from edgar_model_builder.ingest import ingest_companyfacts, upsert_company
+    from edgar_model_builder.jobs import InMemoryQueue, pipeline_handlers, run_worker
+    from edgar_model_builder.sec_client import SecClient
+    from edgar_model_builder.settings import settings
+    from edgar_model_builder.watch import watch
+
+    rev = {"Revenues": {"units": {"USD": [fact("2023-12-31", 100.0, accn=OLD)]}}}
+    for cik, t in ((1, "AAA"), (2, "BBB"), (3, "CCC")):
+        upsert_company(cik, t, f"{t} Corp")
+        ingest_companyfacts(cik, companyfacts({"us-gaap": rev}))
+    q2 = fact("2024-03-31", 30.0, filed="2024-05-01", form="10-Q", accn=NEW, start="2024-01-01", fy=2024, fp="Q1")
+    edgar = Edgar({
+        # AAA filed a 10-Q; BBB only a Form 4; CCC nothing
+        "submissions/CIK0000000001.json": _submissions((NEW, "10-Q", "2024-05-01"), (OLD, "10-K", "2024-02-01")),
+        "submissions/CIK0000000002.json": _submissions(("x-1", "4", "2024-06-01"), (OLD, "10-K", "2024-02-01")),
+        "submissions/CIK0000000003.json": _submissions((OLD, "10-K", "2024-02-01")),
+        "companyfacts/CIK0000000001.json": companyfacts({"us-gaap": rev}),
+    })
+    queue = InMemoryQueue()
+    targets, peers = ["AAA", "BBB", "CCC"], {"AAA": ["BBB"], "BBB": ["CCC"], "CCC": []}
+    mapping = "config/mappings/us_gaap.yml"
+
+    async def run(cycles):
+        c = SecClient(cache=ResponseCache(tmp_path / "sec", 10_000_000), transport=httpx.MockTransport(edgar))
+        try:
+            return await watch(c, queue, targets, peers, mapping, interval=0, cycles=cycles)
+        finally:
+            await c.aclose()
+
+    async def work():
+        c = SecClient(cache=ResponseCache(tmp_path / "sec", 10_000_000), transport=httpx.MockTransport(edgar))
+        try:
+            return await run_worker(queue, pipeline_handlers(c, CountingProvider(), wait=0.01), concurrency=2,
+                                    poll=0.01, until_idle=True, backoff=0)
+        finally:
+            await c.aclose()
+
+    res = asyncio.run(run(2))
+    assert res.new == {"AAA": NEW}
+    # one ingest (AAA) and the one pack that includes it; the second poll queued nothing again
+    assert sorted((j.kind, j.payload["ticker"]) for j in queue.jobs()) == [("ingest", "AAA"), ("render", "AAA")]
+    assert res.queued == 0
+    # CCC and BBB were marked seen on the first poll and revalidated to 304 on the second
+    assert res.unchanged == 2
+    assert edgar.requests.count(("submissions/CIK0000000003.json", 304)) == 1
+
+    # the XBRL API has not caught up with the filing yet: the ingest fails until it gives up, taking
+    # the render with it, which frees both keys, and the next poll queues them again
+    counts = asyncio.run(work())
+    assert counts["dead"] == 2
+    assert asyncio.run(run(1)).queued == 2
+
+    edgar.docs["companyfacts/CIK0000000001.json"] = companyfacts({"us-gaap": {
+        "Revenues": {"units": {"USD": rev["Revenues"]["units"]["USD"] + [q2]}}}})
+    counts = asyncio.run(work())
+    assert counts["dead"] == 0 and counts["done"] == 3  # ingest, normalize, render
+    # the filing is in facts now, so AAA is quiet again
+    res = asyncio.run(run(1))
+    assert res.new == {} and res.queued == 0
+
+    # an amendment whose only fact is outside the mapping never reaches facts under SLIM_INGEST=1;
+    # once its ingest is done it counts as handled, and AAA is marked seen again
+    monkeypatch.setattr(settings, "slim_ingest", True)
+    edgar.docs["submissions/CIK0000000001.json"] = _submissions(
+        (AMEND, "10-K/A", "2024-06-01"), (NEW, "10-Q", "2024-05-01"), (OLD, "10-K", "2024-02-01"))
+    edgar.docs["companyfacts/CIK0000000001.json"]["facts"]["dei"] = {"EntityCommonStockSharesOutstanding": {
+        "units": {"shares": [fact("2024-05-31", 1e6, filed="2024-06-01", form="10-K/A", accn=AMEND)]}}}
+    res = asyncio.run(run(1))
+    assert res.new == {"AAA": AMEND} and res.queued == 2
+    counts = asyncio.run(work())
+    assert counts["dead"] == 0 and counts["done"] == 2  # ingest, render; the watermark did not move
+    res = asyncio.run(run(2))
+    assert res.new == {} and res.queued == 0
+    assert res.unchanged == 3